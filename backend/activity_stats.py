@@ -0,0 +1,256 @@
+"""
+Activity analytics for NLP Assistant API
+Every answered question is counted into time-bucketed rollups (per minute, per
+hour and all time): requests, cache hits, refusals, and log-scale latency
+sketches for retrieval and generation. Counts are aggregated in memory and
+added to the activity_rollups collection with one upsert per bucket every
+ACTIVITY_ROLLUP_FLUSH_SECONDS, so /api/stats reads at most 85 small documents
+however much traffic has been served.
+
+Only a sample of requests (ACTIVITY_SAMPLE_RATE) is also kept as a raw event
+in activity_log, in compact form: chunk ids instead of chunk text, the
+answer's length instead of its text, and an expiry for the TTL index.
+"""
+import atexit
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo.errors import BulkWriteError
+
+import config
+
+# Sketch buckets grow by GAMMA, so a quantile is within ~5% of the true value
+GAMMA = 1.1
+_LOG_GAMMA = math.log(GAMMA)
+QUANTILES = (50, 95, 99)
+SKETCHES = ("retrieval", "generation")
+
+# Granularity -> (bucket length, retention); all-time totals never expire
+GRANULARITIES = {
+    "minute": (timedelta(minutes=1), timedelta(days=2)),
+    "hour": (timedelta(hours=1), timedelta(days=90)),
+}
+STATS_MINUTES = 60
+STATS_HOURS = 24
+TOTAL_ID = "total"
+
+
+def sketch_bucket(ms):
+    """Index of the log-scale bucket holding a latency (latencies under 1ms share bucket 0)"""
+    return max(0, int(math.log(max(ms, 1.0)) / _LOG_GAMMA))
+
+
+def sketch_quantiles(buckets, quantiles=QUANTILES):
+    """Approximate quantiles (ms) from {bucket index: count}"""
+    counts = sorted((int(b), n) for b, n in buckets.items() if n)
+    total = sum(n for _, n in counts)
+    result = {}
+    for q in quantiles:
+        if not total:
+            result[f"p{q}_ms"] = None
+            continue
+        rank, seen = q / 100 * total, 0
+        for bucket, n in counts:
+            seen += n
+            if seen >= rank:
+                break
+        # Midpoint of the bucket [GAMMA^b, GAMMA^(b+1))
+        result[f"p{q}_ms"] = round(GAMMA ** bucket * (1 + GAMMA) / 2, 2)
+    return result
+
+
+def bucket_start(moment, granularity):
+    if granularity == "minute":
+        return moment.replace(second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_id(start, granularity):
+    return f"{granularity}:{start:%Y%m%d%H%M}"
+
+
+def stats_ids(now=None):
+    """Rollup ids read by /api/stats: the last hour of minutes and the last day of hours"""
+    now = now or datetime.utcnow()
+    minute = bucket_start(now, "minute")
+    hour = bucket_start(now, "hour")
+    return (
+        [bucket_id(minute - timedelta(minutes=i), "minute") for i in range(STATS_MINUTES)],
+        [bucket_id(hour - timedelta(hours=i), "hour") for i in range(STATS_HOURS)],
+    )
+
+
+def should_sample():
+    return random.random() < config.ACTIVITY_SAMPLE_RATE
+
+
+def compact_event(question, answer, confidence_score, source_ids, was_cached,
+                  retrieval_time, generation_time, chat_id, scores):
+    """Raw activity_log document without answer or chunk text (sources are chunk ids)"""
+    now = datetime.utcnow()
+    scores = scores.tolist() if hasattr(scores, 'tolist') else scores
+    return {
+        "question": question,
+        "answer_chars": len(answer or ""),
+        "confidence_score": confidence_score,
+        "source_ids": list(source_ids or []),
+        "was_cached": was_cached,
+        "retrieval_time": retrieval_time,
+        "generation_time": generation_time,
+        "chat_id": chat_id,
+        "scores": [round(float(score), 4) for score in scores or []],
+        "timestamp": now,
+        "expires_at": now + timedelta(days=config.ACTIVITY_LOG_TTL_DAYS)
+    }
+
+
+def _empty_window():
+    return {"requests": 0, "cached": 0, "refused": 0,
+            **{name: {"count": 0, "sum_ms": 0.0, "buckets": {}} for name in SKETCHES}}
+
+
+def _merge(window, doc):
+    for field in ("requests", "cached", "refused"):
+        window[field] += doc.get(field, 0)
+    for name in SKETCHES:
+        sketch = doc.get(name) or {}
+        window[name]["count"] += sketch.get("count", 0)
+        window[name]["sum_ms"] += sketch.get("sum_ms", 0.0)
+        for bucket, n in (sketch.get("buckets") or {}).items():
+            window[name]["buckets"][bucket] = window[name]["buckets"].get(bucket, 0) + n
+
+
+def summarize(docs):
+    """Counts, ratios and latency quantiles over a set of rollup documents"""
+    window = _empty_window()
+    for doc in docs:
+        _merge(window, doc)
+    requests = window["requests"]
+    summary = {
+        "requests": requests,
+        "cache_hits": window["cached"],
+        "refusals": window["refused"],
+        "cache_hit_ratio": window["cached"] / requests if requests else 0.0,
+        "refusal_rate": window["refused"] / requests if requests else 0.0,
+    }
+    for name in SKETCHES:
+        sketch = window[name]
+        summary[f"{name}_latency"] = dict(
+            mean_ms=round(sketch["sum_ms"] / sketch["count"], 2) if sketch["count"] else None,
+            **sketch_quantiles(sketch["buckets"])
+        )
+    return summary
+
+
+def stats_response(minute_docs, hour_docs, total_doc):
+    """The /api/stats body from the rollups named by stats_ids()"""
+    return {
+        "last_hour": summarize(minute_docs),
+        "last_24_hours": summarize(hour_docs),
+        "all_time": summarize([total_doc] if total_doc else []),
+        "per_minute": [
+            {
+                "start": doc["start"].isoformat(),
+                "requests": doc.get("requests", 0),
+                "cache_hits": doc.get("cached", 0),
+                "refusals": doc.get("refused", 0),
+            }
+            for doc in sorted(minute_docs, key=lambda doc: doc["start"])
+        ],
+        "flush_interval_seconds": config.ACTIVITY_ROLLUP_FLUSH_SECONDS,
+    }
+
+
+class RollupAggregator:
+    """
+    In-memory increments for the rollup documents, flushed with one upsert per
+    bucket from a background thread (and at exit).
+    """
+
+    def __init__(self, interval=10):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}      # rollup id -> (granularity, start, increments)
+        self._started = False
+
+    def record(self, was_cached, refused, retrieval_time=0, generation_time=0):
+        self.start()
+        now = datetime.utcnow()
+        increments = {"requests": 1, "cached": int(bool(was_cached)), "refused": int(bool(refused))}
+        for name, seconds in (("retrieval", retrieval_time), ("generation", generation_time)):
+            if seconds and seconds > 0:
+                ms = seconds * 1000
+                increments[f"{name}.count"] = 1
+                increments[f"{name}.sum_ms"] = ms
+                increments[f"{name}.buckets.{sketch_bucket(ms)}"] = 1
+
+        targets = [(TOTAL_ID, "total", None)]
+        for granularity in GRANULARITIES:
+            start = bucket_start(now, granularity)
+            targets.append((bucket_id(start, granularity), granularity, start))
+        with self._lock:
+            for rollup_id, granularity, start in targets:
+                self._merge(rollup_id, granularity, start, increments)
+
+    def _merge(self, rollup_id, granularity, start, increments):
+        pending = self._pending.setdefault(rollup_id, (granularity, start, {}))[2]
+        for field, amount in increments.items():
+            pending[field] = pending.get(field, 0) + amount
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending):
+        """Put drained increments back (after a failed flush), adding to those recorded since"""
+        with self._lock:
+            for rollup_id, (granularity, start, increments) in pending.items():
+                self._merge(rollup_id, granularity, start, increments)
+
+    def start(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, name="activity-rollups", daemon=True).start()
+        atexit.register(self.flush)
+
+    def flush(self):
+        from models import ActivityRollup
+        pending = self.drain()
+        if not pending:
+            return
+        try:
+            ActivityRollup.increment_many(pending)
+        except BulkWriteError as e:
+            # Unordered upserts: only those in writeErrors were not applied
+            rollup_ids = list(pending)
+            failed = {rollup_ids[error["index"]] for error in e.details.get("writeErrors", [])}
+            self.restore({rollup_id: pending[rollup_id] for rollup_id in failed})
+            print(f"Error flushing activity rollups ({len(failed)} kept for the next flush): {e}")
+        except Exception as e:
+            # Kept for the next flush; an unreachable MongoDB must not lose the counts
+            self.restore(pending)
+            print(f"Error flushing activity rollups (kept for the next flush): {e}")
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+def expiry(granularity, start):
+    """When a rollup document of this granularity may be deleted (None = never)"""
+    if granularity not in GRANULARITIES:
+        return None
+    length, retention = GRANULARITIES[granularity]
+    return start + length + retention
+
+
+rollups = RollupAggregator(interval=config.ACTIVITY_ROLLUP_FLUSH_SECONDS)
@@ -1,25 +1,32 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from functools import wraps
 import sys
 import os
+import threading
 import time
+import traceback
 
 # Add the backend directory to the path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import config
-from models import Chat, Message, ActivityLog
-from cache_manager import check_cache, save_to_cache, apply_refusal
-from security import validate_api_key, validate_question, validate_chat_title, sanitize_input
+import metrics
+import pipeline
+import shared_state
+from models import write_behind, ensure_indexes
+from cache_manager import hot_cache, warm_caches
+from security import validate_api_key
+from model_loader import load_models, start_background_loading, models_status
+from steps import run
 
-# Import RAG modules (DO NOT MODIFY THESE FILES)
-from rag.retrieve import retrieve
-from rag.generate import generate
+# Import RAG modules (models inside them load on first use or via model_loader)
+from rag.generate import generate_stream, scheduler
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for React frontend
+CORS(app, expose_headers=["X-Next-Cursor"])  # Enable CORS for React frontend
 
 # Initialize rate limiter
 if config.RATE_LIMIT_ENABLED:
@@ -27,174 +34,238 @@ if config.RATE_LIMIT_ENABLED:
         app=app,
         key_func=get_remote_address,
         default_limits=[config.RATE_LIMIT_GLOBAL],
-        storage_uri="memory://"
+        # Counters shared by every worker (see shared_state.py)
+        storage_uri=shared_state.limits_storage_uri(),
+        # An unreachable store lets requests through rather than failing them
+        swallow_errors=True
     )
 else:
     limiter = None
 
-# Initialize models at startup (loaded once, never reloaded)
+metrics.register(metrics.Gauge(
+    "nlpassist_write_queue_depth", "Writes waiting in the write-behind queue",
+    lambda: write_behind.depth if write_behind else 0
+))
+metrics.register(metrics.Gauge(
+    "nlpassist_failed_writes", "Write-behind writes given up on after retries",
+    lambda: write_behind.failed if write_behind else 0
+))
+metrics.register(metrics.Gauge(
+    "nlpassist_generation_queue_depth", "Prompts waiting for a generation batch",
+    lambda: scheduler.queue_depth
+))
+metrics.register(metrics.Gauge(
+    "nlpassist_hot_cache_entries", "Entries in the hot cache", lambda: len(hot_cache)
+))
+
+
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    metrics.start_request()
+
+
+@app.after_request
+def add_server_timing(response):
+    """Record request latency and expose the per-stage breakdown in Server-Timing"""
+    if not config.METRICS_ENABLED or "request_start" not in g:
+        return response
+    # Streamed responses are still being produced; their timings go in the "done" event
+    if response.is_streamed:
+        return response
+    total = time.perf_counter() - g.request_start
+    metrics.REQUEST_SECONDS.observe(total, endpoint=request.endpoint or "unknown",
+                                    outcome=f"{response.status_code // 100}xx")
+    breakdown = metrics.request_breakdown()
+    breakdown["total"] = total
+    response.headers["Server-Timing"] = metrics.server_timing_header(breakdown)
+    # Lets the React dev server (another origin) show the breakdown in devtools
+    response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
+# Initialize models at startup (the index and chunk store hot-swap after ingestion)
 print("=" * 50)
 print("🚀 Starting NLP Assistant Backend")
 print("=" * 50)
-print("✅ Loading FAISS index and sentence transformer...")
-print("✅ Loading FLAN-T5 model...")
-print("✅ Models loaded successfully!")
+if config.MODEL_LOADING in ("eager", "preload"):
+    print("✅ Loading FAISS index, sentence transformer and FLAN-T5 model...")
+    print(f"✅ Models loaded successfully in {load_models():.1f}s!")
+    if config.MODEL_LOADING == "eager":
+        warm_caches()
+elif config.MODEL_LOADING == "background":
+    print("⏳ Loading models in the background (see /api/ready)...")
+    start_background_loading(then=warm_caches)
+else:
+    print("💤 Models load on first use")
+if config.MONGO_CREATE_INDEXES and config.MODEL_LOADING != "preload":
+    # In the background so startup never waits on MongoDB; in preload mode each
+    # worker does this after the fork (see gunicorn.conf.py)
+    threading.Thread(target=ensure_indexes, name="mongo-indexes", daemon=True).start()
 if config.RATE_LIMIT_ENABLED:
     print("🔒 Rate limiting enabled")
 if config.REQUIRE_API_KEY:
     print("🔑 API key authentication required")
+if write_behind:
+    print("📝 Write-behind persistence enabled")
 print("=" * 50)
 
 
+def respond(steps):
+    """Run a request pipeline (see pipeline.py) and return its reply as JSON"""
+    try:
+        body, status, headers = run(steps)
+    except Exception as e:
+        print(f"Error in {request.endpoint}: {e}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+    return jsonify(body), status, headers
+
+
+def require_models(f):
+    """
+    Decorator for endpoints that need the models.
+    While models are still loading in the background, return 503 with Retry-After
+    instead of holding the request.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        loading = pipeline.models_loading()
+        if loading:
+            body, status, headers = loading
+            return jsonify(body), status, headers
+        return f(*args, **kwargs)
+    
+    return decorated_function
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "ok", "message": "NLP Assistant API is running"})
+    return jsonify(pipeline.health(
+        write_behind.depth if write_behind else 0, write_behind.failed if write_behind else 0
+    ))
+
+
+@app.route('/api/metrics', methods=['GET'])
+@limiter.exempt if config.RATE_LIMIT_ENABLED else lambda f: f
+def metrics_endpoint():
+    """Per-stage latency histograms and counters in the Prometheus text format"""
+    if not config.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/api/stats', methods=['GET'])
+@limiter.limit(config.RATE_LIMIT_CHAT) if config.RATE_LIMIT_ENABLED else lambda f: f
+@validate_api_key
+def stats():
+    """Request counts, cache hit ratio, refusal rate and latency quantiles from the activity rollups"""
+    return respond(pipeline.activity_stats())
+
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness endpoint: 200 once the models are loaded, 503 before"""
+    status = models_status()
+    return jsonify(status), (200 if status["ready"] else 503)
 
 
 @app.route('/api/ask', methods=['POST'])
 @limiter.limit(config.RATE_LIMIT_ASK) if config.RATE_LIMIT_ENABLED else lambda f: f
 @validate_api_key
+@require_models
 def ask_question():
     """
     Main endpoint to ask a question.
     Checks cache first, then runs RAG pipeline if not cached.
     """
+    return respond(pipeline.ask_question(request.json or {}))
+
+
+@app.route('/api/ask/stream', methods=['POST'])
+@limiter.limit(config.RATE_LIMIT_ASK) if config.RATE_LIMIT_ENABLED else lambda f: f
+@validate_api_key
+@require_models
+def ask_question_stream():
+    """
+    Streaming variant of /api/ask over Server-Sent Events.
+    Events: "sources" (retrieved chunk ids, sent before generation starts),
+    "token" (answer text as it is decoded), "done" (final answer and the same
+    metadata /api/ask returns, plus time_to_first_token and total_time) and
+    "error". The "done" answer is authoritative.
+    """
     try:
-        data = request.json
-        question = data.get('question', '').strip()
-        chat_id = data.get('chat_id')
-        
-        # Validate and sanitize question
-        is_valid, sanitized_question, error_msg = validate_question(question)
-        if not is_valid:
-            return jsonify({"error": error_msg}), 400
-        
-        question = sanitized_question
-        
-        # Check cache first
-        cached_result = check_cache(question)
-        
-        if cached_result:
-            # Return cached answer
-            answer = cached_result['answer']
-            sources = cached_result['sources']
-            confidence = cached_result['confidence']
-            scores = cached_result.get('scores', [])
-            
-            # Save user message
-            if chat_id:
-                Message.create(chat_id, "user", question)
-                Message.create(chat_id, "assistant", answer, {
-                    "cached": True,
-                    "confidence": confidence,
-                    "sources": sources
-                })
-                Chat.update_timestamp(chat_id)
-            
-            # Log activity
-            ActivityLog.log(
-                question=question,
-                answer=answer,
-                confidence_score=confidence,
-                sources=sources,
-                was_cached=True,
-                chat_id=chat_id,
-                scores=scores
-            )
-            
-            return jsonify({
-                "answer": answer,
-                "sources": sources,
-                "confidence": confidence,
-                "cached": True,
-                "scores": scores
-            })
-        
-        # Not in cache - run RAG pipeline
-        # Step 1: Retrieve relevant documents (THINKING phase)
-        retrieval_start = time.time()
-        sources, scores = retrieve(question, top_k=config.TOP_K)
-        retrieval_time = time.time() - retrieval_start
-        
-        # Step 2: Apply refusal logic based on confidence
-        generation_start = time.time()
-        
-        # Check if we should refuse to answer
-        min_score = min(scores) if len(scores) > 0 else float('inf')
-        
-        if min_score >= config.CONFIDENCE_THRESHOLD:
-            # Low confidence - apply refusal
-            answer, sources, confidence = apply_refusal("", sources, scores)
-            generation_time = time.time() - generation_start
-        else:
-            # High confidence - generate answer (GENERATING phase)
-            answer = generate(question, sources)
-            generation_time = time.time() - generation_start
-            
-            # Check if generation returned a refusal (despite high retrieval confidence)
-            is_refusal = "I am not confident enough to answer" in answer
-            confidence = "Low" if is_refusal else "High"
-            
-            # Only save to cache if it's not a refusal
-            if not is_refusal:
-                save_to_cache(question, answer, confidence, sources, scores)
-        
-        # Save messages to chat
-        if chat_id:
-            Message.create(chat_id, "user", question)
-            Message.create(chat_id, "assistant", answer, {
-                "cached": False,
-                "confidence": confidence,
-                "sources": sources,
-                "retrieval_time": retrieval_time,
-                "generation_time": generation_time
-            })
-            Chat.update_timestamp(chat_id)
-        
-        # Log activity
-        ActivityLog.log(
-            question=question,
-            answer=answer,
-            confidence_score=confidence,
-            sources=sources,
-            was_cached=False,
-            retrieval_time=retrieval_time,
-            generation_time=generation_time,
-            chat_id=chat_id,
-            scores=scores
-        )
-        
-        return jsonify({
-            "answer": answer,
-            "sources": sources,
-            "confidence": confidence,
-            "cached": False,
-            "retrieval_time": retrieval_time,
-            "generation_time": generation_time,
-            "scores": scores.tolist() if hasattr(scores, 'tolist') else scores
-        })
-        
+        ask, error = run(pipeline.start_stream(request.json or {}))
     except Exception as e:
-        print(f"Error in ask_question: {e}")
-        import traceback
+        print(f"Error in ask_question_stream: {e}")
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
+    if error:
+        body, status, headers = error
+        return jsonify(body), status, headers
+    
+    def finish(outcome):
+        """Stage timings for the "done" event (the headers left before the work was done)"""
+        total = time.perf_counter() - g.request_start
+        metrics.REQUEST_SECONDS.observe(total, endpoint=request.endpoint, outcome=outcome)
+        return {stage: seconds * 1000 for stage, seconds in metrics.request_breakdown().items()}
+    
+    def events():
+        try:
+            yield from pipeline.opening_events(ask)
+            answer = None
+            if ask.generating:
+                answer = ""
+                for kind, text in generate_stream(ask.query, ask.sources, ask.scores, ask.decoding):
+                    if kind == "token":
+                        yield pipeline.token_event(ask, text)
+                    else:
+                        answer = text
+            done = run(pipeline.finish_stream(ask, answer))
+            yield pipeline.sse_event("done", dict(done, timings_ms=finish("2xx")))
+        except Exception as e:
+            print(f"Error in ask_question_stream: {e}")
+            traceback.print_exc()
+            finish("5xx")
+            yield pipeline.sse_event("error", {"error": str(e)})
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route('/api/ask_batch', methods=['POST'])
+@limiter.limit(config.RATE_LIMIT_BATCH) if config.RATE_LIMIT_ENABLED else lambda f: f
+@validate_api_key
+@require_models
+def ask_batch():
+    """
+    Answer many questions in one request (offline evaluation, FAQ pre-warming).
+    Checks the cache for all questions in bulk, retrieves for the misses with one
+    embedding call and one FAISS search, and generates only for confident misses.
+    """
+    return respond(pipeline.ask_batch(request.json or {}))
+
+
+@app.route('/api/chunks', methods=['GET'])
+@limiter.limit(config.RATE_LIMIT_CHAT) if config.RATE_LIMIT_ENABLED else lambda f: f
+@validate_api_key
+@require_models
+def get_chunk_texts():
+    """Source texts by chunk id (?ids=3,17,42), as {"chunks": {id: text}} (see pipeline.chunk_texts)"""
+    body, status, headers = pipeline.chunk_texts(request.args.get('ids', ''), request.if_none_match)
+    return Response(body, status=status, mimetype='application/json', headers=headers)
 
 
 @app.route('/api/chats', methods=['GET'])
 @limiter.limit(config.RATE_LIMIT_CHAT) if config.RATE_LIMIT_ENABLED else lambda f: f
 @validate_api_key
 def get_chats():
-    """Get all chat sessions"""
-    try:
-        chats = Chat.get_all()
-        # Convert ObjectId to string for JSON serialization
-        for chat in chats:
-            chat['_id'] = str(chat['_id'])
-        return jsonify(chats)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    """Get chat sessions, most recent first, one page at a time (?limit=&cursor=)"""
+    return respond(pipeline.list_chats(request.args))
 
 
 @app.route('/api/chats/new', methods=['POST'])
@@ -202,33 +273,15 @@ def get_chats():
 @validate_api_key
 def create_new_chat():
     """Create a new chat session"""
-    try:
-        data = request.json or {}
-        title = data.get('title', 'New Chat')
-        
-        # Sanitize title
-        title = sanitize_input(title, max_length=config.MAX_TITLE_LENGTH)
-        
-        chat = Chat.create(title)
-        chat['_id'] = str(chat['_id'])
-        return jsonify(chat)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return respond(pipeline.create_chat(request.json or {}))
 
 
 @app.route('/api/chats/<chat_id>', methods=['GET'])
 @limiter.limit(config.RATE_LIMIT_CHAT) if config.RATE_LIMIT_ENABLED else lambda f: f
 @validate_api_key
 def get_chat_messages(chat_id):
-    """Get all messages for a specific chat"""
-    try:
-        messages = Message.get_by_chat(chat_id)
-        # Convert ObjectId to string
-        for msg in messages:
-            msg['_id'] = str(msg['_id'])
-        return jsonify(messages)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    """Get the latest messages of a chat, oldest first (?limit=&cursor=&include=sources)"""
+    return respond(pipeline.chat_messages(chat_id, request.args))
 
 
 @app.route('/api/chats/<chat_id>', methods=['DELETE'])
@@ -236,11 +289,7 @@ def get_chat_messages(chat_id):
 @validate_api_key
 def delete_chat(chat_id):
     """Delete a chat session and all its messages"""
-    try:
-        Chat.delete(chat_id)
-        return jsonify({"message": "Chat deleted successfully"})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return respond(pipeline.delete_chat(chat_id))
 
 
 @app.route('/api/chats/<chat_id>/title', methods=['PUT'])
@@ -248,19 +297,7 @@ def delete_chat(chat_id):
 @validate_api_key
 def update_chat_title(chat_id):
     """Update a chat's title"""
-    try:
-        data = request.json
-        new_title = data.get('title', '').strip()
-        
-        # Validate and sanitize title
-        is_valid, sanitized_title, error_msg = validate_chat_title(new_title)
-        if not is_valid:
-            return jsonify({"error": error_msg}), 400
-        
-        Chat.update_title(chat_id, sanitized_title)
-        return jsonify({"message": "Title updated successfully", "title": sanitized_title})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return respond(pipeline.rename_chat(chat_id, request.json or {}))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,379 @@
+"""
+Async (ASGI) serving mode for NLP Assistant API
+The same routes as app.py on Quart's event loop, running the same request
+pipelines (pipeline.py): MongoDB goes through the asyncio driver
+(models_async.py), and embedding and generation run on bounded inference pools
+(inference_pool.py), so a slow FLAN-T5 generation never holds up chat
+endpoints or cache hits. When a pool is full the request gets 503 with
+Retry-After instead of waiting in an unbounded queue.
+
+Usage: cd backend && uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import os
+import sys
+import time
+import traceback
+from functools import wraps
+
+from limits import parse_many
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+from quart import Quart, Response, g, jsonify, request, stream_with_context
+from quart_cors import cors
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+import metrics
+import models_async
+import pipeline
+import shared_state
+from cache_manager import warm_caches
+from security import api_key_error
+from model_loader import load_models, start_background_loading, models_status
+from inference_pool import InferencePool, PoolSaturated
+from steps import AsyncRunner
+
+# Import RAG modules (models inside them load on first use or via model_loader)
+from rag.generate import generate_stream
+
+app = cors(Quart(__name__), expose_headers=["X-Next-Cursor"])  # Enable CORS for React frontend
+# CPU generation can outlast Quart's default 60s response timeout
+app.config["RESPONSE_TIMEOUT"] = None
+
+embedding_pool = InferencePool(
+    "embedding", max_workers=config.EMBEDDING_POOL_WORKERS, max_queue=config.EMBEDDING_POOL_QUEUE
+)
+generation_pool = InferencePool(
+    "generation", max_workers=config.GENERATION_POOL_WORKERS, max_queue=config.GENERATION_POOL_QUEUE
+)
+
+for _pool in (embedding_pool, generation_pool):
+    metrics.register(metrics.Gauge(
+        f"nlpassist_{_pool.name}_pool_in_flight", f"Calls running or waiting in the {_pool.name} pool",
+        lambda pool=_pool: pool.stats()["in_flight"]
+    ))
+metrics.register(metrics.Gauge(
+    "nlpassist_failed_writes", "Deferred writes given up on after retries", lambda: models_async.failed_writes
+))
+
+# Request pipelines (pipeline.py) with MongoDB awaited and model work on the pools
+run = AsyncRunner(models_async, embedding_pool, generation_pool)
+
+
+# Rate limiting with the same limit strings, library and shared counters as
+# flask-limiter: RATE_LIMIT_GLOBAL for every route without a limit of its own
+_rate_limiter = FixedWindowRateLimiter(storage_from_string(shared_state.limits_storage_uri()))
+_default_limits = parse_many(config.RATE_LIMIT_GLOBAL)
+_route_limits = {}      # endpoint -> limits (an empty list for exempt routes)
+
+
+def _hit(limit, *identifiers):
+    try:
+        return _rate_limiter.hit(limit, *identifiers)
+    except Exception as e:
+        # Like flask-limiter's swallow_errors: an unreachable store never fails requests
+        print(f"⚠️ Rate limit check failed: {e}")
+        return True
+
+
+def rate_limit(limit_string):
+    """Give a route its own limits instead of RATE_LIMIT_GLOBAL"""
+    def decorator(f):
+        _route_limits[f.__name__] = parse_many(limit_string)
+        return f
+
+    return decorator
+
+
+def rate_limit_exempt(f):
+    _route_limits[f.__name__] = []
+    return f
+
+
+@app.before_request
+async def check_rate_limit():
+    if not config.RATE_LIMIT_ENABLED or request.endpoint is None:
+        return None
+    key = request.remote_addr or "unknown"
+    for limit in _route_limits.get(request.endpoint, _default_limits):
+        if not _hit(limit, key, request.endpoint):
+            reset, _ = _rate_limiter.get_window_stats(limit, key, request.endpoint)
+            response = jsonify({"error": f"Rate limit exceeded: {limit}"})
+            response.headers["Retry-After"] = str(max(1, int(reset - time.time())))
+            return response, 429
+    return None
+
+
+def validate_api_key(f):
+    """Async counterpart of security.validate_api_key"""
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        error = api_key_error(request.headers.get('X-API-Key'))
+        if error:
+            return jsonify(error), 401
+        return await f(*args, **kwargs)
+
+    return decorated_function
+
+
+def require_models(f):
+    """Return 503 with Retry-After while models are still loading in the background"""
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        loading = pipeline.models_loading()
+        if loading:
+            body, status, headers = loading
+            return jsonify(body), status, headers
+        return await f(*args, **kwargs)
+
+    return decorated_function
+
+
+async def respond(steps):
+    """Run a request pipeline (see pipeline.py) and return its reply as JSON"""
+    try:
+        body, status, headers = await run(steps)
+    except PoolSaturated:
+        raise
+    except Exception as e:
+        print(f"Error in {request.endpoint}: {e}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+    return jsonify(body), status, headers
+
+
+@app.errorhandler(PoolSaturated)
+async def pool_saturated(e):
+    response = jsonify({"error": "Server is busy, please retry shortly", "pool": e.pool})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
+
+
+@app.before_serving
+async def startup():
+    print("=" * 50)
+    print("🚀 Starting NLP Assistant Backend (async)")
+    print("=" * 50)
+    if config.MODEL_LOADING in ("eager", "preload"):
+        print("✅ Loading FAISS index, sentence transformer and FLAN-T5 model...")
+        load_time = await asyncio.get_running_loop().run_in_executor(None, load_models)
+        print(f"✅ Models loaded successfully in {load_time:.1f}s!")
+        await asyncio.get_running_loop().run_in_executor(None, warm_caches)
+    elif config.MODEL_LOADING == "background":
+        print("⏳ Loading models in the background (see /api/ready)...")
+        start_background_loading(then=warm_caches)
+    else:
+        print("💤 Models load on first use")
+    if config.MONGO_CREATE_INDEXES:
+        app.add_background_task(models_async.ensure_indexes)
+    print(f"🧵 Inference pools: embedding {embedding_pool.max_workers}+{embedding_pool.max_queue}, "
+          f"generation {generation_pool.max_workers}+{generation_pool.max_queue} (workers+queue)")
+    print("=" * 50)
+
+
+@app.after_serving
+async def shutdown():
+    await models_async.wait_until_flushed()
+    embedding_pool.shutdown()
+    generation_pool.shutdown()
+
+
+@app.before_request
+async def start_request_timing():
+    g.request_start = time.perf_counter()
+    g.streaming = False
+    metrics.start_request()
+
+
+@app.after_request
+async def add_server_timing(response):
+    """Record request latency and expose the per-stage breakdown in Server-Timing"""
+    if not config.METRICS_ENABLED or "request_start" not in g or g.streaming:
+        return response
+    total = time.perf_counter() - g.request_start
+    metrics.REQUEST_SECONDS.observe(total, endpoint=request.endpoint or "unknown",
+                                    outcome=f"{response.status_code // 100}xx")
+    breakdown = metrics.request_breakdown()
+    breakdown["total"] = total
+    response.headers["Server-Timing"] = metrics.server_timing_header(breakdown)
+    response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    return jsonify(dict(
+        pipeline.health(models_async.pending_writes(), models_async.failed_writes),
+        inference_pools={
+            "embedding": embedding_pool.stats(),
+            "generation": generation_pool.stats()
+        }
+    ))
+
+
+@app.route('/api/metrics', methods=['GET'])
+@rate_limit_exempt
+async def metrics_endpoint():
+    """Per-stage latency histograms and counters in the Prometheus text format"""
+    if not config.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/api/stats', methods=['GET'])
+@rate_limit(config.RATE_LIMIT_CHAT)
+@validate_api_key
+async def stats():
+    """Request counts, cache hit ratio, refusal rate and latency quantiles from the activity rollups"""
+    return await respond(pipeline.activity_stats())
+
+
+@app.route('/api/ready', methods=['GET'])
+async def readiness_check():
+    """Readiness endpoint: 200 once the models are loaded, 503 before"""
+    status = models_status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+
+@app.route('/api/ask', methods=['POST'])
+@rate_limit(config.RATE_LIMIT_ASK)
+@validate_api_key
+@require_models
+async def ask_question():
+    """
+    Main endpoint to ask a question.
+    Checks cache first, then runs RAG pipeline if not cached.
+    """
+    return await respond(pipeline.ask_question(await request.get_json() or {}))
+
+
+@app.route('/api/ask/stream', methods=['POST'])
+@rate_limit(config.RATE_LIMIT_ASK)
+@validate_api_key
+@require_models
+async def ask_question_stream():
+    """
+    Streaming variant of /api/ask over Server-Sent Events (same events as app.py).
+    Cache lookup, retrieval and admission to the generation pool happen before
+    the response starts, so a saturated pool still gets a plain 503.
+    """
+    try:
+        ask, error = await run(pipeline.start_stream(await request.get_json() or {}))
+    except PoolSaturated:
+        raise
+    except Exception as e:
+        print(f"Error in ask_question_stream: {e}")
+        return jsonify({"error": str(e)}), 500
+    if error:
+        body, status, headers = error
+        return jsonify(body), status, headers
+    tokens = None
+    if ask.generating:
+        tokens = generation_pool.stream(generate_stream, ask.query, ask.sources, ask.scores, ask.decoding)
+
+    g.streaming = True
+    # The body is produced after the request's g is gone
+    request_start, endpoint = g.request_start, request.endpoint
+
+    def finish(outcome):
+        """Stage timings for the "done" event (the headers left before the work was done)"""
+        total = time.perf_counter() - request_start
+        metrics.REQUEST_SECONDS.observe(total, endpoint=endpoint, outcome=outcome)
+        return {stage: seconds * 1000 for stage, seconds in metrics.request_breakdown().items()}
+
+    @stream_with_context
+    async def events():
+        try:
+            for event in pipeline.opening_events(ask):
+                yield event
+            answer = None
+            if tokens is not None:
+                answer = ""
+                async for kind, text in tokens:
+                    if kind == "token":
+                        yield pipeline.token_event(ask, text)
+                    else:
+                        answer = text
+            done = await run(pipeline.finish_stream(ask, answer))
+            yield pipeline.sse_event("done", dict(done, timings_ms=finish("2xx")))
+        except Exception as e:
+            print(f"Error in ask_question_stream: {e}")
+            traceback.print_exc()
+            finish("5xx")
+            yield pipeline.sse_event("error", {"error": str(e)})
+
+    return Response(
+        events(),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route('/api/ask_batch', methods=['POST'])
+@rate_limit(config.RATE_LIMIT_BATCH)
+@validate_api_key
+@require_models
+async def ask_batch():
+    """
+    Answer many questions in one request (see pipeline.ask_batch). Retrieval for
+    the misses is one embedding-pool call and generation one generation-pool call.
+    """
+    return await respond(pipeline.ask_batch(await request.get_json() or {}))
+
+
+@app.route('/api/chunks', methods=['GET'])
+@rate_limit(config.RATE_LIMIT_CHAT)
+@validate_api_key
+@require_models
+async def get_chunk_texts():
+    """Source texts by chunk id (?ids=3,17,42), as {"chunks": {id: text}} (see pipeline.chunk_texts)"""
+    body, status, headers = pipeline.chunk_texts(request.args.get('ids', ''), request.if_none_match)
+    return Response(body, status=status, mimetype='application/json', headers=headers)
+
+
+@app.route('/api/chats', methods=['GET'])
+@rate_limit(config.RATE_LIMIT_CHAT)
+@validate_api_key
+async def get_chats():
+    """Get chat sessions, most recent first, one page at a time (?limit=&cursor=)"""
+    return await respond(pipeline.list_chats(request.args))
+
+
+@app.route('/api/chats/new', methods=['POST'])
+@rate_limit(config.RATE_LIMIT_CHAT)
+@validate_api_key
+async def create_new_chat():
+    """Create a new chat session"""
+    return await respond(pipeline.create_chat(await request.get_json() or {}))
+
+
+@app.route('/api/chats/<chat_id>', methods=['GET'])
+@rate_limit(config.RATE_LIMIT_CHAT)
+@validate_api_key
+async def get_chat_messages(chat_id):
+    """Get the latest messages of a chat, oldest first (?limit=&cursor=&include=sources)"""
+    return await respond(pipeline.chat_messages(chat_id, request.args))
+
+
+@app.route('/api/chats/<chat_id>', methods=['DELETE'])
+@rate_limit(config.RATE_LIMIT_CHAT)
+@validate_api_key
+async def delete_chat(chat_id):
+    """Delete a chat session and all its messages"""
+    return await respond(pipeline.delete_chat(chat_id))
+
+
+@app.route('/api/chats/<chat_id>/title', methods=['PUT'])
+@rate_limit(config.RATE_LIMIT_CHAT)
+@validate_api_key
+async def update_chat_title(chat_id):
+    """Update a chat's title"""
+    return await respond(pipeline.rename_chat(chat_id, await request.get_json() or {}))
+
+
+if __name__ == '__main__':
+    app.run(host=config.FLASK_HOST, port=config.FLASK_PORT)
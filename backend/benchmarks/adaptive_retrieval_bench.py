@@ -0,0 +1,146 @@
+"""
+Fixed vs adaptive retrieval depth: chunks per prompt, refusal latency and answer quality.
+
+Runs the context packing evaluation questions (with expected keywords) and the
+regression suite's off-topic questions through retrieval with a fixed TOP_K
+and with adaptive depth (see rag.retrieve.depth), then answers both. Reports
+per mode:
+
+- chunks per prompt (mean, and how many prompts got 1, 2, ... chunks) and the
+  encoder tokens of the packed prompt
+- refusals, and refusal latency: from the start of retrieval to the refusal
+  decision (the ask endpoints refuse before any generation)
+- retrieval and generation latency
+- keyword recall, and token F1 of the adaptive answers against the fixed ones
+
+--margins sweeps RETRIEVAL_DISTANCE_MARGIN for retrieval only (chunks per
+prompt and refusals). The embedding memo is disabled so both modes embed every
+question.
+
+Usage: python benchmarks/adaptive_retrieval_bench.py [--repeats 3] [--margins 0.1 0.2 0.3] [--no-generate]
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+# Both modes must pay for embedding and search; memoized results would hide it
+os.environ["EMBEDDING_MEMO_ENABLED"] = "false"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import print_table, summarize, timed
+from benchmarks.context_packing_eval import EVAL_SET, keyword_recall, token_f1
+from benchmarks.regression_suite import QUESTIONS
+
+import config
+from rag import generate as generation
+from rag.retrieve import load, retrieve
+
+OFF_TOPIC = [{"question": question, "keywords": []} for question in QUESTIONS[-3:]]
+
+
+def retrieval_pass(items, adaptive, repeats):
+    """[(sources, scores, refused, latencies)] per item"""
+    results = []
+    for item in items:
+        latencies = []
+        for _ in range(repeats):
+            (sources, scores), elapsed = timed(retrieve, item["question"], config.TOP_K, adaptive)
+            latencies.append(elapsed)
+        refused = (min(scores) if len(scores) else float("inf")) >= config.CONFIDENCE_THRESHOLD
+        results.append((sources, scores, refused, latencies))
+    return results
+
+
+def retrieval_row(mode, results):
+    answered = [len(sources) for sources, _, refused, _ in results if not refused]
+    refusal_latencies = [t for _, _, refused, latencies in results if refused for t in latencies]
+    depths = Counter(answered)
+    return {
+        "mode": mode,
+        "chunks": sum(answered) / len(answered) if answered else 0.0,
+        "depths": " ".join(f"{k}:{depths[k]}" for k in sorted(depths)),
+        "refusals": sum(refused for _, _, refused, _ in results),
+        "refuse_ms": summarize(refusal_latencies)["p50_ms"],
+        "retrieve_ms": summarize([t for *_, latencies in results for t in latencies])["p50_ms"],
+    }
+
+
+def answer_pass(items, results, baseline=None):
+    """Generation row and answers; refused questions get the refusal without generating"""
+    latencies, tokens, recalls, f1s, answers = [], [], [], [], []
+    for n, (item, (sources, scores, refused, _)) in enumerate(zip(items, results)):
+        if refused:
+            answer = generation.REFUSAL
+        else:
+            prompt, context_tokens = generation.prepare_prompt(item["question"], sources, scores)
+            raw, elapsed = timed(generation.decode, prompt, None, context_tokens)
+            answer = generation.postprocess(item["question"], raw)
+            latencies.append(elapsed)
+            tokens.append(len(generation.get_llm().tokenizer(prompt)["input_ids"]))
+        answers.append(answer)
+        if item["keywords"]:
+            recalls.append(keyword_recall(answer, item["keywords"]))
+        if baseline is not None:
+            f1s.append(token_f1(answer, baseline[n]))
+    row = {
+        "enc_tokens": sum(tokens) / len(tokens) if tokens else 0.0,
+        "generate_ms": summarize(latencies)["mean_ms"],
+        "kw_recall": sum(recalls) / len(recalls) if recalls else 0.0,
+        "f1_vs_fixed": sum(f1s) / len(f1s) if f1s else 1.0,
+    }
+    return row, answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed vs adaptive retrieval depth")
+    parser.add_argument("--repeats", type=int, default=3, help="Retrievals per question for latency")
+    parser.add_argument("--margins", type=float, nargs="*", default=[],
+                        help="Also sweep RETRIEVAL_DISTANCE_MARGIN (retrieval only)")
+    parser.add_argument("--no-generate", action="store_true", help="Skip generation and answer quality")
+    parser.add_argument("--eval-file", help="JSON list of {question, keywords}; off-topic items have no keywords")
+    parser.add_argument("--json", help="Also write the rows to this file")
+    args = parser.parse_args()
+
+    items = EVAL_SET + OFF_TOPIC
+    if args.eval_file:
+        with open(args.eval_file) as f:
+            items = json.load(f)
+
+    # Time each decode on its own rather than through the batching scheduler
+    config.GENERATION_BATCHING = False
+    load()
+    # Warm-up so the first timed retrieval does not pay for lazy initialization
+    retrieve(items[0]["question"], config.TOP_K)
+
+    fixed = retrieval_pass(items, False, args.repeats)
+    adaptive = retrieval_pass(items, True, args.repeats)
+    rows = [retrieval_row(f"fixed k={config.TOP_K}", fixed), retrieval_row("adaptive", adaptive)]
+
+    margin = config.RETRIEVAL_DISTANCE_MARGIN
+    for m in args.margins:
+        config.RETRIEVAL_DISTANCE_MARGIN = m
+        rows.append(retrieval_row(f"margin {m:g}", retrieval_pass(items, True, 1)))
+    config.RETRIEVAL_DISTANCE_MARGIN = margin
+
+    print(f"{len(items)} questions, CONFIDENCE_THRESHOLD={config.CONFIDENCE_THRESHOLD}, "
+          f"adaptive k in [{config.RETRIEVAL_MIN_K}, {config.RETRIEVAL_MAX_K}], margin {margin:g}, "
+          f"hopeless at {config.RETRIEVAL_HOPELESS_DISTANCE:g}")
+    print_table("Retrieval", rows, ["mode", "chunks", "depths", "refusals", "refuse_ms", "retrieve_ms"])
+
+    if not args.no_generate:
+        fixed_row, baseline = answer_pass(items, fixed)
+        adaptive_row, _ = answer_pass(items, adaptive, baseline)
+        rows[0].update(fixed_row)
+        rows[1].update(adaptive_row)
+        print_table("Answers", rows[:2],
+                    ["mode", "chunks", "enc_tokens", "generate_ms", "kw_recall", "f1_vs_fixed"])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Compare inference backends against the fp32 PyTorch baseline.
+
+Each backend runs in its own subprocess (so peak memory is measured in
+isolation) over a fixed question set. Reports per-question embedding+search
+and generation latency, peak RSS, retrieval agreement (top-k overlap with the
+fp32 embedder) and answer agreement (exact match and token F1 against the fp32
+answers).
+
+Usage: python benchmarks/backend_bench.py [--backends torch int8 onnx]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import BACKEND_DIR, summarize, print_table
+
+
+QUESTIONS = [
+    "What is supervised learning?",
+    "What is unsupervised learning?",
+    "What is Natural Language Processing?",
+    "How do transformers use self-attention?",
+    "What are convolutional neural networks used for?",
+    "What is breadth-first search?",
+    "What is Retrieval-Augmented Generation?",
+    "How are neural networks trained?",
+]
+
+
+def run_child():
+    """Runs inside the per-backend subprocess; prints one JSON result line"""
+    import resource
+
+    load_start = time.perf_counter()
+    import config
+    from model_loader import load_models
+    from rag.retrieve import retrieve
+    from rag.generate import generate
+    load_models()
+    load_time = time.perf_counter() - load_start
+
+    retrieval, generation, answers, neighbours = [], [], [], []
+    for question in QUESTIONS:
+        start = time.perf_counter()
+        sources, _ = retrieve(question, top_k=config.TOP_K)
+        retrieval.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        answers.append(generate(question, sources))
+        generation.append(time.perf_counter() - start)
+        neighbours.append(sources)
+
+    print(json.dumps({
+        "load_s": load_time,
+        "retrieval": retrieval,
+        "generation": generation,
+        "answers": answers,
+        "neighbours": neighbours,
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def token_f1(a, b):
+    a, b = a.lower().split(), b.lower().split()
+    if not a or not b:
+        return float(a == b)
+    common = sum(min(a.count(t), b.count(t)) for t in set(a))
+    if common == 0:
+        return 0.0
+    precision, recall = common / len(a), common / len(b)
+    return 2 * precision * recall / (precision + recall)
+
+
+def run_backend(backend):
+    env = dict(os.environ, GENERATION_BACKEND=backend, EMBEDDING_BACKEND=backend, GENERATION_BATCHING="false")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        print(f"⚠️ Backend '{backend}' failed:\n{proc.stderr[-2000:]}")
+        return None
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference backend benchmark")
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    results = {backend: run_backend(backend) for backend in dict.fromkeys(["torch"] + args.backends)}
+    baseline = results["torch"]
+    if baseline is None:
+        sys.exit("The fp32 baseline failed; nothing to compare against")
+
+    rows = []
+    for backend, result in results.items():
+        if result is None:
+            continue
+        overlap = [
+            len(set(a) & set(b)) / max(len(b), 1)
+            for a, b in zip(result["neighbours"], baseline["neighbours"])
+        ]
+        rows.append({
+            "backend": backend,
+            "load_s": result["load_s"],
+            "retrieve_p50_ms": summarize(result["retrieval"])["p50_ms"],
+            "generate_p50_ms": summarize(result["generation"])["p50_ms"],
+            "generate_p99_ms": summarize(result["generation"])["p99_ms"],
+            "peak_rss_mb": result["peak_rss_mb"],
+            "topk_overlap": sum(overlap) / len(overlap),
+            "exact_match": sum(a == b for a, b in zip(result["answers"], baseline["answers"])) / len(QUESTIONS),
+            "token_f1": sum(token_f1(a, b) for a, b in zip(result["answers"], baseline["answers"])) / len(QUESTIONS),
+        })
+
+    print_table(f"Inference backends ({len(QUESTIONS)} questions, agreement vs fp32 torch)", rows, [
+        "backend", "load_s", "retrieve_p50_ms", "generate_p50_ms", "generate_p99_ms",
+        "peak_rss_mb", "topk_overlap", "exact_match", "token_f1"
+    ])
+
+
+if __name__ == "__main__":
+    main()
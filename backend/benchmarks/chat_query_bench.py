@@ -0,0 +1,133 @@
+"""
+Chat list and history queries before and after pagination, projections and indexes.
+
+Seeds a separate, throwaway database (BENCH_DATABASE_NAME, default
+nlpassist_bench; it is dropped afterwards) on the configured MongoDB with chats whose assistant messages carry full sources,
+then measures latency and JSON payload size for:
+
+- before: every chat, and a chat's whole history with all metadata, no indexes
+- after:  the first page of chats and the latest page of messages, without
+          sources and with them (?include=sources), on the startup indexes
+
+Usage: python benchmarks/chat_query_bench.py [--chats 2000] [--messages 400] [--repeats 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+# Never run against the application database: seeding drops chats and messages
+os.environ["DATABASE_NAME"] = os.getenv("BENCH_DATABASE_NAME", "nlpassist_bench")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import print_table, summarize, timed
+
+import config
+import models
+from models import Chat, Message, ensure_indexes
+from bson import json_util
+
+
+def seed(chats, messages_per_chat, source_words=120):
+    """Insert chats with alternating user/assistant messages; returns a long chat's id"""
+    rng = random.Random(0)
+    vocabulary = "retrieval transformer embedding vector index chunk language model attention".split()
+    start = datetime(2024, 1, 1)
+    models.chats_collection.drop()
+    models.messages_collection.drop()
+
+    chat_ids = []
+    for c in range(chats):
+        updated = start + timedelta(minutes=c)
+        chat_ids.append(models.chats_collection.insert_one(
+            {"title": f"Chat {c}", "created_at": updated, "updated_at": updated}
+        ).inserted_id)
+
+    # Most chats are short; the last one is the long-lived chat that gets measured
+    long_chat = str(chat_ids[-1])
+    batch = []
+    for c, chat_id in enumerate(chat_ids):
+        count = messages_per_chat if str(chat_id) == long_chat else rng.randint(2, 20)
+        for m in range(count):
+            role = "user" if m % 2 == 0 else "assistant"
+            metadata = {}
+            if role == "assistant":
+                metadata = {
+                    "cached": False,
+                    "confidence": "High",
+                    "sources": [" ".join(rng.choice(vocabulary) for _ in range(source_words)) for _ in range(3)],
+                    "retrieval_time": 0.01,
+                    "generation_time": 2.5,
+                }
+            batch.append({
+                "chat_id": str(chat_id),
+                "role": role,
+                "content": f"Message {m} " + " ".join(rng.choice(vocabulary) for _ in range(40)),
+                "metadata": metadata,
+                "timestamp": start + timedelta(minutes=c, seconds=m),
+            })
+            if len(batch) >= 5000:
+                models.messages_collection.insert_many(batch)
+                batch = []
+    if batch:
+        models.messages_collection.insert_many(batch)
+    return long_chat
+
+
+def payload_bytes(docs):
+    return len(json.dumps(docs, default=json_util.default))
+
+
+def measure(name, fn, repeats):
+    latencies = []
+    for _ in range(repeats):
+        docs, elapsed = timed(fn)
+        latencies.append(elapsed)
+    return dict(summarize(latencies), query=name, docs=len(docs), kb=payload_bytes(docs) / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat query benchmark")
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=400, help="Messages in the measured chat")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="Keep the seeded database")
+    args = parser.parse_args()
+
+    print(f"🌱 Seeding {config.DATABASE_NAME} with {args.chats} chats...")
+    long_chat = seed(args.chats, args.messages)
+    rows = []
+
+    # Before: the original queries, with no indexes besides _id
+    rows.append(measure("chats: all", lambda: list(models.chats_collection.find().sort("updated_at", -1)),
+                        args.repeats))
+    rows.append(measure("history: all", lambda: list(
+        models.messages_collection.find({"chat_id": long_chat}).sort("timestamp", 1)
+    ), args.repeats))
+
+    # After: startup indexes, first pages, heavy metadata left out unless requested
+    ensure_indexes()
+    rows.append(measure("chats: page", lambda: Chat.get_page(config.CHATS_PAGE_SIZE)[0], args.repeats))
+    rows.append(measure("history: page", lambda: Message.get_page(long_chat, config.MESSAGES_PAGE_SIZE)[0],
+                        args.repeats))
+    rows.append(measure("history: +src", lambda: Message.get_page(
+        long_chat, config.MESSAGES_PAGE_SIZE, include=["sources"]
+    )[0], args.repeats))
+
+    print_table("Chat queries", rows, ["query", "docs", "kb", "mean_ms", "p50_ms", "p99_ms"])
+
+    plan = models.messages_collection.find({"chat_id": long_chat}).sort(
+        [("timestamp", -1), ("_id", -1)]
+    ).limit(config.MESSAGES_PAGE_SIZE + 1).explain()
+    stats = plan.get("executionStats", {})
+    print(f"\nHistory page plan: {stats.get('totalDocsExamined', '?')} documents examined "
+          f"for {stats.get('nReturned', '?')} returned")
+
+    if not args.keep:
+        models.client.drop_database(config.DATABASE_NAME)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Startup time and per-worker memory: chunks.pkl vs the memory-mapped chunk store.
+
+Builds a synthetic corpus (1M chunks by default) in both formats, then starts
+several worker processes at once for each format. Every worker loads the
+chunks, reads a sample of random chunks the way retrieve() does, and reports
+its load time, RSS and PSS (proportional set size: shared pages are divided
+among the processes mapping them, so PSS shows the real per-worker cost).
+
+Usage: python benchmarks/chunk_store_bench.py [--chunks 1000000] [--workers 4]
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import BACKEND_DIR, print_table
+
+from rag.chunk_store import write_chunk_store
+
+
+WORDS = ("retrieval transformer embedding vector index chunk language model attention "
+         "learning neural network search corpus document token query answer").split()
+
+
+def synthetic_chunks(count, words_per_chunk, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield f"Chunk {i}: " + " ".join(rng.choice(WORDS) for _ in range(words_per_chunk))
+
+
+def memory_kb():
+    """(RSS, PSS) of this process in kB, from /proc (Linux only)"""
+    values = {}
+    for path in ("/proc/self/status", "/proc/self/smaps_rollup"):
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, _, rest = line.partition(":")
+                    if key in ("VmRSS", "Pss"):
+                        values[key] = int(rest.split()[0])
+        except OSError:
+            pass
+    return values.get("VmRSS", 0), values.get("Pss", 0)
+
+
+def run_worker(fmt, path, lookups):
+    """Runs in each worker process"""
+    start = time.perf_counter()
+    if fmt == "pickle":
+        with open(path, "rb") as f:
+            chunks = pickle.load(f)
+    else:
+        from rag.chunk_store import ChunkStore
+        chunks = ChunkStore(path)
+    load_time = time.perf_counter() - start
+
+    rng = random.Random(os.getpid())
+    for _ in range(lookups):
+        chunks[rng.randrange(len(chunks))]
+
+    rss, _ = memory_kb()
+    print(json.dumps({"load_s": load_time, "rss_kb": rss}), flush=True)
+    # Wait until every worker is loaded so PSS reflects concurrent sharing
+    sys.stdin.readline()
+    _, pss = memory_kb()
+    print(json.dumps({"pss_kb": pss}), flush=True)
+
+
+def measure(fmt, path, workers, lookups):
+    procs = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", fmt, path, str(lookups)],
+            cwd=BACKEND_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        for _ in range(workers)
+    ]
+    loaded = [json.loads(p.stdout.readline()) for p in procs]
+    for p in procs:
+        p.stdin.write("\n")
+        p.stdin.flush()
+    pss = [json.loads(p.stdout.readline())["pss_kb"] for p in procs]
+    for p in procs:
+        p.wait()
+
+    return {
+        "format": fmt,
+        "load_s": sum(r["load_s"] for r in loaded) / workers,
+        "rss_mb": sum(r["rss_kb"] for r in loaded) / workers / 1024,
+        "pss_mb": sum(pss) / workers / 1024,
+        "total_pss_mb": sum(pss) / 1024,
+    }
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+
+    parser = argparse.ArgumentParser(description="Chunk store benchmark")
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--words", type=int, default=60, help="Words per synthetic chunk")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=1000, help="Random chunk reads per worker")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path = os.path.join(tmp, "chunks.pkl")
+        store_prefix = os.path.join(tmp, "chunks")
+
+        with open(pickle_path, "wb") as f:
+            pickle.dump(list(synthetic_chunks(args.chunks, args.words)), f)
+        write_chunk_store(synthetic_chunks(args.chunks, args.words), store_prefix)
+        print(f"Corpus: {args.chunks} chunks, pickle {os.path.getsize(pickle_path) / 2**20:.1f} MB, "
+              f"store {(os.path.getsize(store_prefix + '.bin') + os.path.getsize(store_prefix + '.offsets')) / 2**20:.1f} MB")
+
+        rows = [
+            measure("pickle", pickle_path, args.workers, args.lookups),
+            measure("mmap", store_prefix, args.workers, args.lookups),
+        ]
+
+    print_table(f"Per-worker startup and memory ({args.workers} concurrent workers)", rows,
+                ["format", "load_s", "rss_mb", "pss_mb", "total_pss_mb"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Shared helpers for the benchmark scripts.
+Run benchmarks from the backend directory, as `python benchmarks/<script>.py` or
+`python -m benchmarks.<script>`. Scripts import this module as benchmarks.common
+(after putting backend/ on sys.path, which the script form does not do).
+"""
+import os
+import sys
+import time
+
+# Make backend modules importable and relative data paths resolvable
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies):
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(latencies),
+        "mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p99_ms": 1000 * percentile(latencies, 99),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    """Call fn and return (result, elapsed_seconds)"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def print_table(title, rows, columns):
+    """Print a list of dicts as a fixed-width table"""
+    print(f"\n{title}")
+    print("-" * (16 * len(columns)))
+    print("".join(f"{c:>16}" for c in columns))
+    for row in rows:
+        cells = []
+        for c in columns:
+            value = row.get(c, "")
+            cells.append(f"{value:>16.2f}" if isinstance(value, float) else f"{str(value):>16}")
+        print("".join(cells))
@@ -0,0 +1,120 @@
+"""
+Encoder tokens, generation latency and answer quality with and without context packing.
+
+Each question is retrieved once, then answered with the unpacked prompt (all
+chunks, truncated by the pipeline at 512 tokens) and with packed prompts at
+each token budget. Reports per mode:
+
+- encoder tokens actually fed to FLAN-T5, and prompts whose question was cut off
+- generation latency
+- keyword recall of the answers (expected terms from the evaluation set)
+- token F1 against the unpacked answers, and refusal count
+
+Usage: python benchmarks/context_packing_eval.py [--budgets 320 400 512] [--eval-file questions.json]
+The evaluation file is a JSON list of {"question": ..., "keywords": [...]}.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import print_table, summarize, timed
+
+import config
+from rag import generate as generation
+from rag.context_packer import ContextPacker
+from rag.retrieve import load, retrieve
+
+EVAL_SET = [
+    {"question": "What is supervised learning?", "keywords": ["labeled", "training", "output"]},
+    {"question": "What is unsupervised learning?", "keywords": ["unlabeled", "patterns", "clustering"]},
+    {"question": "What is Natural Language Processing?", "keywords": ["language", "computers", "text"]},
+    {"question": "How do transformers use self-attention?", "keywords": ["attention", "tokens", "sequence"]},
+    {"question": "What are convolutional neural networks used for?", "keywords": ["images", "convolution", "features"]},
+    {"question": "What is breadth-first search?", "keywords": ["graph", "level", "nodes"]},
+    {"question": "What is Retrieval-Augmented Generation?", "keywords": ["retrieval", "documents", "generation"]},
+    {"question": "How are neural networks trained?", "keywords": ["weights", "backpropagation", "loss"]},
+]
+
+
+def token_f1(a, b):
+    a, b = a.lower().split(), b.lower().split()
+    if not a or not b:
+        return float(a == b)
+    common = sum(min(a.count(t), b.count(t)) for t in set(a))
+    if common == 0:
+        return 0.0
+    precision, recall = common / len(a), common / len(b)
+    return 2 * precision * recall / (precision + recall)
+
+
+def keyword_recall(answer, keywords):
+    answer = answer.lower()
+    return sum(k.lower() in answer for k in keywords) / len(keywords) if keywords else 1.0
+
+
+def run(items, retrieved, packer, baseline=None):
+    tokenizer = generation.get_llm().tokenizer
+    latencies, tokens, recalls, f1s, answers = [], [], [], [], []
+    cut = refusals = 0
+    for n, (item, (sources, scores)) in enumerate(zip(items, retrieved)):
+        chunks = sources if packer is None else packer.pack(item["question"], sources, scores).chunks
+        prompt = generation.build_prompt(item["question"], chunks)
+        full = len(tokenizer(prompt)["input_ids"])
+        # The pipeline truncates whatever does not fit
+        tokens.append(min(full, tokenizer.model_max_length))
+        cut += full > tokenizer.model_max_length
+
+        raw, elapsed = timed(generation.decode, prompt)
+        answer = generation.postprocess(item["question"], raw)
+        latencies.append(elapsed)
+        answers.append(answer)
+        refusals += answer == generation.REFUSAL
+        recalls.append(keyword_recall(answer, item["keywords"]))
+        if baseline is not None:
+            f1s.append(token_f1(answer, baseline[n]))
+
+    row = dict(summarize(latencies))
+    row.update(
+        enc_tokens=sum(tokens) / len(tokens),
+        q_cut=cut,
+        kw_recall=sum(recalls) / len(recalls),
+        f1_vs_full=sum(f1s) / len(f1s) if f1s else 1.0,
+        refusals=refusals,
+    )
+    return row, answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Context packing evaluation")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[320, 400, 512])
+    parser.add_argument("--eval-file", help="JSON list of {question, keywords}")
+    args = parser.parse_args()
+
+    items = EVAL_SET
+    if args.eval_file:
+        with open(args.eval_file) as f:
+            items = json.load(f)
+
+    # Time each decode on its own rather than through the batching scheduler
+    config.GENERATION_BATCHING = False
+    load()
+    retrieved = [retrieve(item["question"], top_k=config.TOP_K) for item in items]
+    tokenizer = generation.get_llm().tokenizer
+
+    rows = []
+    row, baseline = run(items, retrieved, None)
+    rows.append(dict(row, mode="unpacked"))
+    for budget in args.budgets:
+        packer = ContextPacker(tokenizer, generation.PROMPT_HEAD, generation.PROMPT_TAIL, budget=budget)
+        row, _ = run(items, retrieved, packer, baseline)
+        rows.append(dict(row, mode=f"packed {budget}"))
+
+    print_table("Context packing", rows, [
+        "mode", "enc_tokens", "q_cut", "mean_ms", "p50_ms", "kw_recall", "f1_vs_full", "refusals"
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Conversation context: added latency per turn and retrieval of follow-ups.
+
+- overhead: what a chat turn now costs on top of the RAG pipeline, measured
+            over simulated chats: reading the window and rewriting the
+            question, recording the turn, and blending the query vector with
+            the earlier turns (synthetic vectors, runs anywhere)
+- --mongo:  for comparison, loading the chat's history with
+            Message.get_by_chat, the per-turn read the window replaces
+            (seeds a throwaway database, BENCH_DATABASE_NAME)
+- --retrieve: scripted dialogues against the real index and embedding model;
+            each follow-up is retrieved as asked and as rewritten with the
+            earlier turns' vectors blended in, comparing the best distance,
+            refusals (best distance >= CONFIDENCE_THRESHOLD) and latency
+
+Usage: python benchmarks/conversation_bench.py [--chats 1000] [--turns 20000] [--dim 384] [--mongo] [--retrieve]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Never run against the application database: --mongo inserts and drops messages
+os.environ["DATABASE_NAME"] = os.getenv("BENCH_DATABASE_NAME", "nlpassist_bench")
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import print_table, summarize, timed
+
+import config
+from conversation import ConversationWindows, blend, rewrite
+
+# Opening question, then follow-ups that only make sense after it
+DIALOGUES = [
+    ["What is supervised learning?", "How is it different from unsupervised learning?", "what about its limitations?"],
+    ["How do transformers use self-attention?", "Why are they better than RNNs?", "what about their training?"],
+    ["What are convolutional neural networks used for?", "How are they trained?", "tell me more"],
+    ["What is overfitting?", "How can it be prevented?", "what about regularization?"],
+    ["What is Retrieval-Augmented Generation?", "Does it reduce hallucination?", "what are its components?"],
+    ["What is breadth-first search?", "and depth-first search?", "When is it preferred?"],
+    ["What are word embeddings?", "How are they learned?", "what about their dimensions?"],
+]
+
+
+def overhead(chats, turns, dim, window):
+    """Per-turn latency (seconds) of each conversation step over simulated chats"""
+    rng = random.Random(0)
+    vectors = np.random.default_rng(0).standard_normal((64, dim)).astype("float32")
+    windows = ConversationWindows(max_chats=chats, max_turns=window, ttl=3600)
+    steps = {"rewrite": [], "add_turn": [], "blend": [], "total": []}
+    for t in range(turns):
+        chat_id = f"chat-{rng.randrange(chats)}"
+        dialogue = DIALOGUES[rng.randrange(len(DIALOGUES))]
+        question = dialogue[t % len(dialogue)]
+
+        start = time.perf_counter()
+        history = windows.history(chat_id)
+        query, subject = rewrite(question, history)
+        rewritten = time.perf_counter()
+        vector = vectors[t % len(vectors)]
+        if query != question and history:
+            prior = windows.prior_vectors(history, lambda queries: vectors[:len(queries)])
+            blend(vector, prior, config.CONVERSATION_PRIOR_WEIGHT)
+        blended = time.perf_counter()
+        windows.add_turn(chat_id, question, query, subject, vector)
+        end = time.perf_counter()
+
+        steps["rewrite"].append(rewritten - start)
+        steps["blend"].append(blended - rewritten)
+        steps["add_turn"].append(end - blended)
+        steps["total"].append(end - start)
+    return steps, windows
+
+
+def history_read(messages, repeats):
+    """Latency of Message.get_by_chat for a chat with `messages` messages"""
+    import models
+    from models import Message, ensure_indexes
+    ensure_indexes()
+    chat_id = "0" * 24
+    start = datetime.utcnow()
+    models.messages_collection.delete_many({"chat_id": chat_id})
+    models.messages_collection.insert_many([
+        {"chat_id": chat_id, "role": "user" if m % 2 == 0 else "assistant",
+         "content": f"Message {m} about retrieval and transformers",
+         "metadata": {} if m % 2 == 0 else {"cached": False, "confidence": "High", "source_ids": [1, 2, 3]},
+         "timestamp": start + timedelta(seconds=m)}
+        for m in range(messages)
+    ])
+    latencies = [timed(Message.get_by_chat, chat_id)[1] for _ in range(repeats)]
+    models.client.drop_database(config.DATABASE_NAME)
+    return latencies
+
+
+def follow_up_retrieval(top_k):
+    """Rows comparing each follow-up retrieved as asked and with conversation context"""
+    from rag.retrieve import embed_questions, retrieve_with_context, retrieve_with_ids, load
+    load()
+    rows = []
+    for dialogue in DIALOGUES:
+        windows = ConversationWindows(max_turns=config.CONVERSATION_WINDOW_TURNS)
+        for question in dialogue:
+            history = windows.history("bench")
+            query, subject = rewrite(question, history)
+            (_, plain, _), plain_time = timed(retrieve_with_ids, question, top_k)
+            prior = windows.prior_vectors(history, embed_questions)
+            (_, context, _, vector), context_time = timed(retrieve_with_context, query, top_k, prior)
+            windows.add_turn("bench", question, query, subject, vector)
+            if not history:
+                continue
+            rows.append({
+                "question": question[:30],
+                "rewritten": query[:40],
+                "plain_min": float(min(plain)) if len(plain) else float("inf"),
+                "context_min": float(min(context)) if len(context) else float("inf"),
+                "plain_ms": plain_time * 1000,
+                "context_ms": context_time * 1000,
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation context overhead and follow-up retrieval")
+    parser.add_argument("--chats", type=int, default=1000, help="Concurrent chats in the simulation")
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension of the synthetic vectors")
+    parser.add_argument("--mongo", action="store_true", help="Also time Message.get_by_chat for comparison")
+    parser.add_argument("--messages", type=int, default=40, help="Messages in the chat read by --mongo")
+    parser.add_argument("--retrieve", action="store_true", help="Compare follow-up retrieval on the real index")
+    args = parser.parse_args()
+
+    steps, windows = overhead(args.chats, args.turns, args.dim, config.CONVERSATION_WINDOW_TURNS)
+    rows = [dict(summarize(latencies), step=step) for step, latencies in steps.items()]
+    for row in rows:
+        for column in ("mean_ms", "p50_ms", "p99_ms"):
+            row[column.replace("_ms", "_us")] = row.pop(column) * 1000
+    stats = windows.stats()
+    print_table(f"Per-turn overhead ({args.turns} turns, {stats['chats']} chats, "
+                f"{stats['follow_ups']} follow-ups, window {config.CONVERSATION_WINDOW_TURNS})",
+                rows, ["step", "count", "mean_us", "p50_us", "p99_us"])
+
+    if args.mongo:
+        latencies = history_read(args.messages, repeats=50)
+        print_table(f"Message.get_by_chat ({args.messages} messages)", [dict(summarize(latencies), step="history")],
+                    ["step", "count", "mean_ms", "p50_ms", "p99_ms"])
+
+    if args.retrieve:
+        rows = follow_up_retrieval(config.TOP_K)
+        print_table(f"Follow-ups as asked vs with context (TOP_K={config.TOP_K}, "
+                    f"CONFIDENCE_THRESHOLD={config.CONFIDENCE_THRESHOLD})",
+                    rows, ["question", "rewritten", "plain_min", "context_min", "plain_ms", "context_ms"])
+        refused = {name: sum(row[f"{name}_min"] >= config.CONFIDENCE_THRESHOLD for row in rows)
+                   for name in ("plain", "context")}
+        print(f"  refused: {refused['plain']}/{len(rows)} as asked, {refused['context']}/{len(rows)} with context")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Decode steps spent and wasted per answer under different decoding strategies.
+
+Each question is retrieved and its prompt built once, then decoded with:
+
+- fixed:     the original settings (min_length=100, up to 512 tokens, no repetition controls)
+- no-repeat: fixed length, with no_repeat_ngram_size and repetition_penalty
+- adaptive:  the repetition controls with the configured sentence limit and
+             length budget from the context size
+
+For each strategy reports tokens decoded, tokens then discarded by
+clean_repetition, answer length, refusals and wall time per answer.
+
+Usage: python benchmarks/decoding_bench.py [--repeats 1]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import print_table, summarize, timed
+
+import config
+from rag import generate as generation
+from rag.decoding import DecodeOptions
+from rag.retrieve import load, retrieve
+
+QUESTIONS = [
+    "What is supervised learning?",
+    "What is unsupervised learning?",
+    "What is Natural Language Processing?",
+    "How do transformers use self-attention?",
+    "What are convolutional neural networks used for?",
+    "What is breadth-first search?",
+    "What is Retrieval-Augmented Generation?",
+    "How are neural networks trained?",
+]
+
+# Off by default (see config.py); these are the settings compared
+REPETITION_CONTROLS = {"no_repeat_ngram_size": 3, "repetition_penalty": 1.2}
+
+STRATEGIES = {
+    "fixed": (DecodeOptions(no_repeat_ngram_size=0, repetition_penalty=1.0, max_sentences=0,
+                            min_length=100, max_length=512), False),
+    "no-repeat": (DecodeOptions(max_sentences=0, min_length=100, max_length=512, **REPETITION_CONTROLS), False),
+    "adaptive": (DecodeOptions(**REPETITION_CONTROLS), True),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decoding strategy benchmark")
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+
+    # One decode at a time, so wall time is per answer
+    config.GENERATION_BATCHING = False
+    load()
+    tokenizer = generation.get_llm().tokenizer
+    prompts = []
+    for question in QUESTIONS:
+        sources, scores = retrieve(question, top_k=config.TOP_K)
+        prompt, context_tokens = generation.prepare_prompt(question, sources, scores)
+        prompts.append((question, prompt, context_tokens))
+
+    def count(text):
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    rows = []
+    for name, (options, adaptive) in STRATEGIES.items():
+        latencies, decoded, discarded, words = [], [], [], []
+        refusals = 0
+        for _ in range(args.repeats):
+            for question, prompt, context_tokens in prompts:
+                raw, elapsed = timed(generation.decode, prompt, options, context_tokens if adaptive else None)
+                cleaned = generation.clean_repetition(raw)
+                answer = generation.postprocess(question, raw)
+                latencies.append(elapsed)
+                decoded.append(count(raw))
+                discarded.append(count(raw) - count(cleaned))
+                words.append(len(answer.split()))
+                refusals += answer == generation.REFUSAL
+        rows.append(dict(
+            summarize(latencies),
+            strategy=name,
+            decoded=sum(decoded) / len(decoded),
+            discarded=sum(discarded) / len(discarded),
+            words=sum(words) / len(words),
+            refusals=refusals,
+        ))
+
+    print_table("Decoding strategies (per answer)", rows, [
+        "strategy", "decoded", "discarded", "words", "refusals", "mean_ms", "p50_ms", "p99_ms"
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Retrieval latency with and without the embedding memo.
+
+Runs retrieve() over a question set (including off-topic questions that end
+in a refusal) four ways: memo disabled, cold memo, warm in-process LRU, and
+warm SQLite store with an empty LRU (what another worker process sees).
+
+Usage: python benchmarks/embedding_memo_bench.py [--repeats 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import print_table, summarize, timed
+
+from rag import retrieve as retrieval
+from rag.embedding_memo import EmbeddingMemo
+
+QUESTIONS = [
+    "What is retrieval-augmented generation?",
+    "How does a transformer use attention?",
+    "What is the difference between supervised and unsupervised learning?",
+    "What are word embeddings?",
+    "How is a language model evaluated?",
+    # Off-topic questions are refused and were never cached before the memo
+    "Who won the 1998 football world cup?",
+    "What is the capital of Australia?",
+    "How do I bake sourdough bread?",
+]
+
+
+def run(questions, repeats):
+    latencies = []
+    for _ in range(repeats):
+        for question in questions:
+            _, elapsed = timed(retrieval.retrieve, question, top_k=3)
+            latencies.append(elapsed)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval latency with and without the embedding memo")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    retrieval.load()
+    # Near-repeats: same questions with different case, spacing and punctuation
+    variants = [q.lower().rstrip("?") + " ?" for q in QUESTIONS]
+    rows = []
+
+    retrieval.memo = None
+    rows.append(dict(summarize(run(QUESTIONS, args.repeats)), mode="no memo"))
+
+    path = os.path.join(tempfile.mkdtemp(), "memo.sqlite")
+    retrieval.memo = EmbeddingMemo(path)
+    rows.append(dict(summarize(run(QUESTIONS, 1)), mode="cold"))
+    rows.append(dict(summarize(run(QUESTIONS + variants, args.repeats)), mode="memory"))
+
+    retrieval.memo = EmbeddingMemo(path)
+    rows.append(dict(summarize(run(variants, 1)), mode="sqlite"))
+
+    print_table("retrieve() latency", rows, ["mode", "count", "mean_ms", "p50_ms", "p99_ms"])
+
+
+if __name__ == "__main__":
+    main()
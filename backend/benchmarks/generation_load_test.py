@@ -0,0 +1,111 @@
+"""
+Load test for FLAN-T5 generation with the micro-batching scheduler on and off.
+
+In-process mode (default) fires concurrent generate() calls from a thread pool,
+the same way threaded Flask workers do, and toggles config.GENERATION_BATCHING
+between runs. HTTP mode (--url) drives a running server's /api/ask endpoint;
+start the server once with GENERATION_BATCHING=true and once with false
+(and with RATE_LIMIT_ENABLED=false, SEMANTIC_CACHE_ENABLED=false so every
+request reaches the model).
+
+Reports requests per second and p50/p99 latency.
+
+Usage:
+  python benchmarks/generation_load_test.py --concurrency 8 --requests 32
+  python benchmarks/generation_load_test.py --url http://localhost:5000/api/ask
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import summarize, timed, print_table
+
+import config
+
+
+QUESTIONS = [
+    "What is supervised learning?",
+    "What is unsupervised learning?",
+    "What is Natural Language Processing?",
+    "How do transformers use self-attention?",
+    "What are convolutional neural networks used for?",
+    "What is breadth-first search?",
+    "What is Retrieval-Augmented Generation?",
+    "How are neural networks trained?",
+]
+
+
+def run_load(call, jobs, concurrency):
+    latencies = []
+
+    def worker(job):
+        _, elapsed = timed(call, job)
+        latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, jobs))
+    wall = time.perf_counter() - start
+
+    stats = summarize(latencies)
+    return {"rps": len(jobs) / wall, "p50_ms": stats["p50_ms"], "p99_ms": stats["p99_ms"]}
+
+
+def in_process(args):
+    from rag.retrieve import retrieve
+    from rag.generate import generate, scheduler
+
+    # Retrieve once up front so only generation is measured
+    contexts = {q: retrieve(q, top_k=config.TOP_K)[0] for q in QUESTIONS}
+    jobs = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.requests)]
+    call = lambda q: generate(q, contexts[q])
+
+    # Warm up the model so the first timed run does not pay for lazy init
+    generate(QUESTIONS[0], contexts[QUESTIONS[0]])
+
+    rows = []
+    for batching in (False, True):
+        config.GENERATION_BATCHING = batching
+        batches_before = scheduler.batches_run
+        result = run_load(call, jobs, args.concurrency)
+        batches = scheduler.batches_run - batches_before
+        result["scheduler"] = "on" if batching else "off"
+        result["avg_batch"] = float(len(jobs) / batches) if batches else 1.0
+        rows.append(result)
+    return rows
+
+
+def over_http(args):
+    def call(i):
+        # A unique suffix keeps every request out of the answer cache
+        body = json.dumps({"question": f"{QUESTIONS[i % len(QUESTIONS)]} ({time.time_ns()}-{i})"})
+        req = urllib.request.Request(args.url, data=body.encode(), headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            resp.read()
+
+    result = run_load(call, list(range(args.requests)), args.concurrency)
+    result["scheduler"] = "server"
+    return [result]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generation load test")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--url", help="Drive a running server instead of calling generate() in-process")
+    args = parser.parse_args()
+
+    rows = over_http(args) if args.url else in_process(args)
+    print_table(
+        f"Generation load test (concurrency={args.concurrency}, requests={args.requests})",
+        rows, ["scheduler", "rps", "p50_ms", "p99_ms", "avg_batch"]
+    )
+
+
+if __name__ == "__main__":
+    main()
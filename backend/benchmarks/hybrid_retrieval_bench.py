@@ -0,0 +1,104 @@
+"""
+Recall and latency of dense-only, BM25-only and hybrid (RRF) retrieval.
+
+Each query comes with a key phrase; a chunk counts as relevant when it
+contains the phrase (case-insensitive), found with the linear substring scan
+the hybrid index replaces, which is timed as well. Reports per method:
+
+- hit@k: queries with at least one relevant chunk in the top k
+- precision@k: share of returned chunks that are relevant
+- latency per query (the dense methods include embedding and FAISS search)
+
+Usage: python benchmarks/hybrid_retrieval_bench.py [--top-k 3] [--queries queries.json]
+The queries file is a JSON list of {"question": ..., "phrase": ...}.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import print_table, summarize
+
+import config
+from rag import retrieve as retrieval
+from rag.bm25 import load_or_build
+
+QUERIES = [
+    {"question": "What is RAG?", "phrase": "RAG"},
+    {"question": "Explain Retrieval-Augmented Generation", "phrase": "retrieval-augmented generation"},
+    {"question": "What does BFS do?", "phrase": "breadth-first"},
+    {"question": "How is backpropagation used?", "phrase": "backpropagation"},
+    {"question": "What is a CNN used for?", "phrase": "convolutional"},
+    {"question": "What is tokenization in NLP?", "phrase": "tokeniz"},
+    {"question": "What is self-attention?", "phrase": "self-attention"},
+    {"question": "What is k-means?", "phrase": "k-means"},
+    {"question": "Define overfitting", "phrase": "overfitting"},
+    {"question": "What are word embeddings?", "phrase": "embedding"},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dense vs BM25 vs hybrid retrieval")
+    parser.add_argument("--top-k", type=int, default=config.TOP_K)
+    parser.add_argument("--queries", help="JSON list of {question, phrase}")
+    args = parser.parse_args()
+
+    queries = QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = json.load(f)
+
+    # Memoized searches would hide the embedding and FAISS cost
+    retrieval.memo = None
+    retrieval.load()
+    state = retrieval.current_state()
+    bm25 = state.bm25 or load_or_build(config.BM25_INDEX_PATH, state.chunks, config.BM25_K1, config.BM25_B)
+    candidates = max(args.top_k, config.HYBRID_CANDIDATES)
+    top_k = args.top_k
+
+    def dense(question, k):
+        [(row, dist)] = retrieval._search(state, [question], k)
+        return row[row >= 0], dist[row >= 0]
+
+    methods = {
+        "dense": lambda q: dense(q, top_k)[0],
+        "bm25": lambda q: bm25.search(q, top_k, exclude=state.deleted)[0],
+        "hybrid": lambda q: retrieval.fuse(
+            *dense(q, candidates), bm25.search(q, candidates, exclude=state.deleted)[0], top_k, config.HYBRID_RRF_K
+        )[0],
+    }
+
+    relevant, scan_latencies = [], []
+    deleted = set(state.deleted.tolist())
+    for query in queries:
+        start = time.perf_counter()
+        phrase = query["phrase"].lower()
+        relevant.append({
+            row for row, chunk in enumerate(state.chunks) if row not in deleted and phrase in chunk.lower()
+        })
+        scan_latencies.append(time.perf_counter() - start)
+
+    rows = [dict(summarize(scan_latencies), method="substring scan", hit_at_k="", precision="")]
+    for name, search in methods.items():
+        search(queries[0]["question"])    # warm-up
+        latencies, hits, precision = [], 0, []
+        for query, wanted in zip(queries, relevant):
+            start = time.perf_counter()
+            found = search(query["question"]).tolist()
+            latencies.append(time.perf_counter() - start)
+            matches = sum(row in wanted for row in found)
+            hits += matches > 0
+            precision.append(matches / len(found) if found else 0.0)
+        rows.append(dict(
+            summarize(latencies), method=name,
+            hit_at_k=hits / len(queries), precision=sum(precision) / len(precision)
+        ))
+
+    print(f"{len(state.chunks)} chunks, {len(queries)} queries, k={top_k}")
+    print_table("Retrieval", rows, ["method", "hit_at_k", "precision", "mean_ms", "p50_ms", "p99_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+End-to-end benchmark of the ask pipeline with regression gates.
+
+Runs a fixed question set (on-topic questions, repeats, paraphrases and
+off-topic questions) through the same steps as /api/ask, on the real index
+and models: check_cache, retrieve, the confidence threshold / apply_refusal,
+generate and save_to_cache. Reports:
+
+- throughput: embedding (questions/s), FAISS search (queries/s), decode (tokens/s)
+- latency percentiles of retrieval, generation and whole requests
+- memory high-water mark of the process
+- refusal rate and cache hit rate
+
+Results are written as JSON (--output) and can be compared against a stored
+baseline (--baseline); the run fails (exit code 1) when a metric regresses by
+more than its tolerance in GATES. Tolerances can be overridden per metric:
+--threshold request_p95_ms=0.5 --threshold refusal_rate=0.1
+
+The cache runs against a throwaway database (BENCH_DATABASE_NAME, default
+nlpassist_bench; its cache collection is dropped before and after), with
+write-behind off so each answer is cached before the next question.
+--no-cache skips the cache steps when MongoDB is not available.
+
+Usage: python benchmarks/regression_suite.py [--output results.json] [--baseline baseline.json]
+           [--questions questions.json] [--repeats 3] [--no-cache]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from datetime import datetime, timezone
+
+# Never touch the application database or the shared state of running workers
+os.environ["DATABASE_NAME"] = os.getenv("BENCH_DATABASE_NAME", "nlpassist_bench")
+os.environ["WRITE_BEHIND_ENABLED"] = "false"
+os.environ["SHARED_STATE_BACKEND"] = "memory"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import percentile, print_table
+
+import config
+import metrics
+from cache_manager import apply_refusal, check_cache, save_to_cache
+from rag import retrieve as retrieval
+from rag.generate import REFUSAL, generate
+
+QUESTIONS = [
+    "What is supervised learning?",
+    "What is unsupervised learning?",
+    "What is Natural Language Processing?",
+    "How do transformers use self-attention?",
+    "What are convolutional neural networks used for?",
+    "What is breadth-first search?",
+    "What is Retrieval-Augmented Generation?",
+    "How are neural networks trained?",
+    "What is overfitting?",
+    "What are word embeddings?",
+    # Repeats and paraphrases, served from cache when the original was answered
+    "what is supervised learning",
+    "What is  Natural Language Processing ?",
+    "Can you explain what supervised learning is?",
+    "What is RAG (retrieval-augmented generation)?",
+    # Off-topic questions, which should be refused
+    "Who won the 1998 football world cup?",
+    "What is the capital of Australia?",
+    "How do I bake sourdough bread?",
+]
+
+# metric -> (better direction, tolerance, relative?) for --baseline comparisons
+GATES = {
+    "embedding_qps": ("higher", 0.25, True),
+    "search_qps": ("higher", 0.25, True),
+    "decode_tokens_per_s": ("higher", 0.25, True),
+    "retrieve_p95_ms": ("lower", 0.25, True),
+    "generate_p95_ms": ("lower", 0.25, True),
+    "request_p95_ms": ("lower", 0.25, True),
+    "max_rss_mb": ("lower", 0.15, True),
+    # Refusals shifting either way mean the threshold, prompt or index changed behaviour
+    "refusal_rate": ("either", 0.05, False),
+    "cache_hit_rate": ("higher", 0.05, False),
+}
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(name, latencies):
+    return {f"{name}_p{pct}_ms": 1000 * percentile(latencies, pct) for pct in (50, 95, 99)}
+
+
+def measure_throughput(questions, repeats):
+    """Embedding and FAISS search throughput, without the memo"""
+    state = retrieval.current_state()
+    retrieval.embed_questions(questions[:1])    # warm-up
+    embed_time = search_time = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        vectors = retrieval.embed_questions(questions)
+        embed_time += time.perf_counter() - start
+        start = time.perf_counter()
+        for vector in vectors:
+            state.search(vector[None, :], config.TOP_K)
+        search_time += time.perf_counter() - start
+    total = len(questions) * repeats
+    return {"embedding_qps": total / embed_time, "search_qps": total / search_time}
+
+
+def answer(question, use_cache):
+    """One question through the /api/ask steps; returns its outcome and timings"""
+    metrics.start_request()
+    start = time.perf_counter()
+    outcome = {"question": question, "cached": False, "refused": False, "min_distance": None}
+    if use_cache and check_cache(question):
+        outcome["cached"] = True
+        outcome["request_ms"] = 1000 * (time.perf_counter() - start)
+        return outcome
+
+    retrieve_start = time.perf_counter()
+    sources, scores, source_ids = retrieval.retrieve_with_ids(question, top_k=config.TOP_K)
+    outcome["retrieve_ms"] = 1000 * (time.perf_counter() - retrieve_start)
+    min_score = float(min(scores)) if len(scores) > 0 else float("inf")
+    outcome["min_distance"] = min_score if min_score != float("inf") else None
+
+    if min_score >= config.CONFIDENCE_THRESHOLD:
+        apply_refusal("", source_ids, scores)
+        outcome["refused"] = True
+    else:
+        tokens_before = metrics.GENERATED_TOKENS_TOTAL.total()
+        generate_start = time.perf_counter()
+        text = generate(question, sources, scores)
+        outcome["generate_ms"] = 1000 * (time.perf_counter() - generate_start)
+        outcome["decode_ms"] = 1000 * metrics.request_breakdown().get("t5_decode", 0.0)
+        outcome["decoded_tokens"] = metrics.GENERATED_TOKENS_TOTAL.total() - tokens_before
+        outcome["refused"] = REFUSAL in text
+        outcome["answer_words"] = len(text.split())
+        if use_cache and not outcome["refused"]:
+            save_to_cache(question, text, "High", source_ids, scores)
+    outcome["request_ms"] = 1000 * (time.perf_counter() - start)
+    return outcome
+
+
+def run(questions, repeats, use_cache):
+    # Memoized embeddings and searches would hide the cost being measured
+    retrieval.memo = None
+    retrieval.load()
+    if use_cache:
+        from models import cache_collection
+        cache_collection.drop()
+
+    results = measure_throughput(questions, repeats)
+    # The first answer pays for loading FLAN-T5; keep it out of the timings
+    generate(questions[0], retrieval.retrieve(questions[0], top_k=config.TOP_K)[0])
+    outcomes = [answer(question, use_cache) for question in questions]
+    if use_cache:
+        cache_collection.drop()
+
+    generated = [o for o in outcomes if "generate_ms" in o]
+    decode_seconds = sum(o["decode_ms"] for o in generated) / 1000
+    results["decode_tokens_per_s"] = (
+        sum(o["decoded_tokens"] for o in generated) / decode_seconds if decode_seconds else 0.0
+    )
+    results.update(percentiles("retrieve", [o["retrieve_ms"] / 1000 for o in outcomes if "retrieve_ms" in o]))
+    results.update(percentiles("generate", [o["generate_ms"] / 1000 for o in generated]))
+    results.update(percentiles("request", [o["request_ms"] / 1000 for o in outcomes]))
+    results["max_rss_mb"] = max_rss_mb()
+    answered = [o for o in outcomes if not o["cached"]]
+    results["refusal_rate"] = sum(o["refused"] for o in answered) / len(answered) if answered else 0.0
+    results["cache_hit_rate"] = sum(o["cached"] for o in outcomes) / len(outcomes) if use_cache else None
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "TOP_K": config.TOP_K,
+            "CONFIDENCE_THRESHOLD": config.CONFIDENCE_THRESHOLD,
+            "FAISS_INDEX_PATH": config.FAISS_INDEX_PATH,
+            "INDEX_VERSION": retrieval.current_state().version,
+            "HYBRID_RETRIEVAL": config.HYBRID_RETRIEVAL,
+            "GENERATION_BACKEND": config.GENERATION_BACKEND,
+            "EMBEDDING_BACKEND": config.EMBEDDING_BACKEND,
+            "CONTEXT_PACKING": config.CONTEXT_PACKING,
+        },
+        "metrics": results,
+        "questions": outcomes,
+    }
+
+
+def compare(current, baseline, gates):
+    """One row per gated metric; a row fails when it regressed beyond its tolerance"""
+    rows = []
+    for name, (better, tolerance, relative) in gates.items():
+        new, old = current["metrics"].get(name), baseline["metrics"].get(name)
+        if new is None or old is None:
+            continue
+        change = (new - old) / old if relative and old else new - old
+        if better == "higher":
+            failed = change < -tolerance
+        elif better == "lower":
+            failed = change > tolerance
+        else:
+            failed = abs(change) > tolerance
+        rows.append({
+            "metric": name, "baseline": float(old), "current": float(new),
+            "change": f"{change:+.1%}" if relative else f"{change:+.3f}",
+            "tolerance": f"{tolerance:.0%}" if relative else f"{tolerance:.3f}",
+            "status": "FAIL" if failed else "ok",
+        })
+    return rows
+
+
+def refusal_flips(current, baseline):
+    """Questions answered in one run and refused in the other"""
+    before = {o["question"]: o["refused"] for o in baseline.get("questions", []) if not o["cached"]}
+    return [
+        (o["question"], before[o["question"]], o["refused"])
+        for o in current["questions"]
+        if not o["cached"] and o["question"] in before and before[o["question"]] != o["refused"]
+    ]
+
+
+def parse_thresholds(overrides):
+    gates = dict(GATES)
+    for override in overrides:
+        name, _, value = override.partition("=")
+        if name not in gates:
+            raise SystemExit(f"Unknown metric {name!r}; gated metrics: {', '.join(gates)}")
+        better, _, relative = gates[name]
+        gates[name] = (better, float(value), relative)
+    return gates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ask pipeline benchmark with regression gates")
+    parser.add_argument("--questions", help="JSON list of questions")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes for the throughput measurements")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against the results JSON of an earlier run")
+    parser.add_argument("--threshold", action="append", default=[], metavar="METRIC=TOLERANCE",
+                        help="Override a gate tolerance (relative for throughput, latency and memory)")
+    parser.add_argument("--no-cache", action="store_true", help="Skip the cache steps (no MongoDB needed)")
+    args = parser.parse_args()
+
+    gates = parse_thresholds(args.threshold)
+    questions = QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = json.load(f)
+
+    current = run(questions, args.repeats, not args.no_cache)
+    results = current["metrics"]
+    print(f"{len(questions)} questions, TOP_K={config.TOP_K}, CONFIDENCE_THRESHOLD={config.CONFIDENCE_THRESHOLD}")
+    print_table("Throughput", [results], ["embedding_qps", "search_qps", "decode_tokens_per_s", "max_rss_mb"])
+    print_table("Latency", [
+        {"stage": stage, **{f"p{pct}_ms": results[f"{stage}_p{pct}_ms"] for pct in (50, 95, 99)}}
+        for stage in ("retrieve", "generate", "request")
+    ], ["stage", "p50_ms", "p95_ms", "p99_ms"])
+    print_table("Outcomes", [results], ["refusal_rate", "cache_hit_rate"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\n📝 Results written to {args.output}")
+
+    if not args.baseline:
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(current, baseline, gates)
+    print_table(f"Against baseline {args.baseline}", rows,
+                ["metric", "baseline", "current", "change", "tolerance", "status"])
+    for question, was_refused, refused in refusal_flips(current, baseline):
+        print(f"  {'answered -> refused' if refused else 'refused -> answered'}: {question}")
+    if any(row["status"] == "FAIL" for row in rows):
+        print("\n❌ Regression beyond tolerance")
+        sys.exit(1)
+    print("\n✅ Within tolerance of the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Paraphrase benchmark for the semantic cache tier.
+
+Seeds a SemanticCache with canonical questions, then looks up paraphrases
+(which should hit) and unrelated questions (which should miss) at several
+thresholds. Reports hit rate, false-hit rate and lookup latency next to the
+exact-match baseline, which never hits on a paraphrase.
+
+Usage: python benchmarks/semantic_cache_bench.py [--thresholds 0.8 0.85 0.9]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import summarize, timed, print_table
+
+from semantic_cache import SemanticCache
+from rag.retrieve import get_embedder
+
+
+# (cached question, paraphrases that should be answered by it)
+PARAPHRASES = [
+    ("What is supervised learning?", [
+        "Can you explain supervised learning?",
+        "what is supervised learning",
+        "Define supervised learning.",
+    ]),
+    ("What is Retrieval-Augmented Generation?", [
+        "What does Retrieval-Augmented Generation mean?",
+        "Explain retrieval augmented generation",
+        "What is RAG in NLP?",
+    ]),
+    ("How do transformers use self-attention?", [
+        "How does self-attention work in transformers?",
+        "Explain the self-attention mechanism of transformer models",
+    ]),
+    ("What are convolutional neural networks used for?", [
+        "What are CNNs used for?",
+        "Where are convolutional neural networks applied?",
+    ]),
+    ("What is k-means clustering?", [
+        "Explain the k-means clustering algorithm",
+        "How does k-means group data points?",
+    ]),
+    ("What is breadth-first search?", [
+        "Explain breadth first search",
+        "How does BFS work?",
+    ]),
+    ("What is stop-word removal?", [
+        "Why do we remove stop words?",
+        "Explain stop word removal in text preprocessing",
+    ]),
+    ("What is edge detection in images?", [
+        "How is edge detection used in computer vision?",
+        "Explain image edge detection",
+    ]),
+]
+
+# Questions that must not be served from any of the cached answers above
+UNRELATED = [
+    "What is unsupervised learning?",
+    "What is depth-first search?",
+    "What is TF-IDF?",
+    "What is face recognition?",
+    "How are neural networks trained?",
+    "What is explainability in AI?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.8, 0.85, 0.9, 0.95])
+    args = parser.parse_args()
+
+    cache = SemanticCache(get_embedder().encode)
+    canonical = [q for q, _ in PARAPHRASES]
+    _, build_time = timed(cache.rebuild, canonical)
+    print(f"Indexed {len(cache)} cached questions in {build_time * 1000:.1f} ms")
+
+    exact = set(canonical)
+    rows = []
+    for threshold in args.thresholds:
+        hits = correct = false_hits = 0
+        latencies = []
+        total = 0
+        for cached_question, paraphrases in PARAPHRASES:
+            for paraphrase in paraphrases:
+                total += 1
+                hit, elapsed = timed(cache.lookup, paraphrase, threshold)
+                latencies.append(elapsed)
+                if hit:
+                    hits += 1
+                    correct += hit[0] == cached_question
+        for question in UNRELATED:
+            hit, elapsed = timed(cache.lookup, question, threshold)
+            latencies.append(elapsed)
+            false_hits += bool(hit)
+
+        stats = summarize(latencies)
+        rows.append({
+            "threshold": threshold,
+            "hit_rate": hits / total,
+            "correct_rate": correct / total,
+            "false_hit_rate": false_hits / len(UNRELATED),
+            "p50_ms": stats["p50_ms"],
+            "p99_ms": stats["p99_ms"],
+        })
+
+    exact_hits = sum(p in exact for _, ps in PARAPHRASES for p in ps)
+    total = sum(len(ps) for _, ps in PARAPHRASES)
+    print(f"Exact-match baseline hit rate: {exact_hits / total:.2f}")
+    print_table("Semantic cache (paraphrase set)", rows,
+                ["threshold", "hit_rate", "correct_rate", "false_hit_rate", "p50_ms", "p99_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Concurrency check for the shared rate limit counters and hot cache.
+
+Starts several worker processes that hit the same rate limit at the same
+moment, through the same `limits` fixed-window limiter the API uses, and
+counts how many hits each process admitted:
+
+- memory: per-process counters (the old storage_uri="memory://"), where every
+          process admits the full limit
+- sqlite / mongo: the shared store, where all processes together must admit
+          exactly the limit
+
+It then checks that a hot cache entry put by one process is served by
+another, and that an invalidation in one process removes it for all.
+Exits non-zero if any check fails. The mongo store uses a throwaway database
+(BENCH_DATABASE_NAME, default nlpassist_bench).
+
+Usage: python benchmarks/shared_state_check.py [--backends sqlite,mongo] [--workers 8] [--limit 50] [--hits 200]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Never run against the application database
+os.environ["DATABASE_NAME"] = os.getenv("BENCH_DATABASE_NAME", "nlpassist_bench")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import print_table
+
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+
+from hot_cache import SharedHotCache
+from shared_state import MongoStore, SQLiteStore, SharedLimitsStorage
+
+
+def make_store(backend, path):
+    if backend == "sqlite":
+        return SQLiteStore(path)
+    if backend == "mongo":
+        from models import db
+        return MongoStore(db)
+    return None
+
+
+def make_storage(backend, path):
+    if backend == "memory":
+        return MemoryStorage()
+    return SharedLimitsStorage(store=make_store(backend, path))
+
+
+def hammer(backend, path, limit, hits, key, barrier, results):
+    """Worker process: hit the limit as fast as possible, report admitted hits and latency"""
+    limiter = FixedWindowRateLimiter(make_storage(backend, path))
+    item = parse(limit)
+    barrier.wait()
+    admitted = 0
+    start = time.perf_counter()
+    for _ in range(hits):
+        admitted += limiter.hit(item, key, "ask")
+    results.put((admitted, (time.perf_counter() - start) / hits))
+
+
+def check_limits(backend, path, workers, limit, hits):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    key = f"check-{backend}-{os.getpid()}-{time.time()}"
+    processes = [
+        context.Process(target=hammer, args=(backend, path, f"{limit} per minute", hits, key, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    admitted = sum(count for count, _ in outcomes)
+    return {
+        "backend": backend,
+        "workers": workers,
+        "attempted": workers * hits,
+        "admitted": admitted,
+        "expected": limit if backend != "memory" else workers * limit,
+        "hit_us": 1e6 * sum(latency for _, latency in outcomes) / len(outcomes),
+        "ok": admitted == limit if backend != "memory" else admitted > limit,
+    }
+
+
+def put_entry(backend, path, key, payload):
+    SharedHotCache(make_store(backend, path)).put(key, payload, doc_id="doc-1")
+
+
+def invalidate_entry(backend, path):
+    SharedHotCache(make_store(backend, path)).invalidate_id("doc-1")
+
+
+def check_hot_cache(backend, path):
+    """Put in one process, read here, invalidate in another, read again"""
+    context = multiprocessing.get_context("spawn")
+    cache = SharedHotCache(make_store(backend, path))
+    cache.clear()
+    payload = {"answer": "Retrieval-augmented generation grounds answers in documents.", "scores": [0.4]}
+
+    process = context.Process(target=put_entry, args=(backend, path, "what is rag", payload))
+    process.start()
+    process.join()
+    shared = cache.get("what is rag") == payload
+
+    process = context.Process(target=invalidate_entry, args=(backend, path))
+    process.start()
+    process.join()
+    invalidated = cache.get("what is rag") is None
+    return {"backend": backend, "shared": shared, "invalidated": invalidated, "ok": shared and invalidated}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared rate limit and hot cache check across processes")
+    parser.add_argument("--backends", default="sqlite", help="Comma-separated: sqlite, mongo")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--hits", type=int, default=200, help="Hits attempted per worker")
+    args = parser.parse_args()
+
+    backends = [b for b in args.backends.split(",") if b]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shared_state.sqlite")
+        limit_rows = [check_limits(backend, path, args.workers, args.limit, args.hits)
+                      for backend in ["memory"] + backends]
+        cache_rows = [check_hot_cache(backend, path) for backend in backends]
+        if "mongo" in backends:
+            from models import db
+            db["shared_counters"].drop()
+            db["shared_entries"].drop()
+
+    print_table(f"Rate limit: {args.limit} per minute", limit_rows,
+                ["backend", "workers", "attempted", "admitted", "expected", "hit_us", "ok"])
+    print_table("Hot cache across processes", cache_rows, ["backend", "shared", "invalidated", "ok"])
+    sys.exit(0 if all(row["ok"] for row in limit_rows + cache_rows) else 1)
+
+
+if __name__ == "__main__":
+    main()
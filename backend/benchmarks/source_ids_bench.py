@@ -0,0 +1,148 @@
+"""
+Bandwidth and storage: source texts vs chunk ids.
+
+Replays a question session against the chunk store and sizes what the API
+sends and stores for each answer in both formats:
+
+- texts: every /api/ask response, cache entry and assistant message carries
+         the full text of its source chunks (the old format)
+- ids:   they carry chunk ids; each client fetches the texts of ids it has not
+         seen before from /api/chunks (once, then from its browser cache)
+
+Questions are drawn with a Zipf-like popularity, so popular questions (and
+their chunks) repeat the way they do in real traffic. Each distinct question
+cites a fixed set of TOP_K chunks. With --retrieve the chunk ids come from the
+real retriever (needs the index and embedding model) instead of random rows.
+
+Usage: python benchmarks/source_ids_bench.py [--requests 1000] [--distinct 100] [--clients 10] [--retrieve]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+from bson import BSON
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import print_table
+
+import config
+from rag.chunk_store import load_chunks, store_exists
+
+ANSWER = " ".join(["Retrieval-augmented generation grounds the answer in retrieved documents."] * 4)
+
+
+def synthetic_chunks(count, words, seed=0):
+    rng = random.Random(seed)
+    vocabulary = "retrieval transformer embedding vector index language model attention learning network".split()
+    return [" ".join(rng.choice(vocabulary) for _ in range(words)) for _ in range(count)]
+
+
+def retrieved_sources(questions, top_k):
+    from rag.retrieve import retrieve_with_ids
+    return [retrieve_with_ids(question, top_k)[2] for question in questions]
+
+
+def session(requests, distinct, clients, seed=1):
+    """(client, question index) per request, questions with Zipf-like popularity"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(distinct)]
+    return [(rng.randrange(clients), q) for q in rng.choices(range(distinct), weights, k=requests)]
+
+
+def response_bytes(source_ids, texts):
+    body = {"answer": ANSWER, "confidence": "High", "cached": False, "scores": [0.5] * len(source_ids)}
+    if texts is None:
+        body["source_ids"] = source_ids
+    else:
+        body["sources"] = [texts[i] for i in source_ids]
+    return len(json.dumps(body).encode("utf-8"))
+
+
+def stored_bytes(question, source_ids, texts):
+    """BSON size of the cache entry and assistant message for one answer"""
+    sources = {"source_ids": source_ids} if texts is None else {"sources": [texts[i] for i in source_ids]}
+    cache_entry = {"question": question, "answer": ANSWER, "confidence": "High",
+                   "scores": [0.5] * len(source_ids), "access_count": 0, **sources}
+    message = {"chat_id": "0" * 24, "role": "assistant", "content": ANSWER,
+               "metadata": {"cached": False, "confidence": "High", **sources}}
+    return len(BSON.encode(cache_entry)), len(BSON.encode(message))
+
+
+def run(chunks, cited, requests, clients):
+    totals = {"texts": {"responses": 0, "chunks": 0, "cache": 0, "messages": 0},
+              "ids": {"responses": 0, "chunks": 0, "cache": 0, "messages": 0}}
+    seen_by_client = [set() for _ in range(clients)]
+    cached_questions = set()
+    chunk_requests = 0
+    for client, q in session(requests, len(cited), clients):
+        source_ids = cited[q]
+        question = f"question {q}"
+        for mode, texts in (("texts", chunks), ("ids", None)):
+            totals[mode]["responses"] += response_bytes(source_ids, texts)
+            cache_size, message_size = stored_bytes(question, source_ids, texts)
+            totals[mode]["messages"] += message_size
+            if q not in cached_questions:
+                totals[mode]["cache"] += cache_size
+
+        cached_questions.add(q)
+        missing = [i for i in source_ids if i not in seen_by_client[client]]
+        if missing:
+            chunk_requests += 1
+            body = {"chunks": {str(i): chunks[i] for i in sorted(missing)}}
+            totals["ids"]["chunks"] += len(json.dumps(body).encode("utf-8"))
+            seen_by_client[client].update(missing)
+
+    rows = []
+    for mode, sizes in totals.items():
+        rows.append({
+            "format": mode,
+            "response_kb": sizes["responses"] / 1024,
+            "chunks_kb": sizes["chunks"] / 1024,
+            "bandwidth_kb": (sizes["responses"] + sizes["chunks"]) / 1024,
+            "cache_kb": sizes["cache"] / 1024,
+            "messages_kb": sizes["messages"] / 1024,
+        })
+    return rows, chunk_requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response and storage bytes: source texts vs chunk ids")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--distinct", type=int, default=100, help="Distinct questions in the session")
+    parser.add_argument("--clients", type=int, default=10, help="Browsers, each with its own chunk cache")
+    parser.add_argument("--chunk-words", type=int, default=375, help="Words per synthetic chunk (~500 tokens)")
+    parser.add_argument("--retrieve", action="store_true",
+                        help="Cite the chunks the retriever returns for the regression suite questions")
+    args = parser.parse_args()
+
+    if store_exists(config.CHUNK_STORE_PATH) or os.path.exists(config.CHUNKS_PICKLE_PATH):
+        chunks = load_chunks(config.CHUNK_STORE_PATH, config.CHUNKS_PICKLE_PATH)
+        print(f"📚 {len(chunks)} chunks from {config.CHUNK_STORE_PATH}")
+    else:
+        chunks = synthetic_chunks(2000, args.chunk_words)
+        print(f"📚 No chunk store found; {len(chunks)} synthetic chunks of {args.chunk_words} words")
+
+    if args.retrieve:
+        from regression_suite import QUESTIONS
+        cited = retrieved_sources(QUESTIONS, config.TOP_K)
+    else:
+        rng = random.Random(0)
+        # Popular chunks are cited by many questions
+        weights = [1 / (rank + 1) for rank in range(len(chunks))]
+        cited = [sorted(set(rng.choices(range(len(chunks)), weights, k=config.TOP_K)))
+                 for _ in range(args.distinct)]
+
+    rows, chunk_requests = run(chunks, cited, args.requests, args.clients)
+    print_table(f"{args.requests} answers, {len(cited)} distinct questions, {args.clients} clients, TOP_K={config.TOP_K}",
+                rows, ["format", "response_kb", "chunks_kb", "bandwidth_kb", "cache_kb", "messages_kb"])
+    texts, ids = rows
+    for column in ("bandwidth_kb", "cache_kb", "messages_kb"):
+        saved = texts[column] - ids[column]
+        print(f"  {column[:-3]:<10} saved {saved:,.1f} kB ({saved / texts[column]:.1%})" if texts[column] else "")
+    print(f"  /api/chunks requests: {chunk_requests} for {args.requests} answers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Startup-time benchmark for the model loading modes.
+
+Starts a fresh interpreter per mode and measures:
+- import: time to import app.py (what blocks a worker from binding)
+- health: time until /api/health answers
+- ready:  time until /api/ready returns 200 (models warm); in lazy mode this is
+          the time until the first request that loads the models completes
+
+Usage: python benchmarks/startup_bench.py [--modes eager background lazy] [--runs 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import BACKEND_DIR, print_table
+
+
+def run_child():
+    start = time.perf_counter()
+    import app as app_module
+    imported = time.perf_counter() - start
+
+    client = app_module.app.test_client()
+    client.get("/api/health")
+    health = time.perf_counter() - start
+
+    if os.environ["MODEL_LOADING"] == "lazy":
+        app_module.load_models()
+    while client.get("/api/ready").status_code != 200:
+        time.sleep(0.05)
+    ready = time.perf_counter() - start
+
+    print(json.dumps({"import_s": imported, "health_s": health, "ready_s": ready}), flush=True)
+    os._exit(0)
+
+
+def measure(mode):
+    env = dict(os.environ, MODEL_LOADING=mode, RATE_LIMIT_ENABLED="false")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup-time benchmark")
+    parser.add_argument("--modes", nargs="+", default=["eager", "background", "lazy"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    rows = []
+    for mode in args.modes:
+        runs = [measure(mode) for _ in range(args.runs)]
+        row = {"mode": mode}
+        for key in ("import_s", "health_s", "ready_s", "process_s"):
+            row[key] = sum(r[key] for r in runs) / len(runs)
+        rows.append(row)
+
+    print_table(f"Startup time (mean of {args.runs} runs)", rows,
+                ["mode", "import_s", "health_s", "ready_s", "process_s"])
+
+
+if __name__ == "__main__":
+    main()
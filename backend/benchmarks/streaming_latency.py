@@ -0,0 +1,52 @@
+"""
+Time-to-first-token vs total latency for streamed generation.
+
+Runs each question through retrieve() and generate_stream() and reports when
+the first de-duplicated token was available next to the time the full answer
+was ready (which is what /api/ask users wait for).
+
+Usage: python benchmarks/streaming_latency.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+from benchmarks.common import summarize, print_table
+
+import config
+from rag.retrieve import retrieve
+from rag.generate import generate_stream
+
+
+QUESTIONS = [
+    "What is supervised learning?",
+    "What is Natural Language Processing?",
+    "How do transformers use self-attention?",
+    "What are convolutional neural networks used for?",
+    "What is Retrieval-Augmented Generation?",
+]
+
+
+def main():
+    first_token, total = [], []
+    for question in QUESTIONS:
+        sources, _ = retrieve(question, top_k=config.TOP_K)
+        start = time.perf_counter()
+        ttft = None
+        for kind, _ in generate_stream(question, sources):
+            if kind == "token" and ttft is None:
+                ttft = time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+        first_token.append(ttft if ttft is not None else elapsed)
+        total.append(elapsed)
+
+    ttft_stats, total_stats = summarize(first_token), summarize(total)
+    print_table("Streaming generation latency", [
+        {"metric": "first_token", **{k: ttft_stats[k] for k in ("mean_ms", "p50_ms", "p99_ms")}},
+        {"metric": "full_answer", **{k: total_stats[k] for k in ("mean_ms", "p50_ms", "p99_ms")}},
+    ], ["metric", "mean_ms", "p50_ms", "p99_ms"])
+
+
+if __name__ == "__main__":
+    main()
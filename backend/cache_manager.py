@@ -1,27 +1,42 @@
+"""
+Cache tiers for NLP Assistant API: the hot cache, the MongoDB cache collection
+and the semantic cache. Lookups and saves are pipelines (see steps.py) shared
+by both front ends; check_cache / save_to_cache run them inline.
+"""
 import config
-from models import Cache
-import time
+from semantic_cache import semantic_cache, load_semantic_cache
+from hot_cache import HotCache, SharedHotCache, HotCacheSync, normalize_question
+from shared_state import get_store
+from steps import db, embed, run
+
+
+# Bounded cache in front of the MongoDB cache collection, in process or shared by all workers
+if config.HOT_CACHE_SHARED and get_store() is not None:
+    hot_cache = SharedHotCache(
+        get_store(),
+        max_entries=config.HOT_CACHE_MAX_ENTRIES,
+        ttl=config.HOT_CACHE_TTL_SECONDS
+    )
+else:
+    hot_cache = HotCache(
+        max_entries=config.HOT_CACHE_MAX_ENTRIES,
+        ttl=config.HOT_CACHE_TTL_SECONDS
+    )
+hot_cache_sync = HotCacheSync(hot_cache, interval=config.HOT_CACHE_SYNC_INTERVAL_SECONDS)
 
 
 def apply_refusal(answer, sources, scores):
     """
-    Apply refusal logic based on confidence scores and retrieved evidence.
+    Apply refusal logic based on retrieval confidence scores.
     Ensures non-empty answers before returning High confidence.
     """
     min_score = min(scores) if len(scores) > 0 else float("inf")
 
-    has_rag_evidence = any(
-        isinstance(s, str) and (
-            "Retrieval-Augmented Generation" in s or "RAG" in s
-        )
-        for s in sources
-    )
-
     # Normalize answer
     answer = answer.strip() if isinstance(answer, str) else ""
 
     # Decide confidence
-    if (min_score < config.CONFIDENCE_THRESHOLD or has_rag_evidence) and len(answer) > 20:
+    if min_score < config.CONFIDENCE_THRESHOLD and len(answer) > 20:
         return answer, sources, "High"
 
     # Fallback refusal
@@ -32,28 +47,109 @@ def apply_refusal(answer, sources, scores):
     )
 
 
+def find_cached(questions):
+    """
+    Pipeline: the cached document (or None) for each question, an exact match
+    first, then the closest paraphrase from the semantic cache. Documents carry
+    "match" ("exact" or "semantic") and "similarity".
+    """
+    found = yield db("Cache.find_many", questions)
+    results = [dict(found[q], match="exact", similarity=1.0) if q in found else None for q in questions]
 
+    misses = [i for i, cached in enumerate(results) if cached is None]
+    if misses and config.SEMANTIC_CACHE_ENABLED and len(semantic_cache):
+        hits = yield embed(
+            semantic_cache.lookup_batch, [questions[i] for i in misses], config.SEMANTIC_CACHE_THRESHOLD
+        )
+        matched = [hit[0] for hit in hits if hit]
+        found = (yield db("Cache.find_matched", matched)) if matched else {}
+        for i, hit in zip(misses, hits):
+            if hit and hit[0] in found:
+                results[i] = dict(found[hit[0]], match="semantic", similarity=hit[1])
+    return results
+
+
+def lookup_many(questions):
+    """
+    Pipeline: cached data (or None) for each question, from the hot cache or
+    MongoDB. Serving an entry counts as an access.
+    """
+    results = [None] * len(questions)
+    lookup = list(range(len(questions)))
+
+    if config.HOT_CACHE_ENABLED and hot_cache_sync.start():
+        lookup = []
+        for i, question in enumerate(questions):
+            payload = hot_cache.get(normalize_question(question))
+            if payload:
+                hot_cache.record_access(payload["cached_question"])
+                results[i] = public_result(payload)
+            else:
+                lookup.append(i)
+    if not lookup:
+        return results
+
+    found = yield from find_cached([questions[i] for i in lookup])
+
+    counts = {}
+    for i, cached in zip(lookup, found):
+        if not cached:
+            continue
+        result = cache_payload(cached)
+        if config.HOT_CACHE_ENABLED:
+            # Access counts are flushed to MongoDB in aggregate by the sync thread
+            hot_cache.put(normalize_question(questions[i]), result, doc_id=cached["_id"])
+            hot_cache.record_access(cached["question"])
+        else:
+            # Count the entry that was actually served
+            counts[cached["question"]] = counts.get(cached["question"], 0) + 1
+        results[i] = public_result(result)
+    if counts:
+        yield db("Cache.increment_access_many", counts)
+
+    return results
+
+
+def lookup(question):
+    """Pipeline: cached data for the question (or a close paraphrase of it), None if not cached"""
+    return (yield from lookup_many([question]))[0]
 
 
 def check_cache(question):
     """
-    Check if the question exists in cache.
+    Check if the question (or a close paraphrase of it) exists in cache.
     Returns cached data if found, None otherwise.
     """
-    cached = Cache.find_cached(question)
-    
-    if cached:
-        # Increment access count
-        Cache.increment_access(question)
-        return {
-            "answer": cached["answer"],
-            "sources": cached["sources"],
-            "confidence": cached["confidence"],
-            "cached": True,
-            "scores": cached.get("scores", [])
-        }
-    
-    return None
+    return run(lookup(question))
+
+
+def check_cache_batch(questions):
+    """
+    Check the cache for many questions at once.
+    Returns a list with cached data (or None) for each question.
+    """
+    return run(lookup_many(questions))
+
+
+def cache_payload(cached):
+    return {
+        "cached_question": cached["question"],
+        "answer": cached["answer"],
+        "source_ids": cached.get("source_ids", []),
+        "confidence": cached["confidence"],
+        "cached": True,
+        "cache_match": cached["match"],
+        "similarity": cached["similarity"],
+        "scores": cached.get("scores", [])
+    }
+
+
+def public_result(result):
+    """Copy of a cached result without internal bookkeeping fields"""
+    public = dict(result)
+    public.pop("cached_question", None)
+    return public
+
 
 def sanity_check(answer, question):
     q = question.lower()
@@ -64,19 +160,70 @@ def sanity_check(answer, question):
     return True
 
 
-def save_to_cache(question, answer, confidence, sources, scores):
+def store(question, answer, confidence, source_ids, scores):
     """
-    Save question-answer pair to cache if confidence is high.
+    Pipeline: save a question-answer pair to cache if confidence is high.
     Only high-confidence, in-domain answers are cached.
     """
-    # Only cache high-confidence answers
-    if confidence == "High" and sanity_check(answer, question):
-    
+    if confidence != "High" or not sanity_check(answer, question):
+        return False
+    try:
+        doc_id = yield db("Cache.save", question, answer, confidence, source_ids, scores)
+        if config.HOT_CACHE_ENABLED:
+            # Serve repeats from memory even before a deferred insert is written
+            hot_cache.put(normalize_question(question), cache_payload({
+                "question": question,
+                "answer": answer,
+                "source_ids": source_ids,
+                "confidence": confidence,
+                "match": "exact",
+                "similarity": 1.0,
+                "scores": scores.tolist() if hasattr(scores, 'tolist') else scores
+            }), doc_id=doc_id)
+        if config.SEMANTIC_CACHE_ENABLED:
+            yield embed(semantic_cache.add, question)
+        return True
+    except Exception as e:
+        print(f"Error saving to cache: {e}")
+        return False
+
+
+def store_many(entries):
+    """
+    Pipeline: bulk version of store.
+    entries: iterable of (question, answer, confidence, source_ids, scores).
+    Returns the number of entries cached.
+    """
+    accepted = [
+        entry for entry in entries
+        if entry[2] == "High" and sanity_check(entry[1], entry[0])
+    ]
+    if not accepted:
+        return 0
+    try:
+        yield db("Cache.save_many", accepted)
+        if config.SEMANTIC_CACHE_ENABLED:
+            yield embed(semantic_cache.add_many, [entry[0] for entry in accepted])
+        return len(accepted)
+    except Exception as e:
+        print(f"Error saving to cache: {e}")
+        return 0
+
+
+def save_to_cache(question, answer, confidence, source_ids, scores):
+    """Save a question-answer pair to cache if confidence is high (see store)"""
+    return run(store(question, answer, confidence, source_ids, scores))
+
+
+def save_many_to_cache(entries):
+    """Bulk version of save_to_cache; returns the number of entries cached"""
+    return run(store_many(entries))
+
+
+def warm_caches():
+    """Per-process cache setup that needs the embedder and MongoDB"""
+    if config.SEMANTIC_CACHE_ENABLED:
         try:
-            Cache.save(question, answer, confidence, sources, scores)
-            return True
+            print(f"🧠 Semantic cache ready ({load_semantic_cache()} cached questions)")
         except Exception as e:
-            print(f"Error saving to cache: {e}")
-            return False
-    
-    return False
+            print(f"⚠️ Could not load semantic cache: {e}")
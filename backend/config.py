@@ -5,22 +5,183 @@ load_dotenv()
 
 # MongoDB Configuration
 MONGO_URI = os.getenv("MONGO_URI")
-DATABASE_NAME = "nlpassist"
+DATABASE_NAME = os.getenv("DATABASE_NAME", "nlpassist")
 
 # RAG Configuration
 TOP_K = int(os.getenv("TOP_K", 3))
 CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", 1.6))
 MAX_GENERATION_LENGTH = int(os.getenv("MAX_GENERATION_LENGTH", 400))
 
+# Retrieval Artifacts
+FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "data/faiss.index")
+# Search parameters for IVF (nprobe) and HNSW (efSearch) indexes; 0 keeps the index default
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 0))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", 0))
+# Memory-mapped chunk store (<prefix>.bin + <prefix>.offsets); falls back to the pickle
+CHUNK_STORE_PATH = os.getenv("CHUNK_STORE_PATH", "data/chunks")
+CHUNKS_PICKLE_PATH = os.getenv("CHUNKS_PICKLE_PATH", "data/chunks.pkl")
+# Written by ingestion; workers reload the index when its version changes
+MANIFEST_PATH = os.getenv("MANIFEST_PATH", "data/manifest.json")
+INDEX_RELOAD_INTERVAL_SECONDS = float(os.getenv("INDEX_RELOAD_INTERVAL_SECONDS", 2))
+
+# Hybrid Retrieval: BM25 over the chunk store fused with the FAISS results by
+# reciprocal rank fusion (score = sum of 1 / (HYBRID_RRF_K + rank)). Off by default:
+# fused rankings change which chunks answers are generated from.
+HYBRID_RETRIEVAL = os.getenv('HYBRID_RETRIEVAL', 'false').lower() == 'true'
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "data/bm25")
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+
+# Adaptive Retrieval: instead of always passing TOP_K chunks to generation, keep the
+# results within RETRIEVAL_DISTANCE_MARGIN of the best dense distance (at least
+# RETRIEVAL_MIN_K, at most RETRIEVAL_MAX_K), so a dominant chunk goes alone and a close
+# field widens the context. A question whose best distance is at least
+# RETRIEVAL_HOPELESS_DISTANCE is refused right after the dense search (no BM25, no chunks).
+# Off by default: it changes which chunks answers are generated from.
+ADAPTIVE_RETRIEVAL = os.getenv('ADAPTIVE_RETRIEVAL', 'false').lower() == 'true'
+RETRIEVAL_MIN_K = int(os.getenv("RETRIEVAL_MIN_K", 1))
+RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", 5))
+RETRIEVAL_DISTANCE_MARGIN = float(os.getenv("RETRIEVAL_DISTANCE_MARGIN", 0.2))
+RETRIEVAL_HOPELESS_DISTANCE = float(os.getenv("RETRIEVAL_HOPELESS_DISTANCE", CONFIDENCE_THRESHOLD))
+
+# Document Ingestion
+INGEST_CHUNK_WORDS = int(os.getenv("INGEST_CHUNK_WORDS", 120))
+INGEST_OVERLAP_WORDS = int(os.getenv("INGEST_OVERLAP_WORDS", 20))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+INGEST_COMMIT_CHUNKS = int(os.getenv("INGEST_COMMIT_CHUNKS", 2048))
+INGEST_LOCK_PATH = os.getenv("INGEST_LOCK_PATH", "data/.ingest.lock")
+
+# Inference Backends: "torch" (fp32), "int8" (dynamic int8 quantization) or "onnx" (ONNX Runtime)
+GENERATION_BACKEND = os.getenv("GENERATION_BACKEND", "torch")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_EXPORT_DIR = os.getenv("ONNX_EXPORT_DIR", "data/onnx")
+
+# Generation Batching Configuration
+# Concurrent generations are collected for up to the window (or until the batch
+# is full) and decoded by FLAN-T5 as one padded batch.
+GENERATION_BATCHING = os.getenv('GENERATION_BATCHING', 'true').lower() == 'true'
+GENERATION_BATCH_MAX_SIZE = int(os.getenv("GENERATION_BATCH_MAX_SIZE", 8))
+GENERATION_BATCH_WINDOW_MS = float(os.getenv("GENERATION_BATCH_WINDOW_MS", 20))
+
+# Decoding
+# An answer stops after DECODE_MAX_SENTENCES sentences (0 = no limit) or at its length
+# budget: DECODE_LENGTH_BASE + DECODE_LENGTH_PER_CONTEXT_TOKEN * context tokens, capped at
+# MAX_GENERATION_LENGTH. Repetition controls are off by default (0 / 1.0, as before they
+# existed); requests opt in with "decoding" overrides, deployments with these settings.
+DECODE_NO_REPEAT_NGRAM_SIZE = int(os.getenv("DECODE_NO_REPEAT_NGRAM_SIZE", 0))
+DECODE_REPETITION_PENALTY = float(os.getenv("DECODE_REPETITION_PENALTY", 1.0))
+DECODE_MAX_SENTENCES = int(os.getenv("DECODE_MAX_SENTENCES", 8))
+DECODE_MIN_LENGTH = int(os.getenv("DECODE_MIN_LENGTH", 100))
+DECODE_LENGTH_BASE = int(os.getenv("DECODE_LENGTH_BASE", 96))
+DECODE_LENGTH_PER_CONTEXT_TOKEN = float(os.getenv("DECODE_LENGTH_PER_CONTEXT_TOKEN", 0.5))
+
+# Context Packing
+# Retrieved chunks are packed into the prompt best-first, skipping near-duplicates,
+# until the prompt (instructions and question included) reaches the token budget.
+# Off by default: packed prompts change what FLAN-T5 reads.
+CONTEXT_PACKING = os.getenv('CONTEXT_PACKING', 'false').lower() == 'true'
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 400))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.8))
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", 32))
+
+# Write-Behind Persistence
+# Messages, cache entries, access counts and activity logs are written to MongoDB
+# by a background thread in batches instead of on the request path.
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'true').lower() == 'true'
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 100))
+WRITE_BEHIND_FLUSH_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", 200))
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", 10000))
+# Retries of a batch that fails on a connection error (backoff doubles each time)
+WRITE_BEHIND_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", 3))
+WRITE_BEHIND_RETRY_BACKOFF_MS = float(os.getenv("WRITE_BEHIND_RETRY_BACKOFF_MS", 100))
+
+# Hot Cache Configuration
+# Bounded in-process LRU/TTL cache in front of the MongoDB cache collection.
+HOT_CACHE_ENABLED = os.getenv('HOT_CACHE_ENABLED', 'true').lower() == 'true'
+HOT_CACHE_MAX_ENTRIES = int(os.getenv("HOT_CACHE_MAX_ENTRIES", 500))
+HOT_CACHE_TTL_SECONDS = float(os.getenv("HOT_CACHE_TTL_SECONDS", 600))
+HOT_CACHE_SYNC_INTERVAL_SECONDS = float(os.getenv("HOT_CACHE_SYNC_INTERVAL_SECONDS", 5))
+
+# Shared State: rate limit counters (and the hot cache) shared by all worker processes.
+# "sqlite" (one host; SHARED_STATE_PATH can live on /dev/shm), "mongo" (several hosts)
+# or "memory" (per process). With "mongo" a hot cache hit costs a round trip, so the
+# hot cache stays in process unless HOT_CACHE_SHARED is set.
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "sqlite")
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "data/shared_state.sqlite")
+HOT_CACHE_SHARED = os.getenv('HOT_CACHE_SHARED', str(SHARED_STATE_BACKEND == "sqlite")).lower() == 'true'
+
+# Embedding Memo Configuration
+# Normalized question -> embedding and -> FAISS results (keyed by index version),
+# in an in-process LRU backed by a SQLite file shared by all workers ("" = memory only).
+EMBEDDING_MEMO_ENABLED = os.getenv('EMBEDDING_MEMO_ENABLED', 'true').lower() == 'true'
+EMBEDDING_MEMO_PATH = os.getenv("EMBEDDING_MEMO_PATH", "data/embedding_memo.sqlite")
+EMBEDDING_MEMO_MAX_ENTRIES = int(os.getenv("EMBEDDING_MEMO_MAX_ENTRIES", 2000))
+EMBEDDING_MEMO_MAX_STORED = int(os.getenv("EMBEDDING_MEMO_MAX_STORED", 100000))
+
+# Semantic Cache Configuration
+# Paraphrased questions reuse a cached answer when the cosine similarity of
+# their embeddings reaches the threshold.
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.9))
+
+# Async Serving (asgi.py): bounded thread pools for embedding and generation.
+# Calls beyond workers + queue are refused with 503 and Retry-After.
+EMBEDDING_POOL_WORKERS = int(os.getenv("EMBEDDING_POOL_WORKERS", 2))
+EMBEDDING_POOL_QUEUE = int(os.getenv("EMBEDDING_POOL_QUEUE", 32))
+GENERATION_POOL_WORKERS = int(os.getenv("GENERATION_POOL_WORKERS", GENERATION_BATCH_MAX_SIZE))
+GENERATION_POOL_QUEUE = int(os.getenv("GENERATION_POOL_QUEUE", 8))
+
+# Conversation Context: follow-up questions in a chat are rewritten with the subject of
+# the conversation and retrieved with their vector blended with the vectors of the last
+# CONVERSATION_WINDOW_TURNS turns (turn i back weighted CONVERSATION_PRIOR_WEIGHT ** i).
+# Windows are never read back from MongoDB. With CONVERSATION_SHARED (default: on for the
+# sqlite shared state backend) they live in the shared store and every worker sees them;
+# otherwise they are per process and a chat's requests must be routed to the same worker.
+CONVERSATION_ENABLED = os.getenv('CONVERSATION_ENABLED', 'true').lower() == 'true'
+CONVERSATION_WINDOW_TURNS = int(os.getenv("CONVERSATION_WINDOW_TURNS", 3))
+CONVERSATION_PRIOR_WEIGHT = float(os.getenv("CONVERSATION_PRIOR_WEIGHT", 0.5))
+CONVERSATION_MAX_CHATS = int(os.getenv("CONVERSATION_MAX_CHATS", 10000))
+CONVERSATION_TTL_SECONDS = float(os.getenv("CONVERSATION_TTL_SECONDS", 1800))
+CONVERSATION_SHARED = os.getenv('CONVERSATION_SHARED', str(SHARED_STATE_BACKEND == "sqlite")).lower() == 'true'
+
+# Model Loading: "eager", "background", "preload" (Gunicorn master) or "lazy"; see model_loader.py
+MODEL_LOADING = os.getenv("MODEL_LOADING", "eager")
+RETRIEVAL_DEBUG = os.getenv('RETRIEVAL_DEBUG', 'false').lower() == 'true'
+
+# Metrics: per-stage latency histograms at /api/metrics and a Server-Timing header on responses
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
 # API Configuration
 FLASK_HOST = "0.0.0.0"
 FLASK_PORT = 5000
 DEBUG = True
 
 # Logging Configuration
-LOG_ALL_QUERIES = True
 LOG_LEVEL = "INFO"
 
+# Activity Analytics
+# Every request is counted into per-minute/hour/all-time rollups (served by /api/stats);
+# only ACTIVITY_SAMPLE_RATE of requests are kept as compact raw events in activity_log,
+# all of them with LOG_ALL_QUERIES. Raw events expire after ACTIVITY_LOG_TTL_DAYS.
+LOG_ALL_QUERIES = os.getenv('LOG_ALL_QUERIES', 'false').lower() == 'true'
+ACTIVITY_SAMPLE_RATE = 1.0 if LOG_ALL_QUERIES else float(os.getenv("ACTIVITY_SAMPLE_RATE", 0.1))
+ACTIVITY_LOG_TTL_DAYS = float(os.getenv("ACTIVITY_LOG_TTL_DAYS", 30))
+ACTIVITY_ROLLUP_FLUSH_SECONDS = float(os.getenv("ACTIVITY_ROLLUP_FLUSH_SECONDS", 10))
+
+# Cache Warm-Up (warmup.py): answer the most frequent logged questions (and optionally
+# questions derived from the chunk store) into the cache before serving traffic.
+# WARMUP_ON_START runs it from gunicorn.conf.py before workers start.
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'false').lower() == 'true'
+WARMUP_MAX_QUESTIONS = int(os.getenv("WARMUP_MAX_QUESTIONS", 500))
+WARMUP_LOG_DAYS = float(os.getenv("WARMUP_LOG_DAYS", 30))
+WARMUP_CORPUS_QUESTIONS = int(os.getenv("WARMUP_CORPUS_QUESTIONS", 0))
+WARMUP_CPU_SECONDS = float(os.getenv("WARMUP_CPU_SECONDS", 600))
+WARMUP_BATCH_SIZE = int(os.getenv("WARMUP_BATCH_SIZE", GENERATION_BATCH_MAX_SIZE))
+WARMUP_THREADS = int(os.getenv("WARMUP_THREADS", 0))
+WARMUP_STATE_PATH = os.getenv("WARMUP_STATE_PATH", "data/warmup_state.json")
+
 # Security Configuration
 API_KEY = os.getenv('API_KEY', 'nlp-assistant-secret-key-change-in-production')
 REQUIRE_API_KEY = os.getenv('REQUIRE_API_KEY', 'false').lower() == 'true'
@@ -28,7 +189,16 @@ RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
 RATE_LIMIT_GLOBAL = os.getenv('RATE_LIMIT_GLOBAL', '100 per hour')
 RATE_LIMIT_ASK = os.getenv('RATE_LIMIT_ASK', '20 per minute')
 RATE_LIMIT_CHAT = os.getenv('RATE_LIMIT_CHAT', '50 per minute')
+RATE_LIMIT_BATCH = os.getenv('RATE_LIMIT_BATCH', '10 per minute')
+
+# Pagination for /api/chats and /api/chats/<id> (?limit=&cursor=)
+CHATS_PAGE_SIZE = int(os.getenv("CHATS_PAGE_SIZE", 50))
+MESSAGES_PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 200))
+MONGO_CREATE_INDEXES = os.getenv('MONGO_CREATE_INDEXES', 'true').lower() == 'true'
 
 # Input Validation
 MAX_QUESTION_LENGTH = 500
 MAX_TITLE_LENGTH = 100
+MAX_BATCH_QUESTIONS = int(os.getenv("MAX_BATCH_QUESTIONS", 256))
+MAX_CHUNK_IDS = int(os.getenv("MAX_CHUNK_IDS", 100))
@@ -0,0 +1,338 @@
+"""
+Conversation windows for NLP Assistant API
+Follow-up questions ("what about its limitations?") only make sense next to
+the turns before them. A small window of each chat's latest turns (the
+question asked, its standalone form, the conversation subject and the query
+embedding) is kept in the shared store (CONVERSATION_SHARED) or per process,
+updated as the turn's messages are created, so a follow-up is resolved
+without reading the chat history from MongoDB. Per-process windows need
+sticky routing: with several workers a follow-up answered by another worker
+than the chat's last turn is treated as a new question.
+
+A follow-up is rewritten into a standalone question using the subject of the
+conversation, and its query vector is blended with the vectors of the earlier
+turns before the FAISS search (see rag.retrieve.retrieve_with_context).
+Windows are bounded (CONVERSATION_MAX_CHATS chats, LRU) and expire after
+CONVERSATION_TTL_SECONDS without a new turn; a chat whose window is gone is
+treated as a new conversation.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+from shared_state import get_store
+
+# Pronouns that stand for the conversation's subject in a follow-up. "this"/"that"
+# (relative words or determiners far more often than references) only count as the
+# whole rest of an elliptical question ("tell me more about this").
+PRONOUNS = {"it", "they", "them"}
+POSSESSIVES = {"its", "their"}
+DEMONSTRATIVES = {"this", "that", "these", "those"}
+# Words that may come before a pronoun in subject position ("How is it trained?")
+LEADING = {
+    "what", "which", "who", "when", "where", "why", "how", "is", "are", "was", "were", "do",
+    "does", "did", "can", "could", "should", "would", "will", "has", "have", "had", "and", "so",
+}
+# "it" followed by these is the expletive of a clause ("Is it true that ...", "Is it possible to ...")
+CLAUSE_WORDS = {"that", "to", "whether", "if"}
+# Openers of elliptical follow-ups; the rest of the question (if any) is what is asked about
+OPENERS = ("what about", "how about", "and what about", "and", "what else about", "what else",
+           "tell me more about", "tell me more", "more about")
+# Longest question whose pronoun is read as a reference, and longest elliptical rest
+MAX_FOLLOW_UP_WORDS = 12
+MAX_ELLIPSIS_WORDS = 4
+QUESTION_WORDS = {
+    "what", "which", "who", "whom", "whose", "when", "where", "why", "how", "is", "are", "was",
+    "were", "do", "does", "did", "can", "could", "should", "would", "will", "explain", "describe",
+    "define", "tell", "me", "about", "the", "a", "an", "of", "in", "on", "for", "to", "and", "or",
+    "you", "please", "difference", "between", "than", "with", "from", "by", "as", "true", "possible",
+} | PRONOUNS | POSSESSIVES | DEMONSTRATIVES
+# Verbs that end the subject of a question ("How do transformers use self-attention?")
+VERBS = {
+    "use", "uses", "used", "work", "works", "help", "helps", "learn", "learns", "differ", "differs",
+    "compare", "compares", "mean", "means", "meant", "train", "trained", "improve", "improves",
+    "have", "has", "handle", "handles", "apply", "applied", "relate", "relates", "affect", "affects",
+}
+_WORD = re.compile(r"[\w\-']+")
+
+
+class Turn:
+    __slots__ = ("question", "query", "subject", "vector")
+
+    def __init__(self, question, query, subject, vector=None):
+        self.question = question    # as asked
+        self.query = query          # standalone form used for cache lookup and retrieval
+        self.subject = subject      # what the conversation is about at this turn
+        self.vector = vector        # embedding of query (filled lazily on cache hits)
+
+
+def subject_of(query):
+    """
+    First run of content words in a standalone question: "What is BERT?" ->
+    "BERT", "How do transformers use self-attention?" -> "transformers"
+    """
+    run = []
+    for word in _WORD.findall(query):
+        if word.lower() in QUESTION_WORDS or word.lower() in VERBS:
+            if run:
+                break
+            continue
+        run.append(word)
+    return " ".join(run)
+
+
+def _opener(question):
+    lowered = question.lower()
+    for opener in OPENERS:
+        if lowered == opener or lowered.startswith(opener + " "):
+            return opener
+    return None
+
+
+def _reference(question):
+    """
+    The pronoun a question refers back with, as a regex match, or None. Only a
+    pronoun standing where the question's own subject would be counts: after
+    nothing but question words ("Its limitations?", "How is it trained?") or
+    last in a short question ("Can you explain it?").
+    """
+    words = list(_WORD.finditer(question))
+    if len(words) > MAX_FOLLOW_UP_WORDS:
+        return None
+    lowered = [m.group(0).lower() for m in words]
+    for i, word in enumerate(lowered):
+        if word not in PRONOUNS and word not in POSSESSIVES:
+            continue
+        if i == len(lowered) - 1 and word in ("it", "them") and i > 0:
+            return words[i]
+        if word == "them" or not all(w in LEADING for w in lowered[:i]):
+            continue
+        if word == "it" and CLAUSE_WORDS & set(lowered[i + 1:i + 4]):
+            continue
+        return words[i]
+    return None
+
+
+def _ellipsis(question):
+    """(question without trailing punctuation, opener, rest) for "what about X?" follow-ups, or None"""
+    stripped = question.strip().rstrip(" ?!.")
+    opener = _opener(stripped)
+    if opener is None:
+        return None
+    rest = stripped[len(opener):].strip()
+    words = [w.lower() for w in _WORD.findall(rest)]
+    # "And what is GPT?" is a question of its own
+    if len(words) > MAX_ELLIPSIS_WORDS or (words and words[0] in LEADING):
+        return None
+    # "what about that paper?" points at something other than the subject
+    if len(words) > 1 and words[0] in DEMONSTRATIVES:
+        return None
+    return stripped, opener, rest
+
+
+def is_follow_up(question):
+    """A question that refers back to the conversation (a pronoun as its subject, or "what about ...")"""
+    return _reference(question) is not None or _ellipsis(question) is not None
+
+
+def _possessive(subject):
+    return f"{subject}'" if subject.endswith("s") else f"{subject}'s"
+
+
+def rewrite(question, history):
+    """
+    (standalone question, subject) for a question given the window (most recent
+    turn first). Questions that are not follow-ups (or have no history) are
+    returned as is, with their own subject (or the conversation's, if they have
+    none).
+    - the referring pronoun is replaced by the subject: "How is it trained?" ->
+      "How is BERT trained?"; other pronouns and "this"/"that" are left alone
+    - "and/what about X?" asks the previous question about X when X is a name
+      ("and GPT?" after "What is BERT?" -> "What is GPT?"), and otherwise asks
+      about X of the subject ("what about limitations?" -> "what about
+      limitations of BERT?"); "what about its/this ..." refers to the subject
+    """
+    subject = history[0].subject if history else ""
+    if not subject:
+        return question, subject_of(question)
+
+    ellipsis = _ellipsis(question)
+    if ellipsis is not None:
+        stripped, opener, rest = ellipsis
+        if not rest:
+            return f"{stripped} about {subject}?", subject
+        head, words = stripped[:len(stripped) - len(rest)], rest.split()
+        first = words[0].lower()
+        if len(words) == 1 and (first in PRONOUNS or first in DEMONSTRATIVES):
+            return f"{head}{subject}?", subject
+        if first in POSSESSIVES:
+            return f"{head}{' '.join([_possessive(subject)] + words[1:])}?", subject
+        previous = history[0].query
+        if any(c.isupper() for c in rest) and subject in previous:
+            # The same question about something else, which becomes the subject
+            return previous.replace(subject, rest), rest
+        return f"{stripped} of {subject}?", subject
+
+    match = _reference(question)
+    if match is not None:
+        replacement = _possessive(subject) if match.group(0).lower() in POSSESSIVES else subject
+        return question[:match.start()] + replacement + question[match.end():], subject
+    return question, subject_of(question) or subject
+
+
+def blend(vector, prior_vectors, weight):
+    """
+    The query vector plus the earlier turns' vectors (most recent first) with
+    weights weight, weight^2, ..., rescaled to the query vector's norm so L2
+    distances stay comparable with CONFIDENCE_THRESHOLD.
+    """
+    blended = vector.astype("float32").copy()
+    for i, prior in enumerate(prior_vectors):
+        blended += weight ** (i + 1) * np.asarray(prior, dtype="float32")
+    norm = np.linalg.norm(blended)
+    if norm > 0:
+        blended *= np.linalg.norm(vector) / norm
+    return blended
+
+
+class ConversationWindows:
+    """Per-chat windows of recent turns, bounded by chat count (LRU) and idle time"""
+
+    def __init__(self, max_chats=10000, max_turns=3, ttl=1800, clock=time.monotonic):
+        self.max_chats = max(1, max_chats)
+        self.max_turns = max(1, max_turns)
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._windows = OrderedDict()   # chat_id -> (last turn at, [Turn], most recent first)
+        self.follow_ups = 0
+        self.evictions = 0
+
+    def history(self, chat_id):
+        """Recent turns of a chat, most recent first ([] if none or expired)"""
+        with self._lock:
+            window = self._windows.get(chat_id)
+            if window is None:
+                return []
+            if window[0] + self.ttl <= self._clock():
+                del self._windows[chat_id]
+                return []
+            self._windows.move_to_end(chat_id)
+            return list(window[1])
+
+    def add_turn(self, chat_id, question, query, subject, vector=None):
+        """Record a turn (query and subject as returned by rewrite)"""
+        turn = Turn(question, query, subject, vector)
+        with self._lock:
+            _, turns = self._windows.pop(chat_id, (None, []))
+            self._windows[chat_id] = (self._clock(), [turn] + turns[:self.max_turns - 1])
+            self.follow_ups += query != question
+            while len(self._windows) > self.max_chats:
+                self._windows.popitem(last=False)
+                self.evictions += 1
+
+    def prior_vectors(self, history, embed):
+        """Query vectors of the turns in history, embedding (once) those without one"""
+        missing = [turn for turn in history if turn.vector is None]
+        if missing:
+            for turn, vector in zip(missing, embed([turn.query for turn in missing])):
+                turn.vector = vector
+        return [turn.vector for turn in history]
+
+    def forget(self, chat_id):
+        with self._lock:
+            self._windows.pop(chat_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {"chats": len(self._windows), "follow_ups": self.follow_ups, "evictions": self.evictions}
+
+    def __len__(self):
+        return len(self._windows)
+
+
+class SharedConversationWindows(ConversationWindows):
+    """
+    ConversationWindows kept in a shared store (see shared_state.py), so every
+    worker sees a chat's turns wherever the previous turn was answered. Only
+    question, query and subject are stored; prior_vectors embeds the queries
+    again, which the embedding memo turns into lookups. The follow-up counter
+    stays per process.
+    """
+
+    NAMESPACE = "conversations"
+
+    def __init__(self, store, max_chats=10000, max_turns=3, ttl=1800):
+        super().__init__(max_chats, max_turns, ttl)
+        self.store = store
+
+    def history(self, chat_id):
+        try:
+            turns = self.store.get_value(self.NAMESPACE, str(chat_id))
+        except Exception as e:
+            print(f"⚠️ Shared conversation window read failed: {e}")
+            turns = None
+        return [Turn(question, query, subject) for question, query, subject in turns or []]
+
+    def add_turn(self, chat_id, question, query, subject, vector=None):
+        turns = [[turn.question, turn.query, turn.subject] for turn in self.history(chat_id)]
+        turns = [[question, query, subject]] + turns[:self.max_turns - 1]
+        try:
+            evicted = self.store.set_value(
+                self.NAMESPACE, str(chat_id), turns, self.ttl, tag=chat_id, max_entries=self.max_chats
+            )
+        except Exception as e:
+            # The next turn is answered as a new conversation
+            print(f"⚠️ Shared conversation window write failed: {e}")
+            return
+        with self._lock:
+            self.follow_ups += query != question
+            self.evictions += evicted
+
+    def forget(self, chat_id):
+        try:
+            self.store.delete_tag(self.NAMESPACE, chat_id)
+        except Exception as e:
+            print(f"⚠️ Shared conversation window delete failed: {e}")
+
+    def stats(self):
+        stats = super().stats()
+        stats["chats"] = len(self)
+        stats["shared"] = True
+        return stats
+
+    def __len__(self):
+        try:
+            return self.store.count(self.NAMESPACE)
+        except Exception:
+            return 0
+
+
+if config.CONVERSATION_SHARED and get_store() is not None:
+    conversations = SharedConversationWindows(
+        get_store(),
+        max_chats=config.CONVERSATION_MAX_CHATS,
+        max_turns=config.CONVERSATION_WINDOW_TURNS,
+        ttl=config.CONVERSATION_TTL_SECONDS
+    )
+else:
+    # Per process: a chat's follow-ups need to reach the worker that answered its last turn
+    conversations = ConversationWindows(
+        max_chats=config.CONVERSATION_MAX_CHATS,
+        max_turns=config.CONVERSATION_WINDOW_TURNS,
+        ttl=config.CONVERSATION_TTL_SECONDS
+    )
+
+
+def resolve(chat_id, question):
+    """
+    (query, subject, history) for a question asked in a chat: query is the
+    standalone form used for cache lookup, retrieval and generation
+    """
+    history = conversations.history(chat_id) if chat_id and config.CONVERSATION_ENABLED else []
+    query, subject = rewrite(question, history)
+    return query, subject, history
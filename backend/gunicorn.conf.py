@@ -0,0 +1,55 @@
+"""
+Gunicorn configuration for the preloaded-fork serving mode.
+
+The app (and every model) is loaded once in the master process, then workers
+are forked from it and share the model memory copy-on-write. Per-process
+state (MongoDB connections, background threads, the semantic cache) is set up
+in each worker after the fork.
+
+Usage: cd backend && gunicorn -c gunicorn.conf.py app:app
+"""
+import gc
+import os
+import subprocess
+import sys
+
+# Must be set before the app module is imported by the master
+os.environ.setdefault("MODEL_LOADING", "preload")
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+
+
+def on_starting(server):
+    # Fill the answer cache before any worker takes traffic (see warmup.py)
+    if os.getenv("WARMUP_ON_START", "false").lower() == "true":
+        backend_dir = os.path.dirname(os.path.abspath(__file__))
+        result = subprocess.run([sys.executable, "warmup.py"], cwd=backend_dir)
+        if result.returncode:
+            server.log.error(f"Cache warm-up failed (exit code {result.returncode}, see the traceback above); "
+                             "serving with a cold cache")
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the GC's reach so collections in the
+    # workers do not touch (and therefore copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    torch_threads = int(os.getenv("TORCH_THREADS_PER_WORKER", 0))
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+
+def post_worker_init(worker):
+    import app
+    import config
+    if config.MONGO_CREATE_INDEXES:
+        app.ensure_indexes()
+    app.warm_caches()
@@ -0,0 +1,277 @@
+"""
+In-process hot cache for NLP Assistant API
+A bounded LRU/TTL map of normalized question -> cached answer payload that
+sits in front of the MongoDB cache collection. Access counts are aggregated
+in memory and flushed to MongoDB periodically, and entries are invalidated
+when documents in the cache collection are updated or deleted.
+SharedHotCache keeps the entries in the shared store instead, for all workers.
+Entries are only served once the cache generation they were stored under has
+been checked against MongoDB's (see HotCacheSync).
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+class HotCache:
+    def __init__(self, max_entries=500, ttl=600, clock=time.monotonic):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, doc_id, payload)
+        self._keys_by_id = {}           # doc_id -> set of keys
+        self._pending_access = {}       # cached question -> access count not yet flushed
+        self._generation = None         # cache generation the entries were stored under
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the payload for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= self._clock():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, payload, doc_id=None):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, doc_id, payload)
+            if doc_id is not None:
+                self._keys_by_id.setdefault(doc_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, doc_id, _ = self._entries.pop(key)
+        keys = self._keys_by_id.get(doc_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_id[doc_id]
+
+    def invalidate_id(self, doc_id):
+        """Drop every entry served from the given cache document"""
+        with self._lock:
+            for key in list(self._keys_by_id.get(doc_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._keys_by_id.clear()
+
+    def sync_generation(self, generation):
+        """Drop every entry if the cache generation changed; returns whether it did"""
+        with self._lock:
+            # A new process starts empty, so its first generation is only recorded
+            changed = self._generation is not None and generation != self._generation
+            self._generation = generation
+        if changed:
+            self.clear()
+        return changed
+
+    def record_access(self, question):
+        """Count a hit on a cached question; flushed to MongoDB in aggregate"""
+        with self._lock:
+            self._pending_access[question] = self._pending_access.get(question, 0) + 1
+
+    def drain_access_counts(self):
+        with self._lock:
+            counts, self._pending_access = self._pending_access, {}
+        return counts
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedHotCache(HotCache):
+    """
+    HotCache whose entries live in a shared store (see shared_state.py), so a
+    payload cached by one worker is served by all of them and an invalidation
+    reaches every worker at once. Entries closest to expiry are evicted first.
+    Access counts and hit/miss counters stay per process.
+    """
+
+    NAMESPACE = "hot_cache"
+    # The generation the shared entries were stored under (kept until it changes)
+    META_NAMESPACE = "hot_cache_meta"
+    GENERATION_TTL = 365 * 24 * 3600
+
+    def __init__(self, store, max_entries=500, ttl=600):
+        super().__init__(max_entries, ttl)
+        self.store = store
+
+    def get(self, key):
+        try:
+            payload = self.store.get_value(self.NAMESPACE, key)
+        except Exception as e:
+            print(f"⚠️ Shared hot cache read failed: {e}")
+            payload = None
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return payload
+
+    def put(self, key, payload, doc_id=None):
+        try:
+            evicted = self.store.set_value(
+                self.NAMESPACE, key, payload, self.ttl, tag=doc_id, max_entries=self.max_entries
+            )
+        except Exception as e:
+            # The hot cache is an optimization; MongoDB still has the answer
+            print(f"⚠️ Shared hot cache write failed: {e}")
+            return
+        with self._lock:
+            self.evictions += evicted
+
+    def invalidate_id(self, doc_id):
+        self._invalidate(self.store.delete_tag, self.NAMESPACE, doc_id)
+
+    def clear(self):
+        self._invalidate(self.store.clear_namespace, self.NAMESPACE)
+
+    def sync_generation(self, generation):
+        """
+        The entries outlive this process (and may predate every running worker),
+        so they are compared with the generation recorded next to them in the
+        store, and dropped when it differs or was never recorded.
+        """
+        if self.store.get_value(self.META_NAMESPACE, "generation") == generation:
+            return False
+        self.clear()
+        self.store.set_value(self.META_NAMESPACE, "generation", generation, self.GENERATION_TTL)
+        return True
+
+    def _invalidate(self, delete, *args):
+        try:
+            removed = delete(*args)
+        except Exception as e:
+            print(f"⚠️ Shared hot cache invalidation failed: {e}")
+            return
+        with self._lock:
+            self.invalidations += removed
+
+    def stats(self):
+        stats = super().stats()
+        stats["entries"] = len(self)
+        stats["shared"] = True
+        return stats
+
+    def __len__(self):
+        try:
+            return self.store.count(self.NAMESPACE)
+        except Exception:
+            return 0
+
+
+class HotCacheSync:
+    """
+    Background upkeep for a HotCache:
+    - flushes aggregated access counts with one bulk write per interval
+    - invalidates entries when the cache collection changes, using a MongoDB
+      change stream when the deployment supports it (replica sets / Atlas) and
+      otherwise polling a generation counter bumped by Cache mutations
+    - checks the generation once before any entry is served, so a shared hot
+      cache that outlived a restart or a cache drop is cleared
+    """
+
+    def __init__(self, hot_cache, interval=5):
+        self.hot_cache = hot_cache
+        self.interval = interval
+        self._started = False
+        self._start_lock = threading.Lock()
+        self.change_stream_active = False
+        self.checked = False
+
+    def start(self):
+        """Start the upkeep threads (once); returns whether entries may be served yet"""
+        with self._start_lock:
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._flush_loop, name="hot-cache-sync", daemon=True).start()
+                threading.Thread(target=self._watch_loop, name="hot-cache-watch", daemon=True).start()
+        return self.checked
+
+    def flush(self):
+        from models import Cache
+        counts = self.hot_cache.drain_access_counts()
+        if counts:
+            try:
+                Cache.increment_access_many(counts)
+            except Exception as e:
+                print(f"Error flushing cache access counts: {e}")
+
+    def poll_generation(self):
+        from models import Cache
+        if self.hot_cache.sync_generation(Cache.get_generation()):
+            print("ℹ️ Cache generation changed; hot cache cleared")
+        self.checked = True
+
+    def _flush_loop(self):
+        while True:
+            if not (self.change_stream_active and self.checked):
+                try:
+                    self.poll_generation()
+                except Exception as e:
+                    print(f"Error polling cache generation: {e}")
+            time.sleep(self.interval)
+            self.flush()
+
+    def _watch_loop(self):
+        from models import cache_collection
+        try:
+            with cache_collection.watch(
+                [{"$match": {"operationType": {"$in": ["update", "replace", "delete", "drop", "invalidate"]}}}]
+            ) as stream:
+                self.change_stream_active = True
+                for change in stream:
+                    if change["operationType"] in ("drop", "invalidate"):
+                        self.hot_cache.clear()
+                        continue
+                    fields = change.get("updateDescription", {}).get("updatedFields", {})
+                    if change["operationType"] == "update" and set(fields) <= {"access_count"}:
+                        continue
+                    self.hot_cache.invalidate_id(change["documentKey"]["_id"])
+        except Exception as e:
+            # Standalone MongoDB has no change streams; fall back to polling
+            print(f"ℹ️ Hot cache using generation polling ({e})")
+        finally:
+            self.change_stream_active = False
@@ -0,0 +1,163 @@
+"""
+Bounded inference pools for the async serving mode (asgi.py)
+Embedding and generation are blocking, CPU/GPU-bound calls, so the event loop
+hands them to a fixed set of worker threads. A pool admits at most
+max_workers + max_queue calls at a time; beyond that it raises PoolSaturated
+so the request can be answered with 503 and Retry-After instead of queueing
+without bound. Time spent waiting for a worker is recorded per call.
+"""
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+class PoolSaturated(Exception):
+    def __init__(self, pool, retry_after):
+        super().__init__(f"{pool} pool is saturated")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+QUEUE_SECONDS = metrics.register(metrics.Histogram(
+    "nlpassist_inference_queue_seconds", "Time calls wait for an inference worker", labels=("pool",)
+))
+REJECTED = metrics.register(metrics.Counter(
+    "nlpassist_inference_rejected_total", "Calls refused because the inference pool was full", labels=("pool",)
+))
+
+
+class InferencePool:
+    def __init__(self, name, max_workers=2, max_queue=8):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._admitted = 0          # running + waiting
+        self._service_time = None   # moving average of seconds per call
+
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    @property
+    def saturated(self):
+        return self._admitted >= self.capacity
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up, for the Retry-After header"""
+        service = self._service_time or 1.0
+        waiting = max(0, self._admitted - self.max_workers)
+        return max(1, math.ceil(service * (waiting + 1) / self.max_workers))
+
+    def _admit(self):
+        with self._lock:
+            if self._admitted >= self.capacity:
+                self.rejected += 1
+                REJECTED.inc(pool=self.name)
+                raise PoolSaturated(self.name, self.retry_after())
+            self._admitted += 1
+
+    def check_admission(self):
+        """Raise PoolSaturated now if a call would be refused (to fail before cheaper work)"""
+        if self.saturated:
+            with self._lock:
+                self.rejected += 1
+            REJECTED.inc(pool=self.name)
+            raise PoolSaturated(self.name, self.retry_after())
+
+    def _release(self, service_time):
+        with self._lock:
+            self._admitted -= 1
+            self.completed += 1
+            if self._service_time is None:
+                self._service_time = service_time
+            else:
+                self._service_time = 0.8 * self._service_time + 0.2 * service_time
+
+    def _wrap(self, fn, args):
+        """
+        Callable for the executor: records queue time, runs fn in a copy of the
+        caller's context (so stage timings land in the caller's request) and
+        frees the slot when fn actually finishes, even if the caller gave up.
+        """
+        submitted = time.perf_counter()
+        context = contextvars.copy_context()
+
+        def call():
+            started = time.perf_counter()
+            queue_time = started - submitted
+            QUEUE_SECONDS.observe(queue_time, pool=self.name)
+            try:
+                return context.run(_run_with_queue_time, fn, args, queue_time)
+            finally:
+                self._release(time.perf_counter() - started)
+        return call
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on a worker thread; raises PoolSaturated if the pool is full"""
+        self._admit()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._wrap(fn, args))
+
+    def stream(self, gen_fn, *args):
+        """
+        Iterate a blocking generator on a worker thread and return an async
+        iterator over its items. Admission and submission happen now, so
+        PoolSaturated is raised before any response has been started and the
+        slot is freed even if the iterator is never consumed.
+        """
+        self._admit()
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+
+        def produce():
+            try:
+                for item in gen_fn(*args):
+                    loop.call_soon_threadsafe(items.put_nowait, (item, None))
+                loop.call_soon_threadsafe(items.put_nowait, (_END, None))
+            except Exception as e:
+                loop.call_soon_threadsafe(items.put_nowait, (_END, e))
+
+        loop.run_in_executor(self._executor, self._wrap(produce, ()))
+        return _drain(items)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._admitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_service_time": self._service_time,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_END = object()
+
+
+async def _drain(items):
+    while True:
+        item, error = await items.get()
+        if error is not None:
+            raise error
+        if item is _END:
+            return
+        yield item
+
+
+def _run_with_queue_time(fn, args, queue_time):
+    metrics.record("inference_queue", queue_time)
+    return fn(*args)
@@ -0,0 +1,205 @@
+"""
+Latency instrumentation for NLP Assistant API
+In-memory histograms and counters rendered in the Prometheus text format at
+/api/metrics, plus a per-request breakdown of stage timings that is returned
+in the Server-Timing response header.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond cache hits up to long CPU decodes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 384, 512)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self):
+        """Sum over all label values"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = _format_labels(self.labels, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _format_labels(self.labels, key, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{le} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]!r}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(value)}"]
+
+
+_registry = []
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = register(Histogram(
+    "nlpassist_stage_seconds", "Time spent in each stage of request handling", labels=("stage",)
+))
+REQUEST_SECONDS = register(Histogram(
+    "nlpassist_request_seconds", "End-to-end request latency", labels=("endpoint", "outcome")
+))
+MONGO_WRITE_SECONDS = register(Histogram(
+    "nlpassist_mongo_write_seconds", "MongoDB write latency", labels=("collection", "mode")
+))
+GENERATED_TOKENS = register(Histogram(
+    "nlpassist_generated_tokens", "Tokens decoded by FLAN-T5 per answer", buckets=TOKEN_BUCKETS
+))
+GENERATED_TOKENS_TOTAL = register(Counter(
+    "nlpassist_generated_tokens_total", "Tokens decoded by FLAN-T5"
+))
+
+
+# Per-request stage breakdown and counts (each request runs in its own thread/context)
+_breakdown = contextvars.ContextVar("nlpassist_timing_breakdown", default=None)
+_counts = contextvars.ContextVar("nlpassist_request_counts", default=None)
+
+
+def start_request():
+    _breakdown.set({})
+    _counts.set({})
+
+
+def request_breakdown():
+    """Stage timings (seconds) recorded so far in the current request"""
+    return dict(_breakdown.get() or {})
+
+
+def record(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown[stage] = breakdown.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def mongo_write(collection, mode="sync"):
+    """Time one MongoDB write; synchronous writes also count towards the request breakdown"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        MONGO_WRITE_SECONDS.observe(elapsed, collection=collection, mode=mode)
+        if mode == "sync":
+            record("mongo_write", elapsed)
+
+
+def count(name, amount):
+    """Add to a per-request count (e.g. prompt tokens) reported in the response"""
+    counts = _counts.get()
+    if counts is not None:
+        counts[name] = counts.get(name, 0) + amount
+
+
+def request_counts():
+    return dict(_counts.get() or {})
+
+
+def record_tokens(count):
+    GENERATED_TOKENS.observe(count)
+    GENERATED_TOKENS_TOTAL.inc(count)
+
+
+def server_timing_header(breakdown):
+    """Format stage timings for the Server-Timing header (durations in ms)"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in breakdown.items())
@@ -0,0 +1,156 @@
+"""
+Migrate stored source texts to chunk ids.
+
+Cache entries, assistant messages and activity_log events used to store the
+full text of every source chunk. They now store chunk ids (rows of the chunk
+store, see rag.retrieve.get_chunks), and clients fetch texts from /api/chunks.
+This rewrites existing documents:
+
+- cache:        sources          -> source_ids
+- messages:     metadata.sources -> metadata.source_ids
+- activity_log: sources          -> source_ids (and the short text hashes some
+                compact events carry in source_ids -> chunk ids)
+
+Texts are matched exactly against the chunk store, preferring rows that are
+still live over superseded ones. A document with any text that is no longer in
+the chunk store is left unchanged and counted as unmatched. Prints the BSON
+size of the migrated documents before and after, per collection.
+
+Usage: python migrate_sources.py [--dry-run] [--batch-size 500]
+"""
+import argparse
+import hashlib
+
+from bson import BSON
+from pymongo import UpdateOne
+
+import config
+from models import db, Cache
+from rag.chunk_store import load_chunks
+from rag.manifest import read_manifest, deleted_row_ids
+
+# collection -> (field with source texts, field for chunk ids)
+MIGRATIONS = {
+    "cache": ("sources", "source_ids"),
+    "messages": ("metadata.sources", "metadata.source_ids"),
+    "activity_log": ("sources", "source_ids"),
+}
+
+
+def text_hash(text):
+    # Short hash stored by earlier compact activity events
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_rows():
+    """{text: row} and {short hash: row} over the chunk store, live rows winning"""
+    chunks = load_chunks(config.CHUNK_STORE_PATH, config.CHUNKS_PICKLE_PATH)
+    deleted = set(deleted_row_ids(read_manifest(config.MANIFEST_PATH)))
+    by_text = {}
+    # Superseded rows first, so a live row with the same text replaces them
+    for row in sorted(range(len(chunks)), key=lambda row: row not in deleted):
+        by_text[chunks[row]] = row
+    return by_text, {text_hash(text): row for text, row in by_text.items()}
+
+
+def get_path(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def set_path(doc, path, value):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+
+def unset_path(doc, path):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.get(part, {})
+    doc.pop(leaf, None)
+
+
+def to_ids(values, lookup):
+    """Chunk ids for a list of texts (or hashes), or None if any is unknown"""
+    ids = [value if isinstance(value, int) else lookup.get(value) for value in values]
+    return None if any(i is None for i in ids) else ids
+
+
+def migrate_collection(name, old_field, new_field, by_text, by_hash, dry_run, batch_size):
+    collection = db[name]
+    report = {"collection": name, "documents": 0, "unmatched": 0, "bytes_before": 0, "bytes_after": 0}
+    ops = []
+
+    query = {"$or": [
+        {old_field: {"$exists": True}},
+        # Compact activity events with text hashes instead of chunk ids
+        {new_field: {"$elemMatch": {"$type": "string"}}},
+    ]}
+    for doc in collection.find(query):
+        texts = get_path(doc, old_field)
+        if texts is not None:
+            ids = to_ids(texts, by_text)
+        else:
+            ids = to_ids(get_path(doc, new_field), by_hash)
+        if ids is None:
+            report["unmatched"] += 1
+            continue
+
+        report["documents"] += 1
+        report["bytes_before"] += len(BSON.encode(doc))
+        unset_path(doc, old_field)
+        set_path(doc, new_field, ids)
+        report["bytes_after"] += len(BSON.encode(doc))
+
+        update = {"$set": {new_field: ids}}
+        if texts is not None:
+            update["$unset"] = {old_field: ""}
+        ops.append(UpdateOne({"_id": doc["_id"]}, update))
+        if len(ops) >= batch_size:
+            if not dry_run:
+                collection.bulk_write(ops, ordered=False)
+            ops = []
+    if ops and not dry_run:
+        collection.bulk_write(ops, ordered=False)
+    return report
+
+
+def print_report(reports, dry_run):
+    print(f"\n{'Collection':<14}{'Migrated':>10}{'Unmatched':>11}{'Before':>12}{'After':>12}{'Saved':>12}{'Saved %':>9}")
+    for r in reports + [{
+        "collection": "total",
+        **{key: sum(r[key] for r in reports) for key in ("documents", "unmatched", "bytes_before", "bytes_after")}
+    }]:
+        saved = r["bytes_before"] - r["bytes_after"]
+        share = saved / r["bytes_before"] if r["bytes_before"] else 0.0
+        print(f"{r['collection']:<14}{r['documents']:>10}{r['unmatched']:>11}"
+              f"{r['bytes_before']:>12,}{r['bytes_after']:>12,}{saved:>12,}{share:>9.1%}")
+    if dry_run:
+        print("\nℹ️ Dry run: nothing was written")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replace stored source texts with chunk ids")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    by_text, by_hash = chunk_rows()
+    print(f"📚 {len(by_text)} distinct chunk texts in {config.CHUNK_STORE_PATH}")
+    reports = [
+        migrate_collection(name, old_field, new_field, by_text, by_hash, args.dry_run, args.batch_size)
+        for name, (old_field, new_field) in MIGRATIONS.items()
+    ]
+    if not args.dry_run and reports[0]["documents"]:
+        # Hot caches in running workers still hold payloads with source texts
+        Cache.bump_generation()
+    print_report(reports, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Model loading for NLP Assistant API
+Controls when the ML stack (torch, the sentence transformer, the FAISS index
+and FLAN-T5) is loaded, so cheap endpoints can serve before it is warm.
+
+MODEL_LOADING modes:
+- "eager":      load before the app starts serving (the default)
+- "background": start loading in a thread at startup; /api/health and the chat
+  endpoints answer immediately, question endpoints return 503 until ready
+- "preload":    eager load in the Gunicorn master before workers are forked, so
+  workers share model memory copy-on-write (see gunicorn.conf.py)
+- "lazy":       load on the first request that needs a model
+"""
+import threading
+import time
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_status = {"state": "not_loaded", "error": None, "load_time": None}
+
+
+def load_models():
+    """Load every model now (idempotent); returns the load time in seconds"""
+    with _lock:
+        if _ready.is_set():
+            return _status["load_time"]
+        _status["state"] = "loading"
+        start = time.time()
+        try:
+            from rag import retrieve, generate
+            retrieve.load()
+            generate.get_llm()
+        except Exception as e:
+            _status.update(state="failed", error=str(e))
+            raise
+        _status.update(state="ready", error=None, load_time=time.time() - start)
+        _ready.set()
+        return _status["load_time"]
+
+
+def start_background_loading(then=None):
+    """Load models in a daemon thread, then call `then` (e.g. to warm caches)"""
+    def run():
+        try:
+            load_models()
+            print(f"✅ Models loaded in {_status['load_time']:.1f}s")
+            if then:
+                then()
+        except Exception as e:
+            print(f"❌ Model loading failed: {e}")
+
+    thread = threading.Thread(target=run, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+
+def models_ready():
+    return _ready.is_set()
+
+
+def models_status():
+    return dict(_status, ready=_ready.is_set())
@@ -1,10 +1,15 @@
-from pymongo import MongoClient
-from datetime import datetime
-from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+from datetime import datetime, timedelta
+from bson import Binary, ObjectId
+from bson.errors import InvalidId
+import base64
+import activity_stats
 import config
+import metrics
+from write_behind import create_write_behind
 
-# Initialize MongoDB client
-client = MongoClient(config.MONGO_URI)
+# Initialize MongoDB client (connects on first use, so it is safe to create before forking workers)
+client = MongoClient(config.MONGO_URI, connect=False)
 db = client[config.DATABASE_NAME]
 
 # Collections
@@ -12,6 +17,102 @@ chats_collection = db["chats"]
 messages_collection = db["messages"]
 cache_collection = db["cache"]
 activity_log_collection = db["activity_log"]
+activity_rollups_collection = db["activity_rollups"]
+cache_meta_collection = db["cache_meta"]
+
+# Background writer for writes that do not need to finish before responding
+write_behind = create_write_behind(
+    config.WRITE_BEHIND_ENABLED,
+    batch_size=config.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=config.WRITE_BEHIND_FLUSH_INTERVAL_MS / 1000.0,
+    max_queue=config.WRITE_BEHIND_MAX_QUEUE,
+    retries=config.WRITE_BEHIND_RETRIES,
+    retry_backoff=config.WRITE_BEHIND_RETRY_BACKOFF_MS / 1000.0
+)
+
+
+# Indexes for the hot queries: paged chat list and history, cache lookups, log scans.
+# An entry is a key list, or (key list, create_index options) for e.g. TTL indexes.
+INDEXES = {
+    "chats": [[("updated_at", DESCENDING), ("_id", DESCENDING)]],
+    "messages": [[("chat_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)]],
+    "cache": [[("question", ASCENDING)], [("source_ids", ASCENDING)]],
+    "activity_log": [
+        [("timestamp", ASCENDING)],
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "activity_rollups": [([("expires_at", ASCENDING)], {"expireAfterSeconds": 0})],
+}
+
+# Message fields left out unless the caller asks for them (see Message.get_page).
+# New messages carry chunk ids (metadata.source_ids); texts are only in older ones.
+HEAVY_MESSAGE_FIELDS = {"sources": "metadata.sources"}
+
+
+def ensure_indexes():
+    """Create the indexes in INDEXES (no-op for those that already exist); returns success"""
+    for name, indexes in INDEXES.items():
+        for index in indexes:
+            keys, options = index if isinstance(index, tuple) else (index, {})
+            try:
+                db[name].create_index(keys, **options)
+            except Exception as e:
+                # Most likely MongoDB is unreachable; the next start tries again
+                print(f"⚠️ Could not create index {keys} on {name}: {e}")
+                return False
+    return True
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(timestamp, doc_id):
+    """Opaque page cursor from a (timestamp, _id) sort key"""
+    millis = (timestamp - _EPOCH) // timedelta(milliseconds=1)
+    return base64.urlsafe_b64encode(f"{millis}:{doc_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        millis, doc_id = raw.split(":", 1)
+        return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(doc_id)
+    except (ValueError, InvalidId, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def split_page(docs, limit, key):
+    """Split limit + 1 fetched documents into (page, next cursor)"""
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1][key], docs[-1]["_id"])
+
+
+def cursor_filter(key, cursor):
+    """Filter for documents strictly after cursor in descending (key, _id) order"""
+    timestamp, doc_id = decode_cursor(cursor)
+    return {"$or": [{key: {"$lt": timestamp}}, {key: timestamp, "_id": {"$lt": doc_id}}]}
+
+
+def _insert(collection, document):
+    """Insert now, or queue the insert when write-behind is enabled"""
+    if write_behind:
+        document.setdefault("_id", ObjectId())
+        write_behind.insert(collection, document)
+        return document["_id"]
+    with metrics.mongo_write(collection.name):
+        return collection.insert_one(document).inserted_id
+
+
+def _update(collection, filter, update):
+    """update_one now, or queue it when write-behind is enabled"""
+    if write_behind:
+        write_behind.update(collection, filter, update)
+    else:
+        with metrics.mongo_write(collection.name):
+            collection.update_one(filter, update)
 
 
 class Chat:
@@ -23,7 +124,8 @@ class Chat:
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
-        result = chats_collection.insert_one(chat)
+        with metrics.mongo_write(chats_collection.name):
+            result = chats_collection.insert_one(chat)
         chat["_id"] = result.inserted_id
         return chat
 
@@ -32,6 +134,18 @@ class Chat:
         """Get all chat sessions"""
         return list(chats_collection.find().sort("updated_at", -1))
 
+    @staticmethod
+    def get_page(limit, cursor=None):
+        """
+        One page of chats, most recently updated first.
+        Returns (chats, next_cursor); next_cursor is None on the last page.
+        """
+        query = cursor_filter("updated_at", cursor) if cursor else {}
+        found = (chats_collection.find(query, {"title": 1, "created_at": 1, "updated_at": 1})
+                 .sort([("updated_at", DESCENDING), ("_id", DESCENDING)])
+                 .limit(limit + 1))
+        return split_page(list(found), limit, "updated_at")
+
     @staticmethod
     def get_by_id(chat_id):
         """Get a specific chat by ID"""
@@ -40,7 +154,8 @@ class Chat:
     @staticmethod
     def update_timestamp(chat_id):
         """Update the last updated timestamp"""
-        chats_collection.update_one(
+        _update(
+            chats_collection,
             {"_id": ObjectId(chat_id)},
             {"$set": {"updated_at": datetime.utcnow()}}
         )
@@ -48,16 +163,22 @@ class Chat:
     @staticmethod
     def update_title(chat_id, new_title):
         """Update the chat title"""
-        chats_collection.update_one(
-            {"_id": ObjectId(chat_id)},
-            {"$set": {"title": new_title, "updated_at": datetime.utcnow()}}
-        )
+        with metrics.mongo_write(chats_collection.name):
+            chats_collection.update_one(
+                {"_id": ObjectId(chat_id)},
+                {"$set": {"title": new_title, "updated_at": datetime.utcnow()}}
+            )
 
     @staticmethod
     def delete(chat_id):
         """Delete a chat and all its messages"""
-        messages_collection.delete_many({"chat_id": chat_id})
-        chats_collection.delete_one({"_id": ObjectId(chat_id)})
+        # Queued messages for this chat must land before they are deleted
+        if write_behind:
+            write_behind.wait_until_flushed()
+        with metrics.mongo_write(messages_collection.name):
+            messages_collection.delete_many({"chat_id": chat_id})
+        with metrics.mongo_write(chats_collection.name):
+            chats_collection.delete_one({"_id": ObjectId(chat_id)})
 
 
 class Message:
@@ -71,69 +192,210 @@ class Message:
             "metadata": metadata or {},
             "timestamp": datetime.utcnow()
         }
-        result = messages_collection.insert_one(message)
-        message["_id"] = result.inserted_id
+        message["_id"] = _insert(messages_collection, message)
         return message
 
     @staticmethod
     def get_by_chat(chat_id):
         """Get all messages for a specific chat"""
+        if write_behind:
+            write_behind.wait_until_flushed()
         return list(messages_collection.find({"chat_id": chat_id}).sort("timestamp", 1))
 
+    @staticmethod
+    def get_page(chat_id, limit, cursor=None, include=()):
+        """
+        The latest messages of a chat (before cursor, if given), oldest first.
+        Heavy metadata (HEAVY_MESSAGE_FIELDS) is left out unless named in include.
+        Returns (messages, next_cursor) where next_cursor pages to older messages.
+        """
+        if write_behind:
+            write_behind.wait_until_flushed()
+        query = {"chat_id": chat_id}
+        if cursor:
+            query.update(cursor_filter("timestamp", cursor))
+        excluded = {field: 0 for name, field in HEAVY_MESSAGE_FIELDS.items() if name not in include}
+        found = (messages_collection.find(query, excluded or None)
+                 .sort([("timestamp", DESCENDING), ("_id", DESCENDING)])
+                 .limit(limit + 1))
+        messages, next_cursor = split_page(list(found), limit, "timestamp")
+        messages.reverse()
+        return messages, next_cursor
+
 
 class Cache:
     @staticmethod
-    def find_cached(question, similarity_threshold=0.9):
+    def find(question):
+        """Exact-match lookup of a cached question"""
+        return cache_collection.find_one({"question": question})
+
+    @staticmethod
+    def find_many(questions):
+        """Cached documents for the given questions, keyed by question"""
+        return {
+            doc["question"]: doc
+            for doc in cache_collection.find({"question": {"$in": list(set(questions))}})
+        }
+
+    @staticmethod
+    def find_matched(questions):
         """
-        Find a cached answer for the question.
-        For now, we'll do exact match. Can be enhanced with semantic similarity.
+        find_many for questions matched by the semantic cache, which learns a
+        question before its queued insert is flushed
         """
-        # Exact match
-        cached = cache_collection.find_one({"question": question})
-        if cached:
-            return cached
-        
-        # Could add semantic similarity search here using embeddings
-        return None
+        found = Cache.find_many(questions)
+        if write_behind and write_behind.unflushed and not set(questions) <= found.keys():
+            write_behind.wait_until_flushed()
+            found = Cache.find_many(questions)
+        return found
+
+    @staticmethod
+    def get_all_questions():
+        """Get the question text of every cached entry"""
+        return [doc["question"] for doc in cache_collection.find({}, {"question": 1, "_id": 0})]
 
     @staticmethod
-    def save(question, answer, confidence, sources, scores):
-        """Save a Q&A pair to cache"""
+    def save(question, answer, confidence, source_ids, scores):
+        """Save a Q&A pair to cache and return its _id"""
         cache_entry = {
             "question": question,
             "answer": answer,
             "confidence": confidence,
-            "sources": sources,
+            "source_ids": source_ids,
             "scores": scores.tolist() if hasattr(scores, 'tolist') else scores,
             "created_at": datetime.utcnow(),
             "access_count": 0
         }
-        cache_collection.insert_one(cache_entry)
+        return _insert(cache_collection, cache_entry)
+
+    @staticmethod
+    def save_many(entries):
+        """Save several Q&A pairs to cache in one round-trip.
+        entries: iterable of (question, answer, confidence, source_ids, scores)"""
+        now = datetime.utcnow()
+        docs = [
+            {
+                "question": question,
+                "answer": answer,
+                "confidence": confidence,
+                "source_ids": source_ids,
+                "scores": scores.tolist() if hasattr(scores, 'tolist') else scores,
+                "created_at": now,
+                "access_count": 0
+            }
+            for question, answer, confidence, source_ids, scores in entries
+        ]
+        if docs:
+            with metrics.mongo_write(cache_collection.name):
+                cache_collection.insert_many(docs, ordered=False)
+
+    @staticmethod
+    def invalidate(filter):
+        """
+        Delete cache entries matching filter and bump the cache generation so
+        in-process caches in every worker drop their copies.
+        Returns the number of entries deleted.
+        """
+        with metrics.mongo_write(cache_collection.name):
+            deleted = cache_collection.delete_many(filter).deleted_count
+        Cache.bump_generation()
+        return deleted
+
+    @staticmethod
+    def bump_generation():
+        """Signal that existing cache entries changed"""
+        with metrics.mongo_write(cache_meta_collection.name):
+            cache_meta_collection.update_one(
+                {"_id": "generation"},
+                {"$inc": {"value": 1}},
+                upsert=True
+            )
+
+    @staticmethod
+    def get_generation():
+        """
+        "<collection uuid>:<counter>". Dropping or recreating the cache collection
+        changes the uuid, and a missing collection has none, so either counts as
+        a change like a bump does.
+        """
+        info = next(db.list_collections(filter={"name": cache_collection.name}), None)
+        uuid = info and info.get("info", {}).get("uuid")
+        if isinstance(uuid, Binary):
+            uuid = uuid.as_uuid()
+        doc = cache_meta_collection.find_one({"_id": "generation"})
+        return f"{uuid or 'missing'}:{doc['value'] if doc else 0}"
 
     @staticmethod
     def increment_access(question):
         """Increment the access count for a cached question"""
-        cache_collection.update_one(
+        _update(
+            cache_collection,
             {"question": question},
             {"$inc": {"access_count": 1}}
         )
 
+    @staticmethod
+    def increment_access_many(counts):
+        """Add access counts for several cached questions ({question: count})"""
+        if write_behind:
+            for question, count in counts.items():
+                if count:
+                    write_behind.update(cache_collection, {"question": question}, {"$inc": {"access_count": count}})
+            return
+        ops = [
+            UpdateOne({"question": question}, {"$inc": {"access_count": count}})
+            for question, count in counts.items() if count
+        ]
+        if ops:
+            with metrics.mongo_write(cache_collection.name):
+                cache_collection.bulk_write(ops, ordered=False)
+
 
 class ActivityLog:
     @staticmethod
-    def log(question, answer, confidence_score, sources, was_cached, 
+    def log(question, answer, confidence_score, source_ids, was_cached, 
             retrieval_time=0, generation_time=0, chat_id=None, scores=None):
-        """Log all Q&A activity to MongoDB"""
-        log_entry = {
-            "question": question,
-            "answer": answer,
-            "confidence_score": confidence_score,
-            "sources": sources,
-            "was_cached": was_cached,
-            "retrieval_time": retrieval_time,
-            "generation_time": generation_time,
-            "chat_id": chat_id,
-            "scores": scores.tolist() if hasattr(scores, 'tolist') else scores,
-            "timestamp": datetime.utcnow()
+        """
+        Count the request into the activity rollups, and keep a compact raw
+        event for a sample of requests (ACTIVITY_SAMPLE_RATE)
+        """
+        activity_stats.rollups.record(was_cached, confidence_score == "Low", retrieval_time, generation_time)
+        if activity_stats.should_sample():
+            _insert(activity_log_collection, activity_stats.compact_event(
+                question, answer, confidence_score, source_ids, was_cached,
+                retrieval_time, generation_time, chat_id, scores
+            ))
+
+
+class ActivityRollup:
+    @staticmethod
+    def increment_many(pending):
+        """Apply {rollup id: (granularity, start, {field: increment})} with one upsert per rollup"""
+        ops = []
+        for rollup_id, (granularity, start, increments) in pending.items():
+            on_insert = {"granularity": granularity, "start": start}
+            expires_at = activity_stats.expiry(granularity, start)
+            if expires_at:
+                on_insert["expires_at"] = expires_at
+            ops.append(UpdateOne(
+                {"_id": rollup_id}, {"$inc": increments, "$setOnInsert": on_insert}, upsert=True
+            ))
+        if ops:
+            with metrics.mongo_write(activity_rollups_collection.name, mode="write_behind"):
+                activity_rollups_collection.bulk_write(ops, ordered=False)
+
+    @staticmethod
+    def get_stats():
+        """Summary of the last hour, the last day and all time, from at most 85 rollups"""
+        minute_ids, hour_ids = activity_stats.stats_ids()
+        docs = {
+            doc["_id"]: doc
+            for doc in activity_rollups_collection.find(
+                {"_id": {"$in": minute_ids + hour_ids + [activity_stats.TOTAL_ID]}}
+            )
         }
-        activity_log_collection.insert_one(log_entry)
+        return activity_stats.stats_response(
+            [docs[i] for i in minute_ids if i in docs],
+            [docs[i] for i in hour_ids if i in docs],
+            docs.get(activity_stats.TOTAL_ID)
+        )
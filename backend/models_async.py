@@ -0,0 +1,314 @@
+"""
+Async MongoDB models for the async serving mode (asgi.py)
+Same collections and documents as models.py, using PyMongo's asyncio client so
+database calls never block the event loop. With WRITE_BEHIND_ENABLED, writes
+that do not need to finish before responding run as background tasks, retried
+with backoff like write_behind.py's batches.
+"""
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import AsyncMongoClient, DESCENDING, UpdateOne
+from pymongo.errors import ConnectionFailure
+
+import activity_stats
+import config
+import metrics
+from models import INDEXES, HEAVY_MESSAGE_FIELDS, cursor_filter, split_page
+from write_behind import already_inserted
+
+client = AsyncMongoClient(config.MONGO_URI)
+db = client[config.DATABASE_NAME]
+
+# Collections
+chats_collection = db["chats"]
+messages_collection = db["messages"]
+cache_collection = db["cache"]
+activity_log_collection = db["activity_log"]
+activity_rollups_collection = db["activity_rollups"]
+
+async def ensure_indexes():
+    """Create the indexes in models.INDEXES; returns success"""
+    for name, indexes in INDEXES.items():
+        for index in indexes:
+            keys, options = index if isinstance(index, tuple) else (index, {})
+            try:
+                await db[name].create_index(keys, **options)
+            except Exception as e:
+                print(f"⚠️ Could not create index {keys} on {name}: {e}")
+                return False
+    return True
+
+
+# Deferred writes still in flight (kept referenced so they are not garbage collected)
+_pending = set()
+# Deferred writes given up on (reported by /api/health)
+failed_writes = 0
+
+
+async def _timed(collection, operation):
+    with metrics.mongo_write(collection.name, mode="write_behind" if config.WRITE_BEHIND_ENABLED else "sync"):
+        return await operation
+
+
+async def _deferred(collection, write, count):
+    """Run a deferred write, retrying connection errors with exponential backoff"""
+    global failed_writes
+    for attempt in range(config.WRITE_BEHIND_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(config.WRITE_BEHIND_RETRY_BACKOFF_MS / 1000.0 * 2 ** (attempt - 1))
+        try:
+            await _timed(collection, write())
+            return
+        except ConnectionFailure as e:
+            print(f"Error in deferred write to {collection.name} (attempt {attempt + 1}): {e}")
+        except Exception as e:
+            if already_inserted(e):
+                return
+            print(f"Error in deferred write to {collection.name}: {e}")
+            break
+    failed_writes += count
+
+
+def _write(collection, write, count=1):
+    """
+    Await a write now, or schedule it in the background when write-behind is
+    enabled. `write` makes the operation, so a failed one can be retried.
+    """
+    if config.WRITE_BEHIND_ENABLED:
+        task = asyncio.get_running_loop().create_task(_deferred(collection, write, count))
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+        return None
+    return _timed(collection, write())
+
+
+def pending_writes():
+    """Number of deferred writes not yet finished"""
+    return len(_pending)
+
+
+async def wait_until_flushed():
+    """Wait for deferred writes started so far (read-your-writes)"""
+    if _pending:
+        await asyncio.gather(*list(_pending), return_exceptions=True)
+
+
+async def _insert(collection, document):
+    document.setdefault("_id", ObjectId())
+    pending = _write(collection, lambda: collection.insert_one(document))
+    if pending is not None:
+        await pending
+    return document["_id"]
+
+
+async def _update(collection, filter, update):
+    pending = _write(collection, lambda: collection.update_one(filter, update))
+    if pending is not None:
+        await pending
+
+
+class Chat:
+    @staticmethod
+    async def create(title="New Chat"):
+        """Create a new chat session"""
+        chat = {
+            "title": title,
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+        with metrics.mongo_write(chats_collection.name):
+            result = await chats_collection.insert_one(chat)
+        chat["_id"] = result.inserted_id
+        return chat
+
+    @staticmethod
+    async def get_all():
+        """Get all chat sessions"""
+        return await chats_collection.find().sort("updated_at", -1).to_list(None)
+
+    @staticmethod
+    async def get_page(limit, cursor=None):
+        """One page of chats, most recently updated first; returns (chats, next_cursor)"""
+        query = cursor_filter("updated_at", cursor) if cursor else {}
+        found = (chats_collection.find(query, {"title": 1, "created_at": 1, "updated_at": 1})
+                 .sort([("updated_at", DESCENDING), ("_id", DESCENDING)])
+                 .limit(limit + 1))
+        return split_page(await found.to_list(None), limit, "updated_at")
+
+    @staticmethod
+    async def get_by_id(chat_id):
+        """Get a specific chat by ID"""
+        return await chats_collection.find_one({"_id": ObjectId(chat_id)})
+
+    @staticmethod
+    async def update_timestamp(chat_id):
+        """Update the last updated timestamp"""
+        await _update(
+            chats_collection,
+            {"_id": ObjectId(chat_id)},
+            {"$set": {"updated_at": datetime.utcnow()}}
+        )
+
+    @staticmethod
+    async def update_title(chat_id, new_title):
+        """Update the chat title"""
+        with metrics.mongo_write(chats_collection.name):
+            await chats_collection.update_one(
+                {"_id": ObjectId(chat_id)},
+                {"$set": {"title": new_title, "updated_at": datetime.utcnow()}}
+            )
+
+    @staticmethod
+    async def delete(chat_id):
+        """Delete a chat and all its messages"""
+        await wait_until_flushed()
+        with metrics.mongo_write(messages_collection.name):
+            await messages_collection.delete_many({"chat_id": chat_id})
+        with metrics.mongo_write(chats_collection.name):
+            await chats_collection.delete_one({"_id": ObjectId(chat_id)})
+
+
+class Message:
+    @staticmethod
+    async def create(chat_id, role, content, metadata=None):
+        """Create a new message in a chat"""
+        message = {
+            "chat_id": chat_id,
+            "role": role,  # "user" or "assistant"
+            "content": content,
+            "metadata": metadata or {},
+            "timestamp": datetime.utcnow()
+        }
+        await _insert(messages_collection, message)
+        return message
+
+    @staticmethod
+    async def get_by_chat(chat_id):
+        """Get all messages for a specific chat"""
+        await wait_until_flushed()
+        return await messages_collection.find({"chat_id": chat_id}).sort("timestamp", 1).to_list(None)
+
+    @staticmethod
+    async def get_page(chat_id, limit, cursor=None, include=()):
+        """The latest messages of a chat (before cursor), oldest first; see models.Message.get_page"""
+        await wait_until_flushed()
+        query = {"chat_id": chat_id}
+        if cursor:
+            query.update(cursor_filter("timestamp", cursor))
+        excluded = {field: 0 for name, field in HEAVY_MESSAGE_FIELDS.items() if name not in include}
+        found = (messages_collection.find(query, excluded or None)
+                 .sort([("timestamp", DESCENDING), ("_id", DESCENDING)])
+                 .limit(limit + 1))
+        messages, next_cursor = split_page(await found.to_list(None), limit, "timestamp")
+        messages.reverse()
+        return messages, next_cursor
+
+
+class Cache:
+    @staticmethod
+    async def find(question):
+        """Exact-match lookup of a cached question"""
+        return await cache_collection.find_one({"question": question})
+
+    @staticmethod
+    async def find_many(questions):
+        """Cached documents for the given questions, keyed by question"""
+        cursor = cache_collection.find({"question": {"$in": list(set(questions))}})
+        return {doc["question"]: doc async for doc in cursor}
+
+    @staticmethod
+    async def find_matched(questions):
+        """
+        find_many for questions matched by the semantic cache, which learns a
+        question before its deferred insert has finished
+        """
+        found = await Cache.find_many(questions)
+        if _pending and not set(questions) <= found.keys():
+            await wait_until_flushed()
+            found = await Cache.find_many(questions)
+        return found
+
+    @staticmethod
+    async def save(question, answer, confidence, source_ids, scores):
+        """Save a Q&A pair to cache and return its _id"""
+        cache_entry = {
+            "question": question,
+            "answer": answer,
+            "confidence": confidence,
+            "source_ids": source_ids,
+            "scores": scores.tolist() if hasattr(scores, 'tolist') else scores,
+            "created_at": datetime.utcnow(),
+            "access_count": 0
+        }
+        return await _insert(cache_collection, cache_entry)
+
+    @staticmethod
+    async def save_many(entries):
+        """Save several Q&A pairs to cache in one round-trip.
+        entries: iterable of (question, answer, confidence, source_ids, scores)"""
+        now = datetime.utcnow()
+        docs = [
+            {
+                "question": question,
+                "answer": answer,
+                "confidence": confidence,
+                "source_ids": source_ids,
+                "scores": scores.tolist() if hasattr(scores, 'tolist') else scores,
+                "created_at": now,
+                "access_count": 0
+            }
+            for question, answer, confidence, source_ids, scores in entries
+        ]
+        if docs:
+            with metrics.mongo_write(cache_collection.name):
+                await cache_collection.insert_many(docs, ordered=False)
+
+    @staticmethod
+    async def increment_access(question):
+        """Increment the access count for a cached question"""
+        await _update(cache_collection, {"question": question}, {"$inc": {"access_count": 1}})
+
+    @staticmethod
+    async def increment_access_many(counts):
+        """Add access counts for several cached questions ({question: count})"""
+        ops = [
+            UpdateOne({"question": question}, {"$inc": {"access_count": count}})
+            for question, count in counts.items() if count
+        ]
+        if ops:
+            pending = _write(cache_collection, lambda: cache_collection.bulk_write(ops, ordered=False), len(ops))
+            if pending is not None:
+                await pending
+
+
+class ActivityLog:
+    @staticmethod
+    async def log(question, answer, confidence_score, source_ids, was_cached,
+                  retrieval_time=0, generation_time=0, chat_id=None, scores=None):
+        """Async counterpart of models.ActivityLog.log (rollups are flushed by a background thread)"""
+        activity_stats.rollups.record(was_cached, confidence_score == "Low", retrieval_time, generation_time)
+        if activity_stats.should_sample():
+            await _insert(activity_log_collection, activity_stats.compact_event(
+                question, answer, confidence_score, source_ids, was_cached,
+                retrieval_time, generation_time, chat_id, scores
+            ))
+
+
+class ActivityRollup:
+    @staticmethod
+    async def get_stats():
+        """Async counterpart of models.ActivityRollup.get_stats"""
+        minute_ids, hour_ids = activity_stats.stats_ids()
+        docs = {
+            doc["_id"]: doc
+            async for doc in activity_rollups_collection.find(
+                {"_id": {"$in": minute_ids + hour_ids + [activity_stats.TOTAL_ID]}}
+            )
+        }
+        return activity_stats.stats_response(
+            [docs[i] for i in minute_ids if i in docs],
+            [docs[i] for i in hour_ids if i in docs],
+            docs.get(activity_stats.TOTAL_ID)
+        )
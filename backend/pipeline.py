@@ -0,0 +1,527 @@
+"""
+Request pipeline for NLP Assistant API
+What each endpoint does, written once for both front ends: app.py (Flask)
+drives these pipelines with steps.run, asgi.py (Quart) with a steps.AsyncRunner
+that awaits MongoDB and offloads embedding and generation to its inference
+pools. Pipelines yield their I/O as steps and return (body, status, headers);
+the front ends only read the request, drive the pipeline and serialize the
+result. /api/ask/stream is split around the token stream, the one piece of
+I/O a front end iterates itself.
+"""
+import hashlib
+import json
+import time
+
+import config
+import metrics
+import cache_manager
+from cache_manager import apply_refusal, hot_cache
+from conversation import conversations, resolve
+from model_loader import models_ready
+from security import validate_question, validate_decoding, validate_chat_title, validate_chunk_ids, sanitize_input
+from steps import admit, db, embed, generate, io
+
+from rag.retrieve import retrieve_with_ids, retrieve_with_context, retrieve_batch, get_chunks, embed_questions
+from rag.generate import generate as generate_answer, generate_batch
+
+# How generation answers when the context does not support an answer
+REFUSAL_PREFIX = "I am not confident enough to answer"
+
+
+def reply(body, status=200, headers=None):
+    return body, status, headers or {}
+
+
+def scores_list(scores):
+    return scores.tolist() if hasattr(scores, 'tolist') else scores
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def source_fields(source_ids, include_sources=False):
+    """
+    Response fields for the sources of an answer: chunk ids (texts are served
+    by /api/chunks), plus the texts themselves when the request asked for them
+    """
+    fields = {"source_ids": source_ids}
+    if include_sources:
+        texts = get_chunks(source_ids)
+        fields["sources"] = [texts[i] for i in source_ids if i in texts]
+    return fields
+
+
+def rewritten_field(question, query):
+    """The standalone form a follow-up question was answered as, if it was rewritten"""
+    return {"rewritten_question": query} if query != question else {}
+
+
+def retrieve_turn(question, query, history):
+    """
+    (chunks, distances, chunk ids, query vector or None) for a chat turn: a
+    rewritten follow-up is searched with the earlier turns' vectors blended in
+    """
+    if query != question and history:
+        prior = conversations.prior_vectors(history, embed_questions)
+        return retrieve_with_context(query, config.TOP_K, prior)
+    return retrieve_with_ids(query, top_k=config.TOP_K) + (None,)
+
+
+def confident(scores):
+    """Whether retrieval found chunks close enough to generate from"""
+    return (min(scores) if len(scores) > 0 else float('inf')) < config.CONFIDENCE_THRESHOLD
+
+
+def is_refusal(answer):
+    return REFUSAL_PREFIX in answer
+
+
+def models_loading():
+    """The 503 reply while models are still loading in the background, else None"""
+    if config.MODEL_LOADING == "background" and not models_ready():
+        return reply({"error": "Models are still loading, please retry shortly"}, 503, {"Retry-After": "5"})
+    return None
+
+
+def health(write_queue_depth, failed_writes):
+    return {
+        "status": "ok",
+        "message": "NLP Assistant API is running",
+        "write_queue_depth": write_queue_depth,
+        "failed_writes": failed_writes,
+        "hot_cache": hot_cache.stats() if config.HOT_CACHE_ENABLED else None,
+        "conversations": conversations.stats() if config.CONVERSATION_ENABLED else None
+    }
+
+
+# /api/ask and /api/ask/stream
+
+class Ask:
+    """A question going through /api/ask or /api/ask/stream"""
+
+    def __init__(self, data, streamed=False):
+        self.start = time.time()
+        self.streamed = streamed
+        self.question = data.get('question', '').strip()
+        self.chat_id = data.get('chat_id')
+        self.include_sources = data.get('include_sources')
+        self.decoding = None
+        self.query = self.question      # standalone form (see conversation.resolve)
+        self.subject = None
+        self.history = []
+        self.cached = None              # cached result, if the answer came from cache
+        self.sources, self.scores, self.source_ids, self.vector = [], [], [], None
+        self.retrieved_ids = []         # source_ids before a refusal empties them
+        self.answer = None
+        self.confidence = None
+        self.retrieval_time = 0.0
+        self.generation_time = 0.0
+        self.generation_start = None
+        self.time_to_first_token = None
+
+    @property
+    def generating(self):
+        """Whether the answer is still to be generated (a confident cache miss)"""
+        return self.cached is None and self.answer is None and confident(self.scores)
+
+
+def _start(data, streamed=False):
+    """
+    Pipeline: validate the question, rewrite a follow-up, then look it up in
+    the cache and (on a miss) retrieve its chunks. Returns (Ask, None) or
+    (None, error reply).
+    """
+    ask = Ask(data, streamed)
+    with metrics.timer("validation"):
+        is_valid, question, error_msg = validate_question(ask.question)
+        if is_valid:
+            is_valid, ask.decoding, error_msg = validate_decoding(data.get('decoding'))
+    if not is_valid:
+        return None, reply({"error": error_msg}, 400)
+    ask.question = question
+
+    # Follow-ups ("what about its limitations?") are answered in their standalone form
+    if ask.chat_id and config.CONVERSATION_ENABLED:
+        with metrics.timer("conversation"):
+            ask.query, ask.subject, ask.history = yield io(resolve, ask.chat_id, question)
+
+    with metrics.timer("cache_lookup"):
+        ask.cached = yield from cache_manager.lookup(ask.query)
+    if ask.cached:
+        ask.answer = ask.cached['answer']
+        ask.source_ids = ask.cached['source_ids']
+        ask.confidence = ask.cached['confidence']
+        ask.scores = ask.cached.get('scores', [])
+        ask.retrieved_ids = ask.source_ids
+        return ask, None
+
+    # Refuse before retrieving if generation could not be admitted anyway
+    yield admit()
+    retrieval_start = time.time()
+    ask.sources, ask.scores, ask.retrieved_ids, ask.vector = yield embed(
+        retrieve_turn, ask.question, ask.query, ask.history
+    )
+    ask.source_ids = ask.retrieved_ids
+    ask.retrieval_time = time.time() - retrieval_start
+    ask.generation_start = time.time()
+    if not confident(ask.scores):
+        ask.answer, ask.source_ids, ask.confidence = apply_refusal("", ask.source_ids, ask.scores)
+        ask.generation_time = time.time() - ask.generation_start
+    return ask, None
+
+
+def _generated(ask, answer):
+    """Pipeline: take a generated answer, caching it unless it is a refusal or decoding was overridden"""
+    ask.answer = answer
+    ask.generation_time = time.time() - ask.generation_start
+    ask.confidence = "Low" if is_refusal(answer) else "High"
+    if ask.confidence == "High" and not ask.decoding.overridden:
+        yield from cache_manager.store(ask.query, answer, ask.confidence, ask.source_ids, ask.scores)
+
+
+def _record(ask):
+    """Pipeline: the chat's messages and conversation turn, and the activity log entry"""
+    cached = ask.cached is not None
+    if ask.chat_id:
+        if cached:
+            metadata = {"cached": True, "cache_match": ask.cached['cache_match']}
+        else:
+            metadata = {
+                "cached": False,
+                "retrieval_time": ask.retrieval_time,
+                "generation_time": ask.generation_time
+            }
+            if ask.streamed:
+                metadata["time_to_first_token"] = ask.time_to_first_token
+        yield db("Message.create", ask.chat_id, "user", ask.question)
+        # A refused turn is no context for a follow-up
+        if config.CONVERSATION_ENABLED and ask.confidence == "High":
+            yield io(conversations.add_turn, ask.chat_id, ask.question, ask.query, ask.subject, ask.vector)
+        yield db("Message.create", ask.chat_id, "assistant", ask.answer, dict(
+            metadata,
+            confidence=ask.confidence,
+            source_ids=ask.source_ids,
+            **rewritten_field(ask.question, ask.query)
+        ))
+        yield db("Chat.update_timestamp", ask.chat_id)
+
+    times = {} if cached else {"retrieval_time": ask.retrieval_time, "generation_time": ask.generation_time}
+    yield db(
+        "ActivityLog.log",
+        question=ask.query,
+        answer=ask.answer,
+        confidence_score=ask.confidence,
+        source_ids=ask.source_ids,
+        was_cached=cached,
+        chat_id=ask.chat_id,
+        scores=ask.scores,
+        **times
+    )
+
+
+def _body(ask):
+    """The /api/ask response (the "done" event of /api/ask/stream)"""
+    body = {
+        "answer": ask.answer,
+        **source_fields(ask.source_ids, ask.include_sources),
+        "confidence": ask.confidence,
+        "cached": ask.cached is not None
+    }
+    if ask.cached:
+        body.update(cache_match=ask.cached['cache_match'], similarity=ask.cached['similarity'],
+                    scores=ask.scores)
+    else:
+        body.update(retrieval_time=ask.retrieval_time, generation_time=ask.generation_time,
+                    scores=scores_list(ask.scores), context_tokens=metrics.request_counts())
+    if ask.streamed:
+        body.update(time_to_first_token=ask.time_to_first_token, total_time=time.time() - ask.start)
+    body.update(rewritten_field(ask.question, ask.query))
+    return body
+
+
+def ask_question(data):
+    """
+    Pipeline for /api/ask: cache first, then retrieval, the refusal check and
+    generation for a miss
+    """
+    ask, error = yield from _start(data)
+    if error:
+        return error
+    if ask.generating:
+        answer = yield generate(generate_answer, ask.query, ask.sources, ask.scores, ask.decoding)
+        yield from _generated(ask, answer)
+    yield from _record(ask)
+    return reply(_body(ask))
+
+
+def start_stream(data):
+    """
+    Pipeline for /api/ask/stream up to the token stream (cache lookup,
+    admission and retrieval happen before the response starts): (Ask, None)
+    or (None, error reply). When ask.generating, the front end streams
+    generate_stream(ask.query, ask.sources, ask.scores, ask.decoding).
+    """
+    return (yield from _start(data, streamed=True))
+
+
+def opening_events(ask):
+    """
+    The events sent before generation: the sources, and for a cached or
+    refused answer the whole answer as one token
+    """
+    events = [sse_event("sources", {
+        **source_fields(ask.retrieved_ids, ask.include_sources),
+        "scores": scores_list(ask.scores)
+    })]
+    if not ask.generating:
+        events.append(token_event(ask, ask.answer))
+    return events
+
+
+def token_event(ask, text):
+    if ask.time_to_first_token is None:
+        ask.time_to_first_token = time.time() - ask.start
+    return sse_event("token", {"text": text})
+
+
+def finish_stream(ask, answer=None):
+    """Pipeline: record the streamed turn (answer is the final text of a generation); returns the "done" body"""
+    if answer is not None:
+        yield from _generated(ask, answer)
+    yield from _record(ask)
+    return _body(ask)
+
+
+# /api/ask_batch
+
+def ask_batch(data):
+    """
+    Pipeline for /api/ask_batch: checks the cache for all questions in bulk,
+    retrieves for the misses with one embedding call and one FAISS search, and
+    generates only for confident misses.
+    """
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        return reply({"error": "questions must be a non-empty list"}, 400)
+    if len(questions) > config.MAX_BATCH_QUESTIONS:
+        return reply({"error": f"At most {config.MAX_BATCH_QUESTIONS} questions per batch"}, 400)
+    is_valid, decoding, error_msg = validate_decoding(data.get('decoding'))
+    if not is_valid:
+        return reply({"error": error_msg}, 400)
+    include_sources = data.get('include_sources')
+
+    results = [None] * len(questions)
+    valid = []
+    with metrics.timer("validation"):
+        for i, question in enumerate(questions):
+            is_valid, sanitized_question, error_msg = validate_question(
+                question.strip() if isinstance(question, str) else question
+            )
+            if is_valid:
+                valid.append((i, sanitized_question))
+            else:
+                results[i] = {"question": question, "error": error_msg}
+
+    # Step 1: Bulk cache lookup
+    with metrics.timer("cache_lookup"):
+        cached_results = yield from cache_manager.lookup_many([q for _, q in valid])
+    misses = []
+    for (i, question), cached_result in zip(valid, cached_results):
+        if cached_result:
+            results[i] = dict(
+                cached_result, question=question,
+                **source_fields(cached_result['source_ids'], include_sources)
+            )
+            yield db(
+                "ActivityLog.log",
+                question=question,
+                answer=cached_result['answer'],
+                confidence_score=cached_result['confidence'],
+                source_ids=cached_result['source_ids'],
+                was_cached=True,
+                scores=cached_result['scores']
+            )
+        else:
+            misses.append((i, question))
+
+    # Step 2: Retrieve for all misses at once
+    retrieved = []
+    retrieval_start = time.time()
+    if misses:
+        yield admit()
+        retrieved = yield embed(retrieve_batch, [q for _, q in misses], config.TOP_K)
+    retrieval_time = time.time() - retrieval_start
+
+    # Step 3: Refuse low-confidence misses, generate the rest in batches
+    to_generate = []
+    for (i, question), (sources, scores, source_ids) in zip(misses, retrieved):
+        if confident(scores):
+            to_generate.append((i, question, sources, scores, source_ids))
+            continue
+        answer, refused_ids, confidence = apply_refusal("", source_ids, scores)
+        results[i] = {
+            "question": question,
+            "answer": answer,
+            **source_fields(refused_ids, include_sources),
+            "confidence": confidence,
+            "cached": False,
+            "scores": scores_list(scores)
+        }
+
+    answers = []
+    generation_start = time.time()
+    if to_generate:
+        answers = yield generate(
+            generate_batch,
+            [question for _, question, _, _, _ in to_generate],
+            [sources for _, _, sources, _, _ in to_generate],
+            [scores for _, _, _, scores, _ in to_generate],
+            decoding
+        )
+    generation_time = time.time() - generation_start
+
+    to_cache = []
+    for (i, question, sources, scores, source_ids), answer in zip(to_generate, answers):
+        confidence = "Low" if is_refusal(answer) else "High"
+        if confidence == "High" and not decoding.overridden:
+            to_cache.append((question, answer, confidence, source_ids, scores))
+        results[i] = {
+            "question": question,
+            "answer": answer,
+            **source_fields(source_ids, include_sources),
+            "confidence": confidence,
+            "cached": False,
+            "scores": scores_list(scores)
+        }
+    yield from cache_manager.store_many(to_cache)
+
+    generated = {i for i, _, _, _, _ in to_generate}
+    for (i, question) in misses:
+        result = results[i]
+        yield db(
+            "ActivityLog.log",
+            question=question,
+            answer=result['answer'],
+            confidence_score=result['confidence'],
+            source_ids=result['source_ids'],
+            was_cached=False,
+            retrieval_time=retrieval_time / len(misses),
+            generation_time=generation_time / len(to_generate) if i in generated else 0,
+            scores=result['scores']
+        )
+
+    return reply({
+        "results": results,
+        "cached_count": len(valid) - len(misses),
+        "generated_count": len(to_generate),
+        "retrieval_time": retrieval_time,
+        "generation_time": generation_time,
+        "context_tokens": metrics.request_counts()
+    })
+
+
+# /api/chunks
+
+def chunk_texts(ids, if_none_match):
+    """
+    /api/chunks?ids=3,17,42: source texts by chunk id as {"chunks": {id: text}},
+    as a (JSON text, status, headers) reply. The text of a chunk id never
+    changes, so a response with every requested id may be cached forever (by
+    the browser only when API keys are required). Ids that are not in the
+    chunk store are listed under "missing" and the response is not stored;
+    404 when none of them are.
+    """
+    is_valid, chunk_ids, error_msg = validate_chunk_ids(ids)
+    if not is_valid:
+        return reply(json.dumps({"error": error_msg}), 400)
+
+    chunks = get_chunks(chunk_ids)
+    missing = [i for i in chunk_ids if i not in chunks]
+    texts = {str(i): text for i, text in chunks.items()}
+    if missing:
+        # A missing id may be one this worker has not loaded yet, or a deleted document's
+        body = json.dumps({"chunks": texts, "missing": missing})
+        return reply(body, 200 if chunks else 404, {"Cache-Control": "no-store"})
+
+    body = json.dumps({"chunks": texts})
+    etag = hashlib.sha1(body.encode("utf-8")).hexdigest()
+    scope = "private" if config.REQUIRE_API_KEY else "public"
+    headers = {
+        "Cache-Control": f"{scope}, max-age=31536000, immutable",
+        "ETag": f'"{etag}"'
+    }
+    if if_none_match.contains(etag):
+        return reply("", 304, headers)
+    return reply(body, 200, headers)
+
+
+# Chats and stats
+
+def page_args(args, default_limit):
+    """The ?limit= and ?cursor= query parameters, with limit clamped to MAX_PAGE_SIZE"""
+    limit = args.get('limit', default_limit, type=int)
+    return max(1, min(limit, config.MAX_PAGE_SIZE)), args.get('cursor') or None
+
+
+def paged(items, next_cursor):
+    """A list reply with the cursor of the next page (if any) in X-Next-Cursor"""
+    for item in items:
+        # ObjectId to string for JSON serialization
+        item['_id'] = str(item['_id'])
+    return reply(items, headers={'X-Next-Cursor': next_cursor} if next_cursor else None)
+
+
+def list_chats(args):
+    """Pipeline: chat sessions, most recent first, one page at a time (?limit=&cursor=)"""
+    try:
+        limit, cursor = page_args(args, config.CHATS_PAGE_SIZE)
+        chats, next_cursor = yield db("Chat.get_page", limit, cursor)
+    except ValueError as e:
+        return reply({"error": str(e)}, 400)
+    return paged(chats, next_cursor)
+
+
+def create_chat(data):
+    """Pipeline: create a new chat session"""
+    title = sanitize_input(data.get('title', 'New Chat'), max_length=config.MAX_TITLE_LENGTH)
+    chat = yield db("Chat.create", title)
+    chat['_id'] = str(chat['_id'])
+    return reply(chat)
+
+
+def chat_messages(chat_id, args):
+    """
+    Pipeline: the latest messages of a chat, oldest first (?limit=&cursor=
+    pages to older messages). Source chunk ids are always included; the source
+    texts of messages saved before chunk ids only with ?include=sources.
+    """
+    try:
+        limit, cursor = page_args(args, config.MESSAGES_PAGE_SIZE)
+        include = args.get('include', '').split(',')
+        messages, next_cursor = yield db("Message.get_page", chat_id, limit, cursor, include=include)
+    except ValueError as e:
+        return reply({"error": str(e)}, 400)
+    return paged(messages, next_cursor)
+
+
+def delete_chat(chat_id):
+    """Pipeline: delete a chat session, its messages and its conversation window"""
+    yield db("Chat.delete", chat_id)
+    yield io(conversations.forget, chat_id)
+    return reply({"message": "Chat deleted successfully"})
+
+
+def rename_chat(chat_id, data):
+    """Pipeline: update a chat's title"""
+    is_valid, sanitized_title, error_msg = validate_chat_title(data.get('title', '').strip())
+    if not is_valid:
+        return reply({"error": error_msg}, 400)
+    yield db("Chat.update_title", chat_id, sanitized_title)
+    return reply({"message": "Title updated successfully", "title": sanitized_title})
+
+
+def activity_stats():
+    """Pipeline: request counts, cache hit ratio, refusal rate and latency quantiles from the rollups"""
+    return reply((yield db("ActivityRollup.get_stats")))
@@ -0,0 +1,207 @@
+"""
+Approximate nearest-neighbour index options for retrieval.
+
+Builds IVF-Flat, IVF-PQ or HNSW indexes over the stored chunk embeddings and
+reports recall@k and latency against exact (flat) search, so a setting can be
+chosen before pointing FAISS_INDEX_PATH at the new index. All indexes use the
+L2 metric of the original flat index, so retrieval distances stay comparable
+with CONFIDENCE_THRESHOLD (IVF-PQ distances are approximate).
+
+Usage (from the backend directory):
+    python -m rag.ann --type hnsw --output data/faiss.hnsw.index
+    python -m rag.ann --type ivf-flat --nlist 1024 --nprobe 1 8 32 --output data/faiss.ivf.index
+    python -m rag.ann --type ivf-pq --pq-m 48 --reembed --output data/faiss.ivfpq.index
+
+Search parameters at serving time come from config.FAISS_NPROBE and
+config.FAISS_EF_SEARCH (see apply_search_params).
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf-flat", "ivf-pq", "hnsw")
+
+
+def apply_search_params(index, nprobe=0, ef_search=0):
+    """Set runtime search parameters on an index; parameters it does not have are ignored"""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if not value:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+    return index
+
+
+def selector_params(index, selector, nprobe=0, ef_search=0):
+    """
+    Search parameters that restrict a search to the rows `selector` accepts.
+    IVF and HNSW indexes only accept their own parameter types, and parameters
+    passed to search() replace the ones apply_search_params set on the index,
+    so nprobe/efSearch are carried here too (the index's own value when 0).
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe or ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search or index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def default_nlist(n):
+    """~4*sqrt(n) lists, capped so every list gets the ~39 training points FAISS asks for"""
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def build_index(vectors, index_type, nlist=None, pq_m=48, pq_nbits=8, hnsw_m=32, ef_construction=200):
+    """Build (and train, if needed) an L2 index of the given type over float32 vectors"""
+    n, dim = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    elif index_type in ("ivf-flat", "ivf-pq"):
+        nlist = nlist or default_nlist(n)
+        if n < nlist:
+            raise ValueError(f"{index_type} needs at least nlist={nlist} vectors to train, got {n}")
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf-flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            if dim % pq_m:
+                raise ValueError(f"--pq-m must divide the embedding dimension {dim}")
+            if n < 2 ** pq_nbits:
+                raise ValueError(f"ivf-pq with {pq_nbits}-bit codes needs at least {2 ** pq_nbits} vectors, got {n}")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}' (expected one of {', '.join(INDEX_TYPES)})")
+
+    index.add(vectors)
+    return index
+
+
+def stored_vectors(index_path):
+    """Reconstruct the vectors held by an existing flat index"""
+    index = faiss.read_index(index_path)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def embed_chunks(chunks, batch_size=256):
+    """Re-embed every chunk with the configured embedding model"""
+    import config
+    from rag.backends import load_embedding_model
+
+    embedder = load_embedding_model(config.EMBEDDING_BACKEND)
+    return np.asarray(
+        embedder.encode(list(chunks), batch_size=batch_size, show_progress_bar=True),
+        dtype="float32"
+    )
+
+
+def evaluate(index, vectors, queries, k, nprobe=0, ef_search=0):
+    """recall@k against exact search, plus batch and single-query latency"""
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    apply_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    batch_time = time.perf_counter() - start
+
+    single = []
+    for q in queries[: min(len(queries), 200)]:
+        start = time.perf_counter()
+        index.search(q.reshape(1, -1), k)
+        single.append(time.perf_counter() - start)
+    single.sort()
+
+    hits = sum(len(set(t) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return {
+        "nprobe": nprobe,
+        "ef_search": ef_search,
+        f"recall@{k}": hits / (len(queries) * k),
+        "batch_ms_per_query": 1000 * batch_time / len(queries),
+        "p50_ms": 1000 * single[len(single) // 2],
+        "p99_ms": 1000 * single[min(len(single) - 1, int(len(single) * 0.99))],
+    }
+
+
+def write_index(index, path):
+    """Write an index atomically so running workers never read a partial file"""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description="Build and evaluate ANN indexes over the chunk embeddings")
+    parser.add_argument("--type", choices=INDEX_TYPES, required=True)
+    parser.add_argument("--output", help="Where to write the index (omit to only evaluate)")
+    parser.add_argument("--source-index", default=config.FAISS_INDEX_PATH,
+                        help="Flat index to reconstruct embeddings from")
+    parser.add_argument("--reembed", action="store_true",
+                        help="Embed the chunk store instead of reconstructing from --source-index")
+    parser.add_argument("--nlist", type=int, help="IVF lists (default ~4*sqrt(n))")
+    parser.add_argument("--pq-m", type=int, default=48, help="PQ sub-quantizers")
+    parser.add_argument("--pq-nbits", type=int, default=8, help="Bits per PQ code")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbours per node")
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("-k", type=int, default=config.TOP_K)
+    parser.add_argument("--queries", type=int, default=1000, help="Stored vectors sampled as queries")
+    parser.add_argument("--report", help="Write the recall/latency report as JSON")
+    args = parser.parse_args()
+
+    if args.reembed:
+        from rag.chunk_store import load_chunks
+        vectors = embed_chunks(load_chunks(config.CHUNK_STORE_PATH, config.CHUNKS_PICKLE_PATH))
+    else:
+        vectors = stored_vectors(args.source_index)
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    print(f"📐 {len(vectors)} vectors of dimension {vectors.shape[1]}")
+
+    start = time.perf_counter()
+    index = build_index(vectors, args.type, nlist=args.nlist, pq_m=args.pq_m, pq_nbits=args.pq_nbits,
+                        hnsw_m=args.hnsw_m, ef_construction=args.ef_construction)
+    print(f"🏗️ Built {args.type} index in {time.perf_counter() - start:.1f}s")
+
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    k = min(args.k, len(vectors))
+
+    if args.type.startswith("ivf"):
+        settings = [{"nprobe": p} for p in args.nprobe]
+    elif args.type == "hnsw":
+        settings = [{"ef_search": e} for e in args.ef_search]
+    else:
+        settings = [{}]
+    report = [evaluate(index, vectors, queries, k, **s) for s in settings]
+
+    print(f"\n{'nprobe':>8}{'efSearch':>10}{f'recall@{k}':>12}{'batch ms/q':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for row in report:
+        print(f"{row['nprobe']:>8}{row['ef_search']:>10}{row[f'recall@{k}']:>12.4f}"
+              f"{row['batch_ms_per_query']:>12.4f}{row['p50_ms']:>10.4f}{row['p99_ms']:>10.4f}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"type": args.type, "vectors": len(vectors), "k": k, "results": report}, f, indent=2)
+    if args.output:
+        write_index(index, args.output)
+        print(f"\n✅ Wrote {args.output}; set FAISS_INDEX_PATH and FAISS_NPROBE / FAISS_EF_SEARCH to serve it")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Inference backends for the generation and embedding models.
+
+- "torch": full fp32 PyTorch (the original setup)
+- "int8":  PyTorch with dynamic int8 quantization of every nn.Linear (CPU only)
+- "onnx":  exported ONNX Runtime session via optimum; the seq2seq export keeps
+           the decoder KV-cache (use_cache=True), so each decode step reuses
+           past keys/values instead of re-running the whole prefix
+
+ONNX needs the optional `optimum[onnxruntime]` package. Exported models are
+kept under ONNX_EXPORT_DIR so the export only happens once.
+"""
+import os
+
+import config
+
+GENERATION_MODEL = "google/flan-t5-base"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+BACKENDS = ("torch", "int8", "onnx")
+
+
+def _check_backend(backend, device=-1):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+    if backend != "torch" and device not in (-1, "cpu"):
+        raise ValueError(f"The '{backend}' backend runs on CPU only")
+
+
+def _quantize(model):
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _require_optimum():
+    try:
+        import optimum.onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(
+            "The 'onnx' backend needs optimum with ONNX Runtime: pip install 'optimum[onnxruntime]'"
+        ) from e
+
+
+def load_generation_model(backend="torch", device=-1):
+    """
+    Load FLAN-T5 for the given backend.
+    Returns (model, tokenizer, pipeline_device) ready for a text2text pipeline.
+    """
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+    _check_backend(backend, device)
+    tokenizer = AutoTokenizer.from_pretrained(GENERATION_MODEL)
+
+    if backend == "onnx":
+        _require_optimum()
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+        export_dir = os.path.join(config.ONNX_EXPORT_DIR, GENERATION_MODEL.replace("/", "__"))
+        if os.path.isdir(export_dir):
+            model = ORTModelForSeq2SeqLM.from_pretrained(export_dir, use_cache=True)
+        else:
+            model = ORTModelForSeq2SeqLM.from_pretrained(GENERATION_MODEL, export=True, use_cache=True)
+            model.save_pretrained(export_dir)
+        # ONNX Runtime sessions are not moved by the pipeline
+        return model, tokenizer, None
+
+    model = AutoModelForSeq2SeqLM.from_pretrained(GENERATION_MODEL)
+    model.eval()
+    if backend == "int8":
+        model = _quantize(model)
+    return model, tokenizer, device
+
+
+def load_embedding_model(backend="torch"):
+    """Load the sentence transformer used for retrieval with the given backend"""
+    from sentence_transformers import SentenceTransformer
+
+    _check_backend(backend)
+
+    if backend == "onnx":
+        _require_optimum()
+        export_dir = os.path.join(config.ONNX_EXPORT_DIR, EMBEDDING_MODEL.replace("/", "__"))
+        if os.path.isdir(export_dir):
+            return SentenceTransformer(export_dir, backend="onnx")
+        model = SentenceTransformer(EMBEDDING_MODEL, backend="onnx")
+        model.save_pretrained(export_dir)
+        return model
+
+    model = SentenceTransformer(EMBEDDING_MODEL, device="cpu" if backend == "int8" else None)
+    if backend == "int8":
+        model = _quantize(model)
+    return model
@@ -0,0 +1,187 @@
+"""
+In-memory BM25 index over the chunk store, for hybrid lexical + dense retrieval.
+
+Postings are array-backed (CSR layout) rather than dicts of lists:
+
+- indptr  int64[n_terms + 1]   postings of term t are rows indptr[t]:indptr[t+1]
+- docs    int32[n_postings]    chunk row ids, ascending within a term
+- tfs     uint16[n_postings]   term frequency in that chunk
+- doc_len int32[n_chunks]      tokens per chunk
+
+A query gathers the postings of its terms, scores them with numpy and picks
+the top rows with argpartition, so only matching chunks are touched.
+
+The arrays are saved next to the chunk store as <prefix>.<name>.npy and
+memory-mapped, so worker processes share their pages like the chunk store's.
+<prefix>.meta.json (vocabulary and sizes) is written last and is the commit
+point; a worker whose saved index does not cover the chunk store rebuilds it.
+
+Build or rebuild by hand with:
+    python -m rag.bm25 build
+"""
+import json
+import os
+import re
+import sys
+from collections import Counter
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how in is it its of on or that the this to was what "
+    "when where which who why with".split()
+)
+ARRAYS = ("indptr", "docs", "tfs", "doc_len")
+
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _path(prefix, name):
+    return f"{prefix}.{name}.npy"
+
+
+def _meta_path(prefix):
+    return f"{prefix}.meta.json"
+
+
+class BM25Index:
+    def __init__(self, vocabulary, indptr, docs, tfs, doc_len, k1=1.2, b=0.75):
+        self.vocabulary = vocabulary          # term -> term id
+        self.indptr = indptr
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        n = len(doc_len)
+        self.avgdl = float(doc_len.mean()) if n else 0.0
+        df = np.diff(indptr).astype("float32")
+        self.idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype("float32")
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, chunks, k1=1.2, b=0.75):
+        """Index any sequence of chunk strings (row id = position)"""
+        vocabulary = {}
+        term_ids, docs, tfs = [], [], []
+        doc_len = np.zeros(len(chunks), dtype="int32")
+        for row, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            doc_len[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                docs.append(row)
+                tfs.append(min(tf, 65535))
+
+        term_ids = np.asarray(term_ids, dtype="int32")
+        # Stable sort keeps rows ascending within each term
+        order = np.argsort(term_ids, kind="stable")
+        indptr = np.zeros(len(vocabulary) + 1, dtype="int64")
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=indptr[1:])
+        return cls(
+            vocabulary, indptr,
+            np.asarray(docs, dtype="int32")[order],
+            np.asarray(tfs, dtype="uint16")[order],
+            doc_len, k1, b
+        )
+
+    def search(self, query, top_k, exclude=None):
+        """
+        (row ids, scores) of the top_k chunks for a query, best first.
+        exclude: sorted int64 array of row ids never to return (superseded rows).
+        """
+        term_ids = [self.vocabulary[t] for t in set(tokenize(query)) if t in self.vocabulary]
+        if not term_ids or top_k <= 0:
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+
+        rows, contributions = [], []
+        for t in term_ids:
+            start, end = self.indptr[t], self.indptr[t + 1]
+            docs = self.docs[start:end]
+            tf = self.tfs[start:end].astype("float32")
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / self.avgdl)
+            rows.append(docs)
+            contributions.append(self.idf[t] * tf * (self.k1 + 1) / (tf + norm))
+
+        rows = np.concatenate(rows)
+        unique, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions)).astype("float32")
+        if exclude is not None and len(exclude):
+            keep = ~np.isin(unique, exclude, assume_unique=True)
+            unique, scores = unique[keep], scores[keep]
+
+        if len(unique) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(unique))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return unique[top].astype("int64"), scores[top]
+
+    def save(self, prefix):
+        """Write the arrays, then the metadata (the commit point), each atomically"""
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        for name in ARRAYS:
+            tmp = f"{prefix}.{name}.tmp-{os.getpid()}.npy"
+            np.save(tmp, getattr(self, name))
+            os.replace(tmp, _path(prefix, name))
+        meta = {
+            "chunks": len(self),
+            "postings": len(self.docs),
+            "k1": self.k1,
+            "b": self.b,
+            "vocabulary": self.vocabulary,
+        }
+        tmp = f"{_meta_path(prefix)}.tmp-{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, _meta_path(prefix))
+
+    @classmethod
+    def load(cls, prefix):
+        """Memory-map a saved index; raises ValueError if its files do not match"""
+        with open(_meta_path(prefix)) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(_path(prefix, name), mmap_mode="r") for name in ARRAYS}
+        if len(arrays["doc_len"]) != meta["chunks"] or len(arrays["docs"]) != meta["postings"] \
+                or len(arrays["indptr"]) != len(meta["vocabulary"]) + 1:
+            raise ValueError(f"BM25 index files at {prefix} are inconsistent")
+        return cls(meta["vocabulary"], k1=meta["k1"], b=meta["b"], **arrays)
+
+
+def load_or_build(prefix, chunks, k1=1.2, b=0.75):
+    """
+    The saved index if it covers exactly these chunks, otherwise a fresh one
+    (saved for the other workers when possible).
+    """
+    try:
+        index = BM25Index.load(prefix)
+        if len(index) == len(chunks) and (index.k1, index.b) == (k1, b):
+            return index
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"⚠️ Rebuilding BM25 index: {e}")
+
+    print(f"🔤 Building BM25 index over {len(chunks)} chunks...")
+    index = BM25Index.build(chunks, k1, b)
+    try:
+        index.save(prefix)
+    except OSError as e:
+        print(f"⚠️ Could not save BM25 index: {e}")
+    return index
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "build":
+        sys.exit("Usage: python -m rag.bm25 build")
+    import config
+    from rag.chunk_store import load_chunks
+
+    chunks = load_chunks(config.CHUNK_STORE_PATH, config.CHUNKS_PICKLE_PATH)
+    index = BM25Index.build(chunks, config.BM25_K1, config.BM25_B)
+    index.save(config.BM25_INDEX_PATH)
+    print(f"✅ BM25 index: {len(index)} chunks, {len(index.vocabulary)} terms, {len(index.docs)} postings")
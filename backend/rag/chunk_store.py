@@ -0,0 +1,149 @@
+"""
+Compact, memory-mapped chunk store.
+
+Chunks are kept as one UTF-8 blob (<prefix>.bin) plus an array of
+len(chunks) + 1 little-endian uint64 byte offsets (<prefix>.offsets). Both
+files are memory-mapped read-only, so every worker process shares the same
+pages through the OS page cache, and only the chunks actually requested are
+decoded into Python strings.
+
+Convert the existing pickle with:
+    python -m rag.chunk_store convert data/chunks.pkl data/chunks
+"""
+import mmap
+import os
+import pickle
+import sys
+
+import numpy as np
+
+OFFSET_DTYPE = np.dtype("<u8")
+
+
+def blob_path(prefix):
+    return prefix + ".bin"
+
+
+def offsets_path(prefix):
+    return prefix + ".offsets"
+
+
+def store_exists(prefix):
+    return os.path.exists(blob_path(prefix)) and os.path.exists(offsets_path(prefix))
+
+
+class ChunkStore:
+    """Read-only sequence of chunk strings backed by memory-mapped files"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._offsets = np.memmap(offsets_path(prefix), dtype=OFFSET_DTYPE, mode="r")
+        if len(self._offsets) == 0:
+            raise ValueError(f"Chunk store offsets file is empty: {offsets_path(prefix)}")
+
+        with open(blob_path(prefix), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap cannot map an empty file
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        if int(self._offsets[-1]) > size:
+            raise ValueError(f"Chunk store blob is shorter than its offsets: {blob_path(prefix)}")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def get_many(self, indices):
+        return [self[i] for i in indices]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _replace_atomically(path, write):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def write_chunk_store(chunks, prefix):
+    """Write chunks (any iterable of str) as a chunk store; returns the number written"""
+    offsets = [0]
+
+    def write_blob(f):
+        position = 0
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            f.write(data)
+            position += len(data)
+            offsets.append(position)
+
+    # The blob goes first so that the offsets never point past its end
+    _replace_atomically(blob_path(prefix), write_blob)
+    _replace_atomically(
+        offsets_path(prefix),
+        lambda f: f.write(np.asarray(offsets, dtype=OFFSET_DTYPE).tobytes())
+    )
+    return len(offsets) - 1
+
+
+def append_chunks(prefix, chunks):
+    """
+    Append chunks to an existing store; returns the row id of the first new chunk.
+    The blob is extended in place (readers never look past their offsets), then
+    the offsets file is replaced atomically, so open readers are unaffected.
+    """
+    offsets = np.fromfile(offsets_path(prefix), dtype=OFFSET_DTYPE).tolist()
+    first_row = len(offsets) - 1
+
+    with open(blob_path(prefix), "r+b") as f:
+        # Drop any tail left by an interrupted append
+        f.truncate(offsets[-1])
+        f.seek(offsets[-1])
+        position = offsets[-1]
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            f.write(data)
+            position += len(data)
+            offsets.append(position)
+        f.flush()
+        os.fsync(f.fileno())
+
+    _replace_atomically(
+        offsets_path(prefix),
+        lambda f: f.write(np.asarray(offsets, dtype=OFFSET_DTYPE).tobytes())
+    )
+    return first_row
+
+
+def convert_pickle(pickle_path, prefix):
+    with open(pickle_path, "rb") as f:
+        chunks = pickle.load(f)
+    return write_chunk_store(chunks, prefix)
+
+
+def load_chunks(prefix, pickle_path):
+    """Open the chunk store if it exists, otherwise fall back to the pickled list"""
+    if store_exists(prefix):
+        return ChunkStore(prefix)
+    with open(pickle_path, "rb") as f:
+        return pickle.load(f)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "convert":
+        sys.exit("Usage: python -m rag.chunk_store convert <chunks.pkl> <output prefix>")
+    count = convert_pickle(sys.argv[2], sys.argv[3])
+    print(f"✅ Wrote {count} chunks to {blob_path(sys.argv[3])} and {offsets_path(sys.argv[3])}")
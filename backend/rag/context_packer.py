@@ -0,0 +1,148 @@
+"""
+Token-aware packing of retrieved chunks into the generation prompt.
+
+FLAN-T5 reads at most 512 tokens; the pipeline used to truncate the end of an
+over-long prompt (the question and the "Answer:" cue go first) after every
+context token had already been tokenized. The packer budgets by tokens instead:
+
+- chunks are tokenized once (memoized by text) and ranked by retrieval distance
+- a chunk that is a near-duplicate of one already packed (Jaccard similarity
+  of token 4-gram shingles >= CONTEXT_DEDUP_THRESHOLD) is skipped
+- chunks are added best-first while the whole prompt fits CONTEXT_TOKEN_BUDGET;
+  a chunk that does not fit is cut at a sentence boundary when at least
+  CONTEXT_MIN_CHUNK_TOKENS of it still fit
+- the instructions and the question are never cut
+"""
+import re
+from functools import lru_cache
+
+import config
+import metrics
+
+SHINGLE_SIZE = 4
+# Held back for token merges at the joins between pieces and the end-of-sequence token
+SAFETY_TOKENS = 8
+
+PROMPT_TOKENS = metrics.register(metrics.Histogram(
+    "nlpassist_prompt_tokens", "Encoder tokens per packed generation prompt", buckets=metrics.TOKEN_BUCKETS
+))
+TOKENS_SAVED = metrics.register(metrics.Counter(
+    "nlpassist_encoder_tokens_saved_total",
+    "Encoder tokens saved by context packing, relative to the truncated unpacked prompt"
+))
+PACKED_CHUNKS = metrics.register(metrics.Counter(
+    "nlpassist_context_chunks_total", "Retrieved chunks by what context packing did with them",
+    labels=("outcome",)
+))
+
+_sentence_end = re.compile(r"[.!?](?=\s|$)")
+
+
+class PackedContext:
+    """The chunks that made it into a prompt, and what packing saved"""
+
+    def __init__(self, chunks, prompt_tokens, unpacked_tokens, max_length, fixed_tokens=0, duplicates=0, truncated=0,
+                 dropped=0):
+        self.chunks = chunks
+        self.prompt_tokens = prompt_tokens
+        self.unpacked_tokens = unpacked_tokens
+        self.max_length = max_length
+        # Tokens of the packed chunks (and the spaces joining them)
+        self.context_tokens = prompt_tokens - fixed_tokens
+        self.duplicates = duplicates
+        self.truncated = truncated
+        self.dropped = dropped
+
+    @property
+    def tokens_saved(self):
+        """Encoder tokens saved against the unpacked prompt after the pipeline's truncation"""
+        return max(0, min(self.unpacked_tokens, self.max_length) - self.prompt_tokens)
+
+    @property
+    def question_was_cut(self):
+        """Whether the unpacked prompt would have lost its question to truncation"""
+        return self.unpacked_tokens > self.max_length
+
+
+def _shingles(ids):
+    if len(ids) <= SHINGLE_SIZE:
+        return frozenset([tuple(ids)])
+    return frozenset(tuple(ids[i:i + SHINGLE_SIZE]) for i in range(len(ids) - SHINGLE_SIZE + 1))
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextPacker:
+    def __init__(self, tokenizer, head, tail, budget=None, dedup_threshold=None, min_chunk_tokens=None,
+                 cache_size=4096):
+        """
+        head is the prompt text before the context, tail a format string for the
+        text after it, with a {question} field.
+        """
+        self.tokenizer = tokenizer
+        self.head = head
+        self.tail = tail
+        # Tokenizers without a limit report a huge model_max_length
+        self.max_length = tokenizer.model_max_length if tokenizer.model_max_length <= 100000 else 512
+        self.budget = min(budget or config.CONTEXT_TOKEN_BUDGET, self.max_length)
+        self.dedup_threshold = config.CONTEXT_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold
+        self.min_chunk_tokens = config.CONTEXT_MIN_CHUNK_TOKENS if min_chunk_tokens is None else min_chunk_tokens
+        # The same chunks are retrieved for many questions; token ids are kept per chunk text
+        self.token_ids = lru_cache(maxsize=cache_size)(self._encode)
+
+    def _encode(self, text):
+        return tuple(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def _cut(self, ids, max_tokens):
+        """The first max_tokens of a chunk, ending at a sentence boundary when there is one"""
+        text = self.tokenizer.decode(list(ids[:max_tokens]), skip_special_tokens=True).strip()
+        ends = [m.end() for m in _sentence_end.finditer(text)]
+        if ends and ends[-1] >= len(text) // 2:
+            text = text[:ends[-1]]
+        return text
+
+    def pack(self, question, chunks, distances=None):
+        order = list(range(len(chunks)))
+        if distances is not None and len(distances) == len(chunks):
+            order.sort(key=lambda i: float(distances[i]))
+
+        # One token per chunk for the space that joins it to the previous piece
+        fixed = len(self.token_ids(self.head)) + len(self._encode(self.tail.format(question=question))) + 1
+        unpacked = fixed + sum(len(self.token_ids(chunk)) + 1 for chunk in chunks)
+        room = self.budget - fixed - SAFETY_TOKENS
+
+        packed, kept, used = [], [], 0
+        duplicates = truncated = dropped = 0
+        for i in order:
+            ids = self.token_ids(chunks[i])
+            shingles = _shingles(ids)
+            if any(_jaccard(shingles, other) >= self.dedup_threshold for other in kept):
+                duplicates += 1
+                continue
+            cost = len(ids) + 1
+            if cost <= room - used:
+                packed.append(chunks[i])
+                kept.append(shingles)
+                used += cost
+            elif room - used - 1 >= self.min_chunk_tokens:
+                packed.append(self._cut(ids, room - used - 1))
+                kept.append(shingles)
+                truncated += 1
+                used = room
+            else:
+                dropped += 1
+
+        result = PackedContext(packed, fixed + used, unpacked, self.max_length, fixed, duplicates, truncated, dropped)
+        PROMPT_TOKENS.observe(result.prompt_tokens)
+        TOKENS_SAVED.inc(result.tokens_saved)
+        for outcome, count in (("packed", len(packed) - truncated), ("truncated", truncated),
+                               ("duplicate", duplicates), ("dropped", dropped)):
+            if count:
+                PACKED_CHUNKS.inc(count, outcome=outcome)
+        metrics.count("prompt_tokens", result.prompt_tokens)
+        metrics.count("encoder_tokens_saved", result.tokens_saved)
+        return result
@@ -0,0 +1,137 @@
+"""
+Decoding controls for FLAN-T5.
+
+Instead of decoding a fixed 100-512 tokens, each answer stops as soon as it
+has max_sentences complete sentences or reaches its length budget, which grows
+with the amount of context in the prompt:
+
+    max_new_tokens = length_base + length_per_context_token * context tokens
+                     (capped at MAX_GENERATION_LENGTH)
+
+Repetition can also be discouraged while decoding (no_repeat_ngram_size,
+repetition_penalty); both are off unless configured or requested.
+
+Defaults come from config.py; /api/ask, /api/ask/stream and /api/ask_batch
+accept per-request overrides in a "decoding" object.
+"""
+import config
+
+# Request field -> (type, min, max)
+OVERRIDES = {
+    "no_repeat_ngram_size": (int, 0, 10),
+    "repetition_penalty": (float, 1.0, 2.0),
+    "max_sentences": (int, 0, 30),
+    "min_length": (int, 0, 512),
+    "max_length": (int, 16, 512),
+    "length_per_context_token": (float, 0.0, 4.0),
+}
+
+
+class DecodeOptions:
+    def __init__(self, no_repeat_ngram_size=None, repetition_penalty=None, max_sentences=None, min_length=None,
+                 max_length=None, length_base=None, length_per_context_token=None, overridden=False):
+        def pick(value, default):
+            return default if value is None else value
+
+        self.no_repeat_ngram_size = pick(no_repeat_ngram_size, config.DECODE_NO_REPEAT_NGRAM_SIZE)
+        self.repetition_penalty = pick(repetition_penalty, config.DECODE_REPETITION_PENALTY)
+        self.max_sentences = pick(max_sentences, config.DECODE_MAX_SENTENCES)
+        self.min_length = pick(min_length, config.DECODE_MIN_LENGTH)
+        self.max_length = min(pick(max_length, config.MAX_GENERATION_LENGTH), 512)
+        self.length_base = pick(length_base, config.DECODE_LENGTH_BASE)
+        self.length_per_context_token = pick(length_per_context_token, config.DECODE_LENGTH_PER_CONTEXT_TOKEN)
+        # Answers decoded with per-request settings are not shared through the cache
+        self.overridden = overridden
+
+    @classmethod
+    def from_request(cls, overrides):
+        """Options from a request's "decoding" object; raises ValueError on bad input"""
+        if overrides is None:
+            return cls()
+        if not isinstance(overrides, dict):
+            raise ValueError("decoding must be an object")
+        unknown = set(overrides) - set(OVERRIDES)
+        if unknown:
+            raise ValueError(f"Unknown decoding option(s): {', '.join(sorted(unknown))}")
+        values = {}
+        for name, value in overrides.items():
+            kind, low, high = OVERRIDES[name]
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or \
+                    (kind is int and value != int(value)):
+                raise ValueError(f"decoding.{name} must be a{'n integer' if kind is int else ' number'}")
+            if not low <= value <= high:
+                raise ValueError(f"decoding.{name} must be between {low} and {high}")
+            values[name] = kind(value)
+        return cls(overridden=bool(values), **values)
+
+    def budget(self, context_tokens=None):
+        """Most tokens to decode for an answer over this much context (None: the cap)"""
+        if context_tokens is None:
+            return self.max_length
+        budget = self.length_base + self.length_per_context_token * context_tokens
+        return max(1, min(self.max_length, int(budget)))
+
+    @property
+    def batch_key(self):
+        """Settings that must be shared by every answer in one decode batch"""
+        return self.no_repeat_ngram_size, self.repetition_penalty, self.min_length
+
+    def generate_kwargs(self, max_new_tokens):
+        kwargs = {
+            "max_new_tokens": max_new_tokens,
+            "min_length": min(self.min_length, max_new_tokens),
+            "do_sample": False,
+        }
+        if self.no_repeat_ngram_size:
+            kwargs["no_repeat_ngram_size"] = self.no_repeat_ngram_size
+        if self.repetition_penalty != 1.0:
+            kwargs["repetition_penalty"] = self.repetition_penalty
+        return kwargs
+
+
+class DecodeRequest:
+    """One prompt queued for decoding, with its own stopping limits"""
+    __slots__ = ("prompt", "options", "max_new_tokens")
+
+    def __init__(self, prompt, context_tokens=None, options=None):
+        self.prompt = prompt
+        self.options = options or DecodeOptions()
+        self.max_new_tokens = self.options.budget(context_tokens)
+
+
+def sentence_end_ids(tokenizer):
+    """Ids of the vocabulary pieces that end a sentence"""
+    pieces = tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))
+    return {token_id for token_id, piece in enumerate(pieces) if piece and piece.endswith((".", "!", "?"))}
+
+
+def stopping_criteria(requests, sentence_ends):
+    """
+    Per-row stopping for a batch: a row is finished once it has decoded its
+    max_new_tokens or max_sentences sentence-ending tokens. Relies on
+    transformers returning per-row stopping tensors (4.39+).
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    limits = [r.max_new_tokens for r in requests]
+    max_sentences = [r.options.max_sentences for r in requests]
+
+    class AnswerStopper(StoppingCriteria):
+        def __init__(self):
+            self.sentences = [0] * len(requests)
+
+        def __call__(self, input_ids, scores, **kwargs):
+            # Decoder ids start with the decoder start token
+            generated = input_ids.shape[-1] - 1
+            done = []
+            for row, last in enumerate(input_ids[:, -1].tolist()):
+                if generated > 0 and last in sentence_ends:
+                    self.sentences[row] += 1
+                done.append(
+                    generated >= limits[row]
+                    or (max_sentences[row] > 0 and self.sentences[row] >= max_sentences[row])
+                )
+            return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([AnswerStopper()])
@@ -0,0 +1,222 @@
+"""
+Memo of question embeddings and FAISS search results.
+
+Questions are keyed by their normalized text (lowercased, whitespace collapsed,
+trailing punctuation dropped), so repeats and near-repeats of a question are
+embedded and searched once. Two tables are kept:
+
+- vectors: (embedding model, question) -> float32 embedding
+- results: (index signature, top_k, question) -> row ids and L2 distances
+
+The index signature includes the manifest version and search parameters, so
+results from before an ingestion or an index swap are never served.
+
+Lookups go through a bounded in-process LRU first, then a SQLite file shared
+by every worker process (WAL mode, so readers do not block the writer).
+Arrays are stored as raw little-endian float32/int64 bytes.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+from hot_cache import normalize_question
+
+LOOKUPS = metrics.register(metrics.Counter(
+    "nlpassist_embedding_memo_lookups_total", "Embedding memo lookups by table and where they were answered",
+    labels=("table", "outcome")
+))
+
+# Rows are pruned back to the limit once every this many writes
+PRUNE_EVERY = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    model TEXT NOT NULL,
+    question TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (model, question)
+);
+CREATE TABLE IF NOT EXISTS results (
+    signature TEXT NOT NULL,
+    top_k INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    indices BLOB NOT NULL,
+    distances BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (signature, top_k, question)
+);
+"""
+
+
+class _LRU:
+    def __init__(self, max_entries):
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class EmbeddingMemo:
+    def __init__(self, path=None, max_entries=1000, max_stored=100000):
+        self.path = path or None
+        self.max_stored = max_stored
+        self._memory = _LRU(max_entries)
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    # SQLite connections are per thread and per process (never reused across a fork)
+    def _db(self):
+        if not self.path:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _query(self, sql, params):
+        try:
+            conn = self._db()
+            return conn.execute(sql, params).fetchone() if conn else None
+        except sqlite3.Error as e:
+            print(f"⚠️ Embedding memo read failed: {e}")
+            return None
+
+    def _store(self, table, sql, params):
+        try:
+            conn = self._db()
+            if conn is None:
+                return
+            conn.execute(sql, params)
+            with self._writes_lock:
+                self._writes += 1
+                prune = self._writes % PRUNE_EVERY == 0
+            if prune:
+                self._prune(conn, table)
+        except sqlite3.Error as e:
+            # The memo is an optimization; a busy or read-only store never fails a request
+            print(f"⚠️ Embedding memo write failed: {e}")
+
+    def _prune(self, conn, table):
+        """Drop the oldest rows beyond max_stored"""
+        (count,) = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        if count > self.max_stored:
+            conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN "
+                f"(SELECT rowid FROM {table} ORDER BY created_at LIMIT ?)",
+                (count - self.max_stored,)
+            )
+
+    def get_vector(self, model, question):
+        key = ("v", model, normalize_question(question))
+        vector = self._memory.get(key)
+        if vector is not None:
+            LOOKUPS.inc(table="vectors", outcome="memory")
+            return vector
+        row = self._query("SELECT vector FROM vectors WHERE model = ? AND question = ?", key[1:])
+        if row is None:
+            LOOKUPS.inc(table="vectors", outcome="miss")
+            return None
+        LOOKUPS.inc(table="vectors", outcome="disk")
+        vector = np.frombuffer(row[0], dtype="<f4")
+        self._memory.put(key, vector)
+        return vector
+
+    def put_vector(self, model, question, vector):
+        question = normalize_question(question)
+        vector = np.ascontiguousarray(vector, dtype="<f4")
+        vector.flags.writeable = False
+        self._memory.put(("v", model, question), vector)
+        self._store(
+            "vectors",
+            "INSERT OR REPLACE INTO vectors (model, question, vector, created_at) VALUES (?, ?, ?, ?)",
+            (model, question, vector.tobytes(), time.time())
+        )
+
+    def get_results(self, signature, top_k, question):
+        """(indices, distances) of an earlier search, or None"""
+        key = ("r", signature, top_k, normalize_question(question))
+        hit = self._memory.get(key)
+        if hit is not None:
+            LOOKUPS.inc(table="results", outcome="memory")
+            return hit
+        row = self._query(
+            "SELECT indices, distances FROM results WHERE signature = ? AND top_k = ? AND question = ?",
+            key[1:]
+        )
+        if row is None:
+            LOOKUPS.inc(table="results", outcome="miss")
+            return None
+        LOOKUPS.inc(table="results", outcome="disk")
+        hit = (np.frombuffer(row[0], dtype="<i8"), np.frombuffer(row[1], dtype="<f4"))
+        self._memory.put(key, hit)
+        return hit
+
+    def put_results(self, signature, top_k, question, indices, distances):
+        question = normalize_question(question)
+        indices = np.ascontiguousarray(indices, dtype="<i8")
+        distances = np.ascontiguousarray(distances, dtype="<f4")
+        indices.flags.writeable = False
+        distances.flags.writeable = False
+        self._memory.put(("r", signature, top_k, question), (indices, distances))
+        self._store(
+            "results",
+            "INSERT OR REPLACE INTO results (signature, top_k, question, indices, distances, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (signature, top_k, question, indices.tobytes(), distances.tobytes(), time.time())
+        )
+
+    def drop_stale_results(self, signature):
+        """Delete stored results computed against any other index signature"""
+        try:
+            conn = self._db()
+            if conn is not None:
+                conn.execute("DELETE FROM results WHERE signature != ?", (signature,))
+        except sqlite3.Error as e:
+            print(f"⚠️ Embedding memo cleanup failed: {e}")
+
+    def clear(self):
+        self._memory.clear()
+        try:
+            conn = self._db()
+            if conn is not None:
+                conn.execute("DELETE FROM vectors")
+                conn.execute("DELETE FROM results")
+        except sqlite3.Error as e:
+            print(f"⚠️ Embedding memo clear failed: {e}")
+
+    def stats(self):
+        return {"memory_entries": len(self._memory), "path": self.path}
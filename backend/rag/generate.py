@@ -1,20 +1,58 @@
 import re
-from transformers import pipeline
-import torch
-
-# Check if GPU is available
-device = 0 if torch.cuda.is_available() else -1
-print(f"🎮 Using device: {'GPU (CUDA)' if device == 0 else 'CPU'}")
-
-llm = pipeline(
-    "text2text-generation",
-    model="google/flan-t5-base",
-    max_length=512,
-    min_length=100,
-    do_sample=False,
-    truncation=True,
-    device=device
-)
+import threading
+import time
+
+import config
+import metrics
+from rag.backends import load_generation_model
+from rag.context_packer import ContextPacker
+from rag.decoding import DecodeRequest, sentence_end_ids, stopping_criteria
+from rag.scheduler import GenerationScheduler
+
+# torch/transformers and FLAN-T5 are loaded on first use (or by model_loader at startup)
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = _load_llm()
+    return _llm
+
+
+def _load_llm():
+    import torch
+    from transformers import pipeline
+
+    # Check if GPU is available (quantized and ONNX backends run on CPU)
+    device = 0 if torch.cuda.is_available() and config.GENERATION_BACKEND == "torch" else -1
+    print(f"🎮 Using device: {'GPU (CUDA)' if device == 0 else 'CPU'}")
+
+    model, tokenizer, pipeline_device = load_generation_model(config.GENERATION_BACKEND, device)
+    print(f"🧮 Generation backend: {config.GENERATION_BACKEND}")
+
+    # Decoding calls model.generate directly (see rag/decoding.py); the pipeline
+    # places the model on its device and keeps the model and tokenizer together
+    return pipeline(
+        "text2text-generation",
+        model=model,
+        tokenizer=tokenizer,
+        truncation=True,
+        device=pipeline_device
+    )
+
+
+_sentence_ends = None
+
+
+def get_sentence_ends():
+    global _sentence_ends
+    if _sentence_ends is None:
+        _sentence_ends = sentence_end_ids(get_llm().tokenizer)
+    return _sentence_ends
 
 
 def clean_repetition(text):
@@ -31,11 +69,136 @@ def clean_repetition(text):
     return " ".join(cleaned)
 
 
-def generate(question, context):
-    if not context:
-        return "I am not confident enough to answer this question based on the available documents."
+class IncrementalCleaner:
+    """
+    Streaming counterpart of clean_repetition.
+    Text is fed in as it is decoded; a sentence is held back only while it
+    could still turn out to repeat an earlier sentence, and dropped if it does.
+    Everything else is passed through as soon as it arrives.
+    """
+
+    _boundary = re.compile(r'(?<=[.!?])\s+')
+
+    def __init__(self):
+        self.seen = set()
+        self.current = ""
+        self.emitted = 0          # chars of the current sentence already emitted
+        self.started = False      # anything emitted yet (controls separators)
+
+    @staticmethod
+    def _key(sentence):
+        return re.sub(r"[^\w\s]", "", sentence.lower())
+
+    def _emit(self, text):
+        if self.emitted == 0 and self.started:
+            text = " " + text
+        self.started = True
+        return text
+
+    def _finish(self, sentence):
+        key = self._key(sentence)
+        out = ""
+        if self.emitted:
+            out = sentence[self.emitted:]
+        elif key not in self.seen and sentence:
+            out = self._emit(sentence)
+        self.seen.add(key)
+        self.emitted = 0
+        return out
+
+    def _partial(self):
+        if self.emitted:
+            out = self.current[self.emitted:]
+        else:
+            key = self._key(self.current)
+            if not self.current or any(seen.startswith(key) for seen in self.seen):
+                return ""
+            out = self._emit(self.current)
+        self.emitted = len(self.current)
+        return out
+
+    def feed(self, text):
+        """Add decoded text; returns the text that is safe to show now"""
+        if not self.started and not self.current:
+            text = text.lstrip()
+        self.current += text
+        out = ""
+        while True:
+            match = self._boundary.search(self.current)
+            if not match:
+                break
+            out += self._finish(self.current[:match.start()])
+            self.current = self.current[match.end():]
+        return out + self._partial()
+
+    def close(self):
+        """Flush the last sentence at the end of the stream"""
+        sentence = self.current.rstrip()
+        self.current = ""
+        if not sentence:
+            return ""
+        self.emitted = min(self.emitted, len(sentence))
+        return self._finish(sentence)
+
+
+REFUSAL = "I am not confident enough to answer this question based on the available documents."
+
+
+def record_generated_tokens(texts):
+    """Count decoded tokens for the metrics endpoint"""
+    tokenizer = get_llm().tokenizer
+    for text in texts:
+        metrics.record_tokens(len(tokenizer(text, add_special_tokens=False)["input_ids"]))
+
+
+def run_batch(requests):
+    """
+    Decode several DecodeRequests as padded batches, one per set of settings
+    that cannot differ within a batch. Each row stops at its own length
+    budget or sentence limit.
+    """
+    texts = [None] * len(requests)
+    groups = {}
+    for i, request in enumerate(requests):
+        groups.setdefault(request.options.batch_key, []).append(i)
+    for rows in groups.values():
+        for i, text in zip(rows, _decode_group([requests[i] for i in rows])):
+            texts[i] = text
+    return texts
+
+
+def _decode_group(requests):
+    import torch
+
+    llm = get_llm()
+    tokenizer = llm.tokenizer
+    inputs = tokenizer(
+        [r.prompt for r in requests],
+        return_tensors="pt",
+        padding=True,
+        truncation=True,
+        max_length=tokenizer.model_max_length
+    ).to(llm.model.device)
+    with torch.no_grad():
+        sequences = llm.model.generate(
+            **inputs,
+            stopping_criteria=stopping_criteria(requests, get_sentence_ends()),
+            **requests[0].options.generate_kwargs(max(r.max_new_tokens for r in requests))
+        )
+    # Decoder output starts with (and finished rows are filled with) the pad token
+    for count in (sequences != tokenizer.pad_token_id).sum(dim=1).tolist():
+        metrics.record_tokens(count)
+    return tokenizer.batch_decode(sequences, skip_special_tokens=True)
+
 
-    prompt = f"""
+scheduler = GenerationScheduler(
+    run_batch,
+    max_batch_size=config.GENERATION_BATCH_MAX_SIZE,
+    window_ms=config.GENERATION_BATCH_WINDOW_MS
+)
+
+
+PROMPT_HEAD = """
 You are NLPAssist+, an educational AI assistant.
 
 Answer the question using the information from the context below. Your answer should:
@@ -46,7 +209,9 @@ Answer the question using the information from the context below. Your answer sh
 - Not mention RAG or retrieval systems unless the question asks about them
 
 Context:
-{' '.join(context)}
+"""
+
+PROMPT_TAIL = """
 
 Question:
 {question}
@@ -54,7 +219,48 @@ Question:
 Answer:
 """
 
-    raw = llm(prompt)[0]["generated_text"]
+_packer = None
+
+
+def get_packer():
+    global _packer
+    if _packer is None:
+        _packer = ContextPacker(get_llm().tokenizer, PROMPT_HEAD, PROMPT_TAIL)
+    return _packer
+
+
+def build_prompt(question, context):
+    return PROMPT_HEAD + " ".join(context) + PROMPT_TAIL.format(question=question)
+
+
+def prepare_prompt(question, context, distances=None):
+    """
+    (prompt, context tokens) for one question. With CONTEXT_PACKING on, the
+    context is ranked by distance, de-duplicated and fitted to
+    CONTEXT_TOKEN_BUDGET (see rag/context_packer.py) instead of being cut off
+    by the pipeline.
+    """
+    packer = get_packer()
+    if config.CONTEXT_PACKING:
+        packed = packer.pack(question, context, distances)
+        return build_prompt(question, packed.chunks), packed.context_tokens
+    return build_prompt(question, context), sum(len(packer.token_ids(chunk)) + 1 for chunk in context)
+
+
+def decode(prompt, options=None, context_tokens=None):
+    """
+    Run FLAN-T5 on one prompt, merged with concurrent requests when batching is on.
+    The length budget follows context_tokens (the full MAX_GENERATION_LENGTH when
+    unknown). The t5_decode stage includes time spent waiting for a batch slot.
+    """
+    request = DecodeRequest(prompt, context_tokens, options)
+    with metrics.timer("t5_decode"):
+        if config.GENERATION_BATCHING:
+            return scheduler.submit(request)
+        return run_batch([request])[0]
+
+
+def postprocess(question, raw):
     answer = clean_repetition(raw).strip()
     
     # DEBUG
@@ -66,7 +272,7 @@ Answer:
     print("======================\n")
     
     if len(answer.split()) < 8:
-        return "I am not confident enough to answer this question based on the available documents."
+        return REFUSAL
 
     if "rag" not in question.lower():
         answer = re.sub(
@@ -77,3 +283,104 @@ Answer:
         ).strip()
 
     return answer
+
+
+def generate(question, context, distances=None, options=None):
+    if not context:
+        return REFUSAL
+
+    with metrics.timer("prompt_build"):
+        prompt, context_tokens = prepare_prompt(question, context, distances)
+    raw = decode(prompt, options, context_tokens)
+    return postprocess(question, raw)
+
+
+def generate_batch(questions, contexts, distances=None, options=None):
+    """
+    Generate answers for many questions, decoding in batches of
+    GENERATION_BATCH_MAX_SIZE. Questions without context are refused.
+    """
+    distances = distances or [None] * len(questions)
+    answers = [REFUSAL] * len(questions)
+    pending = [i for i, context in enumerate(contexts) if context]
+    size = config.GENERATION_BATCH_MAX_SIZE
+
+    for start in range(0, len(pending), size):
+        batch = pending[start:start + size]
+        with metrics.timer("prompt_build"):
+            requests = [
+                DecodeRequest(*prepare_prompt(questions[i], contexts[i], distances[i]), options=options)
+                for i in batch
+            ]
+        with metrics.timer("t5_decode"):
+            raws = run_batch(requests)
+        for i, raw in zip(batch, raws):
+            answers[i] = postprocess(questions[i], raw)
+
+    return answers
+
+
+def generate_stream(question, context, distances=None, options=None):
+    """
+    Stream an answer while FLAN-T5 decodes it.
+    Yields ("token", text) for de-duplicated text as it is produced, then one
+    ("answer", final_answer) with the fully post-processed answer, which is
+    authoritative (it may differ from the streamed text, e.g. when the answer
+    is too short and becomes a refusal).
+    """
+    if not context:
+        yield "answer", REFUSAL
+        return
+
+    import torch
+    from transformers import TextIteratorStreamer
+
+    llm = get_llm()
+    tokenizer = llm.tokenizer
+    with metrics.timer("prompt_build"):
+        prompt, context_tokens = prepare_prompt(question, context, distances)
+        inputs = tokenizer(
+            prompt,
+            return_tensors="pt",
+            truncation=True,
+            max_length=tokenizer.model_max_length
+        ).to(llm.model.device)
+    request = DecodeRequest(prompt, context_tokens, options)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+    errors = []
+
+    def run():
+        try:
+            with torch.no_grad():
+                llm.model.generate(
+                    **inputs,
+                    streamer=streamer,
+                    stopping_criteria=stopping_criteria([request], get_sentence_ends()),
+                    **request.options.generate_kwargs(request.max_new_tokens)
+                )
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    decode_start = time.perf_counter()
+    worker = threading.Thread(target=run, name="generation-stream", daemon=True)
+    worker.start()
+
+    cleaner = IncrementalCleaner()
+    raw = ""
+    for piece in streamer:
+        raw += piece
+        text = cleaner.feed(piece)
+        if text:
+            yield "token", text
+    worker.join()
+    metrics.record("t5_decode", time.perf_counter() - decode_start)
+    if errors:
+        raise errors[0]
+    record_generated_tokens([raw])
+
+    tail = cleaner.close()
+    if tail:
+        yield "token", tail
+    yield "answer", postprocess(question, raw)
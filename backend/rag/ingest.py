@@ -0,0 +1,203 @@
+"""
+Incremental document ingestion.
+
+Documents are streamed in, split into chunks, embedded in batches and
+appended to the live FAISS index and chunk store without a rebuild. Each
+commit writes, in order: the chunk blob (appended in place), the offsets file,
+the index, the BM25 index (rebuilt, when HYBRID_RETRIEVAL is on) and finally
+the manifest, each replaced atomically. Running workers
+notice the new manifest version and hot-swap to the new index between
+requests (see rag.retrieve), so no request is dropped.
+
+Re-ingesting a document id supersedes its previous chunks: their rows are
+marked deleted in the manifest (filtered out at search time) and cached
+answers built from them are invalidated.
+
+Usage (from the backend directory):
+    python -m rag.ingest docs/                 # every .txt/.md file, id = relative path
+    python -m rag.ingest notes.txt --doc-id notes
+    cat docs.jsonl | python -m rag.ingest -    # one {"id": ..., "text": ...} per line
+"""
+import argparse
+import fcntl
+import json
+import os
+import re
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+import faiss
+import numpy as np
+
+import config
+from rag.ann import write_index
+from rag.bm25 import BM25Index
+from rag.chunk_store import ChunkStore, append_chunks, convert_pickle, store_exists
+from rag.manifest import read_manifest, write_manifest
+
+TEXT_EXTENSIONS = (".txt", ".md")
+
+
+def chunk_text(text, max_words=None, overlap_words=None):
+    """
+    Split text into chunks of whole sentences of up to max_words words,
+    carrying the last sentences of each chunk over (up to overlap_words words).
+    """
+    max_words = max_words or config.INGEST_CHUNK_WORDS
+    overlap_words = config.INGEST_OVERLAP_WORDS if overlap_words is None else overlap_words
+
+    sentences = [s for s in re.split(r'(?<=[.!?])\s+', re.sub(r"\s+", " ", text).strip()) if s]
+    chunks, current, count = [], [], 0
+    for sentence in sentences:
+        words = len(sentence.split())
+        if current and count + words > max_words:
+            chunks.append(" ".join(current))
+            # Start the next chunk with the tail of this one for context
+            carried, carried_words = [], 0
+            for previous in reversed(current):
+                n = len(previous.split())
+                if carried_words + n > overlap_words:
+                    break
+                carried.insert(0, previous)
+                carried_words += n
+            current, count = carried, carried_words
+        current.append(sentence)
+        count += words
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+@contextmanager
+def ingestion_lock():
+    """Only one ingestion may modify the artifacts at a time"""
+    with open(config.INGEST_LOCK_PATH, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Ingestor:
+    def __init__(self, embedder=None):
+        if embedder is None:
+            from rag.backends import load_embedding_model
+            embedder = load_embedding_model(config.EMBEDDING_BACKEND)
+        self.embedder = embedder
+        self.pending = []           # (doc_id, [chunks])
+        self.pending_chunks = 0
+        self.stats = {"documents": 0, "chunks": 0, "commits": 0, "superseded_chunks": 0, "invalidated_answers": 0}
+
+    def add(self, doc_id, text):
+        chunks = chunk_text(text)
+        if not chunks:
+            return
+        self.pending.append((doc_id, chunks))
+        self.pending_chunks += len(chunks)
+        if self.pending_chunks >= config.INGEST_COMMIT_CHUNKS:
+            self.commit()
+
+    def commit(self):
+        """Embed pending chunks and append them to the live artifacts"""
+        if not self.pending:
+            return
+        pending, self.pending, self.pending_chunks = self.pending, [], 0
+        # A document seen twice in one commit keeps only its latest text
+        pending = list({doc_id: (doc_id, chunks) for doc_id, chunks in pending}.values())
+        texts = [chunk for _, chunks in pending for chunk in chunks]
+        vectors = np.asarray(
+            self.embedder.encode(texts, batch_size=config.INGEST_BATCH_SIZE),
+            dtype="float32"
+        )
+
+        with ingestion_lock():
+            if not store_exists(config.CHUNK_STORE_PATH):
+                convert_pickle(config.CHUNKS_PICKLE_PATH, config.CHUNK_STORE_PATH)
+            manifest = read_manifest(config.MANIFEST_PATH)
+            index = faiss.read_index(config.FAISS_INDEX_PATH)
+            old_chunks = ChunkStore(config.CHUNK_STORE_PATH)
+            if index.ntotal != len(old_chunks):
+                raise RuntimeError(
+                    f"Index has {index.ntotal} vectors but the chunk store has {len(old_chunks)} chunks"
+                )
+
+            # Rows of re-ingested documents are superseded
+            superseded = []
+            for doc_id, _ in pending:
+                previous = manifest["documents"].get(doc_id)
+                if previous:
+                    manifest["deleted_rows"].append(previous["rows"])
+                    superseded.extend(range(*previous["rows"]))
+
+            # Chunk store first, then the index, then the manifest (commit point)
+            row = append_chunks(config.CHUNK_STORE_PATH, texts)
+            index.add(vectors)
+            write_index(index, config.FAISS_INDEX_PATH)
+            if config.HYBRID_RETRIEVAL:
+                # Rebuilt in full; workers pick it up with the new manifest instead of each rebuilding it
+                BM25Index.build(ChunkStore(config.CHUNK_STORE_PATH), config.BM25_K1, config.BM25_B).save(
+                    config.BM25_INDEX_PATH
+                )
+
+            now = datetime.utcnow().isoformat()
+            for doc_id, chunks in pending:
+                manifest["documents"][doc_id] = {"rows": [row, row + len(chunks)], "ingested_at": now}
+                row += len(chunks)
+            manifest["version"] += 1
+            write_manifest(manifest, config.MANIFEST_PATH)
+
+        self.stats["documents"] += len(pending)
+        self.stats["chunks"] += len(texts)
+        self.stats["commits"] += 1
+        self.stats["superseded_chunks"] += len(superseded)
+        if superseded:
+            try:
+                self.stats["invalidated_answers"] += invalidate_cached_answers(superseded)
+            except Exception as e:
+                print(f"⚠️ Could not invalidate cached answers for superseded chunks: {e}")
+        print(f"✅ Committed {len(pending)} documents ({len(texts)} chunks), index version {manifest['version']}")
+
+
+def invalidate_cached_answers(stale_rows):
+    """Delete cached answers that cite any of the given chunk ids (rows)"""
+    from models import Cache
+    return Cache.invalidate({"source_ids": {"$in": sorted(set(stale_rows))}})
+
+
+def iter_documents(paths, doc_id=None):
+    """Yield (doc_id, text) from files, directories or '-' (JSON lines on stdin)"""
+    for path in paths:
+        if path == "-":
+            for line in sys.stdin:
+                if line.strip():
+                    record = json.loads(line)
+                    yield str(record["id"]), record["text"]
+        elif os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(TEXT_EXTENSIONS):
+                        full = os.path.join(root, name)
+                        with open(full, encoding="utf-8") as f:
+                            yield os.path.relpath(full, path), f.read()
+        else:
+            with open(path, encoding="utf-8") as f:
+                yield doc_id or os.path.basename(path), f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append documents to the live retrieval index")
+    parser.add_argument("paths", nargs="+", help="Files, directories, or - for JSON lines on stdin")
+    parser.add_argument("--doc-id", help="Document id when ingesting a single file")
+    args = parser.parse_args()
+
+    ingestor = Ingestor()
+    for doc_id, text in iter_documents(args.paths, args.doc_id):
+        ingestor.add(doc_id, text)
+    ingestor.commit()
+    print(json.dumps(ingestor.stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Manifest of the live retrieval artifacts.
+
+The manifest (data/manifest.json) records which chunk rows belong to which
+ingested document, which rows have been superseded, and a version number.
+Writing a new manifest is the commit point of an ingestion: workers watch it
+and reload the index and chunk store when its version changes.
+"""
+import json
+import os
+
+
+def empty_manifest():
+    return {"version": 0, "documents": {}, "deleted_rows": []}
+
+
+def read_manifest(path):
+    if not os.path.exists(path):
+        return empty_manifest()
+    with open(path) as f:
+        manifest = json.load(f)
+    for key, value in empty_manifest().items():
+        manifest.setdefault(key, value)
+    return manifest
+
+
+def write_manifest(manifest, path):
+    """Write the manifest atomically"""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def deleted_row_ids(manifest):
+    """Expand the [start, stop) ranges of superseded rows into row ids"""
+    return [row for start, stop in manifest["deleted_rows"] for row in range(start, stop)]
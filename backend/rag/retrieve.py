@@ -1,27 +1,330 @@
+import os
+import threading
+import time
+
 import faiss
-import pickle
-from sentence_transformers import SentenceTransformer
+import numpy as np
+
+import config
+import metrics
+from rag.ann import apply_search_params, selector_params
+from hot_cache import normalize_question
+from rag.backends import EMBEDDING_MODEL, load_embedding_model
+from rag.bm25 import load_or_build
+from rag.chunk_store import load_chunks
+from rag.embedding_memo import EmbeddingMemo
+from conversation import blend
+from rag.manifest import read_manifest, deleted_row_ids
+
+RETRIEVAL_DEPTH = metrics.register(metrics.Histogram(
+    "nlpassist_retrieval_depth", "Chunks returned per retrieval (0 when refused after the dense search)",
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+))
+EARLY_REFUSALS = metrics.register(metrics.Counter(
+    "nlpassist_early_refusals_total", "Questions refused right after the dense search (RETRIEVAL_HOPELESS_DISTANCE)"
+))
+
+# Loaded on first use (or by model_loader at startup) so importing this module is cheap
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = load_embedding_model(config.EMBEDDING_BACKEND)
+    return _embedder
+
+
+# Question embeddings and search results, shared by workers through a SQLite file
+memo = EmbeddingMemo(
+    config.EMBEDDING_MEMO_PATH,
+    max_entries=config.EMBEDDING_MEMO_MAX_ENTRIES,
+    max_stored=config.EMBEDDING_MEMO_MAX_STORED
+) if config.EMBEDDING_MEMO_ENABLED else None
+_memo_model = f"{EMBEDDING_MODEL}:{config.EMBEDDING_BACKEND}"
+
+
+def embed_questions(questions, batch_size=64):
+    """
+    Embed questions as a float32 (n, dim) array. With the memo enabled the
+    normalized question is embedded, so repeats and near-repeats (case,
+    spacing, trailing punctuation) share one memoized vector.
+    """
+    if memo is None:
+        return np.asarray(get_embedder().encode(list(questions), batch_size=batch_size), dtype="float32")
+
+    keys = [normalize_question(q) for q in questions]
+    vectors = {}
+    for key in keys:
+        if key not in vectors:
+            vectors[key] = memo.get_vector(_memo_model, key)
+    missing = [key for key, vector in vectors.items() if vector is None]
+    if missing:
+        encoded = np.asarray(get_embedder().encode(missing, batch_size=batch_size), dtype="float32")
+        for key, vector in zip(missing, encoded):
+            memo.put_vector(_memo_model, key, vector)
+            vectors[key] = vector
+    return np.stack([vectors[key] for key in keys]).astype("float32")
+
+
+class RetrievalState:
+    """One consistent snapshot of the index, chunk store and superseded rows"""
+
+    def __init__(self):
+        manifest = read_manifest(config.MANIFEST_PATH)
+        self.version = manifest["version"]
+        # The index is read before the chunk store: ingestion replaces the chunk
+        # offsets before the index, so the store always covers every indexed row
+        self.index = apply_search_params(
+            faiss.read_index(config.FAISS_INDEX_PATH),
+            nprobe=config.FAISS_NPROBE,
+            ef_search=config.FAISS_EF_SEARCH
+        )
+        # Memory-mapped store shared across workers; chunks are decoded only when returned
+        self.chunks = load_chunks(config.CHUNK_STORE_PATH, config.CHUNKS_PICKLE_PATH)
+        # Memoized search results are only valid for this exact index and search setup
+        self.signature = ":".join(str(part) for part in (
+            self.version, os.path.abspath(config.FAISS_INDEX_PATH), _mtime(config.FAISS_INDEX_PATH),
+            self.index.ntotal, config.FAISS_NPROBE, config.FAISS_EF_SEARCH
+        ))
+
+        deleted = deleted_row_ids(manifest)
+        self.deleted = np.asarray(sorted(deleted), dtype="int64")
+        self.bm25 = None
+        if config.HYBRID_RETRIEVAL:
+            self.bm25 = load_or_build(config.BM25_INDEX_PATH, self.chunks, config.BM25_K1, config.BM25_B)
+        self.search_params = None
+        if deleted:
+            self._selector = faiss.IDSelectorBatch(np.asarray(deleted, dtype="int64"))
+            self._not_deleted = faiss.IDSelectorNot(self._selector)
+            self.search_params = selector_params(
+                self.index, self._not_deleted, nprobe=config.FAISS_NPROBE, ef_search=config.FAISS_EF_SEARCH
+            )
+
+    def search(self, vectors, top_k):
+        if self.search_params is None:
+            return self.index.search(vectors, top_k)
+        return self.index.search(vectors, top_k, params=self.search_params)
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+_state = None
+_reload_lock = threading.Lock()
+_last_check = 0.0
+_manifest_mtime = None
+
+
+def _manifest_mtime_now():
+    return _mtime(config.MANIFEST_PATH)
+
+
+def current_state():
+    """
+    Return the live retrieval snapshot, hot-swapping to a new one when ingestion
+    has committed a new manifest. In-flight requests keep the snapshot they hold.
+    """
+    global _state, _last_check, _manifest_mtime
+    now = time.monotonic()
+    if _state is not None and now - _last_check < config.INDEX_RELOAD_INTERVAL_SECONDS:
+        return _state
+
+    with _reload_lock:
+        if _state is None:
+            _manifest_mtime = _manifest_mtime_now()
+            _state = RetrievalState()
+            _last_check = now
+            return _state
+        if now - _last_check < config.INDEX_RELOAD_INTERVAL_SECONDS:
+            return _state
+        _last_check = now
+        mtime = _manifest_mtime_now()
+        if mtime is None or mtime == _manifest_mtime:
+            return _state
+        try:
+            state = RetrievalState()
+        except Exception as e:
+            print(f"⚠️ Keeping index version {_state.version}; reload failed: {e}")
+            return _state
+        _manifest_mtime = mtime
+        if state.version != _state.version:
+            print(f"🔄 Index reloaded: version {_state.version} -> {state.version} ({state.index.ntotal} vectors)")
+        if memo is not None and state.signature != _state.signature:
+            memo.drop_stale_results(state.signature)
+        _state = state
+    return _state
+
+
+def load():
+    """Load the embedder and the index snapshot now instead of on first use"""
+    get_embedder()
+    state = current_state()
+    if config.RETRIEVAL_DEBUG:
+        print_debug_summary(state)
+
+
+def print_debug_summary(state):
+    """Only runs when RETRIEVAL_DEBUG is set"""
+    print("=== DEBUG START ===")
+    print("Total chunks loaded:", len(state.chunks))
+
+    if state.bm25 is not None:
+        rows, _ = state.bm25.search("Retrieval-Augmented Generation RAG", len(state.chunks), exclude=state.deleted)
+        print("RAG chunks found:", len(rows))
+        if len(rows):
+            print("RAG chunk sample:\n", state.chunks[rows[0]])
+
+    print("=== DEBUG END ===")
+
+
+def _search(state, questions, top_k):
+    """(row ids, distances) per question, reusing memoized searches on this index"""
+    hits = [None] * len(questions)
+    if memo is not None:
+        hits = [memo.get_results(state.signature, top_k, q) for q in questions]
+    missing = [i for i, hit in enumerate(hits) if hit is None]
+    if missing:
+        with metrics.timer("embedding"):
+            vectors = embed_questions([questions[i] for i in missing])
+        with metrics.timer("faiss_search"):
+            distances, indices = state.search(vectors, top_k)
+        for i, row, dist in zip(missing, indices, distances):
+            hits[i] = (row, dist)
+            if memo is not None:
+                memo.put_results(state.signature, top_k, questions[i], row, dist)
+    return hits
+
+
+def fuse(dense_rows, dense_distances, lexical_rows, top_k, rrf_k=60):
+    """
+    Reciprocal rank fusion of the dense and BM25 rankings; returns (rows,
+    distances) best first. Chunks found only by BM25 get the largest dense
+    distance among the candidates, so they never raise retrieval confidence.
+    """
+    scores = {}
+    for ranking in (dense_rows, lexical_rows):
+        for rank, row in enumerate(ranking.tolist()):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+    rows = sorted(scores, key=scores.get, reverse=True)[:top_k]
+
+    distances = dict(zip(dense_rows.tolist(), dense_distances.tolist()))
+    worst = max(distances.values()) if distances else float("inf")
+    return (
+        np.asarray(rows, dtype="int64"),
+        np.asarray([distances.get(row, worst) for row in rows], dtype="float32")
+    )
+
+
+def depth(distances, top_k, adaptive):
+    """
+    How many chunks to return given the dense distances (best first): top_k,
+    or with adaptive retrieval the number of results within
+    RETRIEVAL_DISTANCE_MARGIN of the best one, between RETRIEVAL_MIN_K and
+    RETRIEVAL_MAX_K
+    """
+    if not adaptive or not len(distances):
+        return top_k
+    close = int(np.count_nonzero(distances <= distances[0] + config.RETRIEVAL_DISTANCE_MARGIN))
+    return max(config.RETRIEVAL_MIN_K, min(config.RETRIEVAL_MAX_K, close))
+
+
+def _adaptive(adaptive):
+    return config.ADAPTIVE_RETRIEVAL if adaptive is None else adaptive
+
+
+def _candidates(state, top_k, adaptive=False):
+    """Dense results to fetch per question: enough for the deepest retrieval, more when fused with BM25"""
+    k = max(top_k, config.RETRIEVAL_MAX_K) if adaptive else top_k
+    return max(k, config.HYBRID_CANDIDATES) if state.bm25 is not None else k
+
+
+def _rank(state, question, row, dist, top_k, adaptive=False):
+    """(chunks, distances, chunk ids) from one dense search, fused with BM25 when enabled"""
+    keep = row >= 0
+    row, dist = row[keep], dist[keep]
+    if adaptive and (not len(dist) or dist[0] >= config.RETRIEVAL_HOPELESS_DISTANCE):
+        # Refused whatever BM25 adds (fused chunks are never closer than the best
+        # dense one): no chunks, and the best distance for the refusal check
+        EARLY_REFUSALS.inc()
+        RETRIEVAL_DEPTH.observe(0)
+        return [], dist[:1], []
+    k = depth(dist, top_k, adaptive)
+    if state.bm25 is not None:
+        with metrics.timer("bm25_search"):
+            lexical, _ = state.bm25.search(question, _candidates(state, top_k, adaptive), exclude=state.deleted)
+        row, dist = fuse(row, dist, lexical, k, config.HYBRID_RRF_K)
+    else:
+        row, dist = row[:k], dist[:k]
+    RETRIEVAL_DEPTH.observe(len(row))
+    return [state.chunks[i] for i in row], dist, [int(i) for i in row]
+
+
+def _retrieve(state, questions, top_k, adaptive=False):
+    """(chunks, distances, chunk ids) per question, dense-only or fused with BM25"""
+    hits = _search(state, questions, _candidates(state, top_k, adaptive))
+    return [_rank(state, question, row, dist, top_k, adaptive) for question, (row, dist) in zip(questions, hits)]
+
 
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+def retrieve(question, top_k=3, adaptive=None):
+    chunks, distances, _ = retrieve_with_ids(question, top_k, adaptive)
+    return chunks, distances
 
-index = faiss.read_index("data/faiss.index")
 
-with open("data/chunks.pkl", "rb") as f:
-    chunks = pickle.load(f)
+def retrieve_with_ids(question, top_k=3, adaptive=None):
+    """
+    (chunks, distances, chunk ids); a chunk id is the chunk's row in the chunk
+    store, which never changes once ingested (see get_chunks).
+    With adaptive retrieval (ADAPTIVE_RETRIEVAL, unless `adaptive` says
+    otherwise) the number of chunks follows the distances (see depth) instead
+    of top_k, and a hopeless question gets no chunks and only its best distance.
+    """
+    adaptive = _adaptive(adaptive)
+    [result] = _retrieve(current_state(), [question], top_k, adaptive)
+    return result
 
-print("=== DEBUG START ===")
-print("Total chunks loaded:", len(chunks))
 
-rag_chunks = [c for c in chunks if "Retrieval-Augmented Generation" in c or "RAG" in c]
-print("RAG chunks found:", len(rag_chunks))
+def retrieve_with_context(question, top_k=3, prior_vectors=(), prior_weight=config.CONVERSATION_PRIOR_WEIGHT,
+                          adaptive=None):
+    """
+    retrieve_with_ids for a follow-up question: the dense search uses the
+    question's vector blended with the vectors of the earlier turns (see
+    blend), BM25 uses the question alone. Returns (chunks, distances, chunk
+    ids, question vector); the vector is kept in the conversation window.
+    """
+    state = current_state()
+    adaptive = _adaptive(adaptive)
+    with metrics.timer("embedding"):
+        vector = embed_questions([question])[0]
+    query = blend(vector, prior_vectors, prior_weight) if len(prior_vectors) else vector
+    with metrics.timer("faiss_search"):
+        distances, indices = state.search(query.reshape(1, -1), _candidates(state, top_k, adaptive))
+    return _rank(state, question, indices[0], distances[0], top_k, adaptive) + (vector,)
 
-if rag_chunks:
-    print("RAG chunk sample:\n", rag_chunks[0])
 
-print("=== DEBUG END ===")
+def retrieve_batch(questions, top_k=3, adaptive=None):
+    """
+    Retrieve for many questions with one embedding call and one FAISS search
+    (for the questions not already memoized), each fused with BM25 when
+    HYBRID_RETRIEVAL is on.
+    Returns a list of (chunks, distances, chunk ids) in the order of the questions.
+    """
+    if not questions:
+        return []
+    return _retrieve(current_state(), list(questions), top_k, _adaptive(adaptive))
 
 
-def retrieve(question, top_k=3):
-    q_vec = embedder.encode([question])
-    distances, indices = index.search(q_vec, top_k)
-    return [chunks[i] for i in indices[0]], distances[0]
+def get_chunks(chunk_ids):
+    """
+    {chunk id: text} for the ids that exist. The chunk store is append-only
+    (re-ingested documents get new rows), so the text of an id never changes.
+    """
+    chunks = current_state().chunks
+    return {i: chunks[i] for i in chunk_ids if 0 <= i < len(chunks)}
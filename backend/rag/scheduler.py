@@ -0,0 +1,96 @@
+"""
+Micro-batching scheduler for generation.
+Requests from concurrent threads are queued, merged into one batch for a
+short window (or until the batch is full) and decoded together; each caller
+then receives its own result.
+"""
+import queue
+import threading
+import time
+
+
+class _PendingRequest:
+    __slots__ = ("prompt", "done", "result", "error")
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GenerationScheduler:
+    def __init__(self, run_batch, max_batch_size=8, window_ms=20):
+        """
+        run_batch: callable taking a list of submitted items (prompts or
+        decode requests) and returning a list of outputs in the same order.
+        """
+        self._run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+        # Counters for observability
+        self.batches_run = 0
+        self.requests_served = 0
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._loop, name="generation-scheduler", daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, prompt):
+        """Queue a prompt and block until its batch has been decoded"""
+        self._ensure_worker()
+        pending = _PendingRequest(prompt)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        """Block for the first request, then gather more until the window closes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                outputs = self._run_batch([p.prompt for p in batch])
+                if len(outputs) != len(batch):
+                    raise RuntimeError(
+                        f"Batch returned {len(outputs)} outputs for {len(batch)} prompts"
+                    )
+                for pending, output in zip(batch, outputs):
+                    pending.result = output
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                self.batches_run += 1
+                self.requests_served += len(batch)
+                for pending in batch:
+                    pending.done.set()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
@@ -6,6 +6,7 @@ import bleach
 from functools import wraps
 from flask import request, jsonify
 import config
+from rag.decoding import DecodeOptions
 
 
 def sanitize_input(text, max_length=None):
@@ -25,6 +26,16 @@ def sanitize_input(text, max_length=None):
     return cleaned.strip()
 
 
+def api_key_error(api_key):
+    """The 401 body for a request with this X-API-Key header, or None if it may proceed"""
+    if not config.REQUIRE_API_KEY or (api_key and api_key == config.API_KEY):
+        return None
+    return {
+        "error": "Invalid or missing API key",
+        "message": "Please provide a valid X-API-Key header"
+    }
+
+
 def validate_api_key(f):
     """
     Decorator to validate API key from request headers.
@@ -32,20 +43,9 @@ def validate_api_key(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Skip API key check if not required
-        if not config.REQUIRE_API_KEY:
-            return f(*args, **kwargs)
-        
-        # Get API key from header
-        api_key = request.headers.get('X-API-Key')
-        
-        # Validate API key
-        if not api_key or api_key != config.API_KEY:
-            return jsonify({
-                "error": "Invalid or missing API key",
-                "message": "Please provide a valid X-API-Key header"
-            }), 401
-        
+        error = api_key_error(request.headers.get('X-API-Key'))
+        if error:
+            return jsonify(error), 401
         return f(*args, **kwargs)
     
     return decorated_function
@@ -92,3 +92,32 @@ def validate_chat_title(title):
         return False, "", "Title cannot be empty"
     
     return True, sanitized, None
+
+
+def validate_decoding(options):
+    """
+    Validate per-request decoding overrides (the optional "decoding" object).
+    Returns (is_valid, DecodeOptions, error_message)
+    """
+    try:
+        return True, DecodeOptions.from_request(options), None
+    except ValueError as e:
+        return False, None, str(e)
+
+
+def validate_chunk_ids(ids):
+    """
+    Validate the ?ids= parameter of /api/chunks (comma-separated chunk ids).
+    Returns (is_valid, sorted unique ids, error_message)
+    """
+    if not ids:
+        return False, [], "ids is required"
+    try:
+        chunk_ids = sorted({int(i) for i in ids.split(",") if i.strip()})
+    except ValueError:
+        return False, [], "ids must be comma-separated integers"
+    if not chunk_ids:
+        return False, [], "ids is required"
+    if len(chunk_ids) > config.MAX_CHUNK_IDS:
+        return False, [], f"At most {config.MAX_CHUNK_IDS} ids per request"
+    return True, chunk_ids, None
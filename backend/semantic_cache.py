@@ -0,0 +1,107 @@
+"""
+Semantic cache tier for NLP Assistant API
+Keeps an in-memory inner-product index over the embeddings of cached
+questions so paraphrases of a cached question can reuse its answer.
+"""
+import threading
+
+import faiss
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Inner-product FAISS index over normalized question embeddings.
+    With unit-length vectors the inner product equals cosine similarity.
+    """
+
+    def __init__(self, encode):
+        self._encode = encode
+        self._lock = threading.Lock()
+        self._index = None
+        self._questions = []
+        self._known = set()
+
+    def _embed(self, questions):
+        vectors = np.asarray(self._encode(questions), dtype="float32")
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def rebuild(self, questions):
+        """Replace the index with embeddings of the given questions"""
+        questions = list(dict.fromkeys(q for q in questions if q))
+        vectors = self._embed(questions) if questions else None
+
+        index = None
+        if vectors is not None:
+            index = faiss.IndexFlatIP(vectors.shape[1])
+            index.add(vectors)
+
+        with self._lock:
+            self._index = index
+            self._questions = questions
+            self._known = set(questions)
+
+    def add(self, question):
+        """Add a newly cached question to the index"""
+        self.add_many([question])
+
+    def add_many(self, questions):
+        """Add several newly cached questions with one embedding call"""
+        questions = [q for q in dict.fromkeys(questions) if q and q not in self._known]
+        if not questions:
+            return
+        vectors = self._embed(questions)
+
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vectors.shape[1])
+            for question, vector in zip(questions, vectors):
+                if question in self._known:
+                    continue
+                self._index.add(vector.reshape(1, -1))
+                self._questions.append(question)
+                self._known.add(question)
+
+    def lookup(self, question, threshold):
+        """
+        Find the most similar cached question.
+        Returns (cached_question, similarity) if similarity >= threshold, None otherwise.
+        """
+        return self.lookup_batch([question], threshold)[0]
+
+    def lookup_batch(self, questions, threshold):
+        """Look up several questions with one embedding call and one search"""
+        if self._index is None or not self._questions or not questions:
+            return [None] * len(questions)
+        vectors = self._embed(questions)
+
+        with self._lock:
+            similarities, positions = self._index.search(vectors, 1)
+            matches = [
+                (self._questions[int(pos[0])], float(sim[0])) if pos[0] >= 0 else None
+                for sim, pos in zip(similarities, positions)
+            ]
+
+        return [m if m and m[1] >= threshold else None for m in matches]
+
+    def __len__(self):
+        return len(self._questions)
+
+
+def _encode_with_retrieval_embedder(questions):
+    # Reuse the sentence transformer (and embedding memo) used for retrieval, so a
+    # cache miss does not embed the question a second time
+    from rag.retrieve import embed_questions
+    return embed_questions(questions)
+
+
+semantic_cache = SemanticCache(_encode_with_retrieval_embedder)
+
+
+def load_semantic_cache():
+    """Rebuild the semantic index from the cache collection"""
+    from models import Cache
+    questions = Cache.get_all_questions()
+    semantic_cache.rebuild(questions)
+    return len(semantic_cache)
@@ -0,0 +1,329 @@
+"""
+Shared state for NLP Assistant API workers
+Rate limit counters and hot cache entries that every worker process sees,
+instead of one copy per process. Two interchangeable stores:
+
+- SQLiteStore: a SQLite file in WAL mode, for the workers of one host (put it
+  on a tmpfs such as /dev/shm to keep it in memory)
+- MongoStore: collections in the application database, for workers spread
+  over several hosts
+
+Both expose fixed-window counters whose increment is atomic (the window reset
+and the increment happen in one statement), and a small key/value map with a
+TTL, a size bound and a tag per entry for invalidation.
+
+SharedLimitsStorage adapts a store to the `limits` library, so flask-limiter
+(storage_uri="nlpassist://") and the async rate limiter share the counters.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import json_util
+from limits.storage import Storage
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+import config
+
+# Expired counters are deleted (SQLite) and Mongo value maps trimmed once every this many writes
+PRUNE_EVERY = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    tag TEXT,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_expiry ON entries (namespace, expires_at);
+CREATE INDEX IF NOT EXISTS entries_tag ON entries (namespace, tag);
+"""
+
+
+class SQLiteStore:
+    """Shared state in a SQLite file, for the worker processes of one host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    # SQLite connections are per thread and per process (never reused across a fork)
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _should_prune(self):
+        with self._writes_lock:
+            self._writes += 1
+            return self._writes % PRUNE_EVERY == 0
+
+    def incr(self, key, expiry, amount=1, elastic_expiry=False):
+        """Add amount to the counter, starting a new window of expiry seconds if it expired"""
+        now = time.time()
+        conn = self._db()
+        (value,) = conn.execute(
+            """
+            INSERT INTO counters (key, value, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END,
+                expires_at = CASE WHEN expires_at <= ? OR ? THEN excluded.expires_at ELSE expires_at END
+            RETURNING value
+            """,
+            (key, amount, now + expiry, now, now, elastic_expiry)
+        ).fetchone()
+        if self._should_prune():
+            conn.execute("DELETE FROM counters WHERE expires_at <= ?", (now,))
+        return value
+
+    def get(self, key):
+        row = self._db().execute(
+            "SELECT value FROM counters WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        """Epoch time at which the counter's window ends"""
+        row = self._db().execute("SELECT expires_at FROM counters WHERE key = ?", (key,)).fetchone()
+        return row[0] if row and row[0] > time.time() else time.time()
+
+    def clear(self, key):
+        self._db().execute("DELETE FROM counters WHERE key = ?", (key,))
+
+    def reset(self):
+        """Drop every counter; returns how many there were"""
+        return self._db().execute("DELETE FROM counters").rowcount
+
+    def set_value(self, namespace, key, value, ttl, tag=None, max_entries=None):
+        """Store a value for ttl seconds, evicting the entries closest to expiry beyond max_entries"""
+        now = time.time()
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, tag, value, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, None if tag is None else str(tag), json_util.dumps(value), now + ttl)
+            )
+            evicted = 0
+            if max_entries:
+                evicted = conn.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND key IN (SELECT key FROM entries "
+                    "WHERE namespace = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (namespace, namespace, max_entries)
+                ).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def get_value(self, namespace, key):
+        row = self._db().execute(
+            "SELECT value FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, key, time.time())
+        ).fetchone()
+        return json_util.loads(row[0]) if row else None
+
+    def delete_tag(self, namespace, tag):
+        return self._db().execute(
+            "DELETE FROM entries WHERE namespace = ? AND tag = ?", (namespace, str(tag))
+        ).rowcount
+
+    def clear_namespace(self, namespace):
+        return self._db().execute("DELETE FROM entries WHERE namespace = ?", (namespace,)).rowcount
+
+    def count(self, namespace):
+        return self._db().execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ? AND expires_at > ?", (namespace, time.time())
+        ).fetchone()[0]
+
+
+class MongoStore:
+    """
+    Shared state in MongoDB, for workers on several hosts. Expired documents
+    are removed by TTL indexes on expires_at.
+    """
+
+    def __init__(self, db):
+        self.counters = db["shared_counters"]
+        self.entries = db["shared_entries"]
+        self._indexed = False
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    def _ensure_indexes(self):
+        if self._indexed:
+            return
+        self._indexed = True
+        try:
+            self.counters.create_index("expires_at", expireAfterSeconds=0)
+            self.entries.create_index("expires_at", expireAfterSeconds=0)
+            self.entries.create_index([("namespace", 1), ("tag", 1)])
+        except PyMongoError as e:
+            self._indexed = False
+            print(f"⚠️ Could not create shared state indexes: {e}")
+
+    @staticmethod
+    def _now():
+        # Naive UTC, like every other timestamp in the database
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def incr(self, key, expiry, amount=1, elastic_expiry=False):
+        """Add amount to the counter, starting a new window of expiry seconds if it expired"""
+        self._ensure_indexes()
+        now = self._now()
+        live = {"$gt": ["$expires_at", now]}
+        update = [{"$set": {
+            "value": {"$cond": [live, {"$add": ["$value", amount]}, amount]},
+            "expires_at": now + timedelta(seconds=expiry) if elastic_expiry
+            else {"$cond": [live, "$expires_at", now + timedelta(seconds=expiry)]},
+        }}]
+        try:
+            doc = self.counters.find_one_and_update(
+                {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Two first hits raced on the upsert; the document exists now
+            doc = self.counters.find_one_and_update(
+                {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        return doc["value"]
+
+    def get(self, key):
+        doc = self.counters.find_one({"_id": key, "expires_at": {"$gt": self._now()}}, {"value": 1})
+        return doc["value"] if doc else 0
+
+    def get_expiry(self, key):
+        """Epoch time at which the counter's window ends"""
+        doc = self.counters.find_one({"_id": key}, {"expires_at": 1})
+        if not doc or doc["expires_at"] <= self._now():
+            return time.time()
+        return doc["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+
+    def clear(self, key):
+        self.counters.delete_one({"_id": key})
+
+    def reset(self):
+        return self.counters.delete_many({}).deleted_count
+
+    def set_value(self, namespace, key, value, ttl, tag=None, max_entries=None):
+        """Store a value for ttl seconds; beyond max_entries the entries closest to expiry are evicted"""
+        self._ensure_indexes()
+        self.entries.replace_one(
+            {"_id": f"{namespace}:{key}"},
+            {
+                "namespace": namespace,
+                "tag": None if tag is None else str(tag),
+                "value": value,
+                "expires_at": self._now() + timedelta(seconds=ttl)
+            },
+            upsert=True
+        )
+        with self._writes_lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        if not (max_entries and prune):
+            return 0
+        # Trimmed periodically rather than on every write, so the bound is approximate
+        oldest = list(self.entries.find({"namespace": namespace}, {"_id": 1})
+                      .sort("expires_at", -1).skip(max_entries))
+        if not oldest:
+            return 0
+        return self.entries.delete_many({"_id": {"$in": [doc["_id"] for doc in oldest]}}).deleted_count
+
+    def get_value(self, namespace, key):
+        doc = self.entries.find_one(
+            {"_id": f"{namespace}:{key}", "expires_at": {"$gt": self._now()}}, {"value": 1}
+        )
+        return doc["value"] if doc else None
+
+    def delete_tag(self, namespace, tag):
+        return self.entries.delete_many({"namespace": namespace, "tag": str(tag)}).deleted_count
+
+    def clear_namespace(self, namespace):
+        return self.entries.delete_many({"namespace": namespace}).deleted_count
+
+    def count(self, namespace):
+        return self.entries.count_documents({"namespace": namespace, "expires_at": {"$gt": self._now()}})
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The configured shared store (None for SHARED_STATE_BACKEND=memory)"""
+    global _store
+    if config.SHARED_STATE_BACKEND == "memory":
+        return None
+    with _store_lock:
+        if _store is None:
+            if config.SHARED_STATE_BACKEND == "mongo":
+                from models import db
+                _store = MongoStore(db)
+            elif config.SHARED_STATE_BACKEND == "sqlite":
+                _store = SQLiteStore(config.SHARED_STATE_PATH)
+            else:
+                raise ValueError(f"Unknown SHARED_STATE_BACKEND: {config.SHARED_STATE_BACKEND}")
+        return _store
+
+
+class SharedLimitsStorage(Storage):
+    """`limits` storage over the shared store; registered for nlpassist:// URIs"""
+
+    STORAGE_SCHEME = ["nlpassist"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.store = options.get("store") or get_store()
+
+    @property
+    def base_exceptions(self):
+        return (sqlite3.Error, PyMongoError)
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        return self.store.incr(key, int(expiry), amount=amount, elastic_expiry=elastic_expiry)
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def get_expiry(self, key):
+        return self.store.get_expiry(key)
+
+    def check(self):
+        try:
+            self.store.get("__health__")
+            return True
+        except self.base_exceptions:
+            return False
+
+    def reset(self):
+        return self.store.reset()
+
+    def clear(self, key):
+        self.store.clear(key)
+
+
+def limits_storage_uri():
+    """storage_uri for flask-limiter: the shared store, or per-process memory"""
+    return "memory://" if config.SHARED_STATE_BACKEND == "memory" else "nlpassist://"
@@ -0,0 +1,119 @@
+"""
+I/O steps of the request pipeline for NLP Assistant API
+The pipeline (pipeline.py, and the cache tiers in cache_manager.py) is written
+once, as generators that yield the I/O they need instead of doing it:
+
+    doc = yield db("Cache.find", question)                     # MongoDB
+    hits = yield embed(semantic_cache.lookup_batch, questions)  # embedding / FAISS
+    answer = yield generate(rag_generate, query, ...)          # FLAN-T5
+    history = yield io(conversations.history, chat_id)         # shared store
+    yield admit()                                               # generation capacity
+
+run() performs each step in the calling thread against models.py (Flask
+workers, scripts). AsyncRunner awaits models_async.py, offloads embedding
+and generation to the bounded inference pools (asgi.py) and other blocking
+I/O to a worker thread. A step that raises
+is thrown back into the pipeline, so errors are handled where a direct call
+would have raised them.
+"""
+import asyncio
+
+import models
+
+DB = "db"
+EMBED = "embed"
+GENERATE = "generate"
+IO = "io"
+ADMIT = "admit"
+
+
+class Step:
+    __slots__ = ("kind", "call", "args", "kwargs")
+
+    def __init__(self, kind, call=None, args=(), kwargs=None):
+        self.kind = kind
+        self.call = call        # model method name ("Message.create") for DB, else a function
+        self.args = args
+        self.kwargs = kwargs or {}
+
+
+def db(method, *args, **kwargs):
+    """A model call by name, e.g. db("Message.create", chat_id, "user", question)"""
+    return Step(DB, method, args, kwargs)
+
+
+def embed(fn, *args):
+    """CPU work on the embedding model or the FAISS indexes"""
+    return Step(EMBED, fn, args)
+
+
+def generate(fn, *args):
+    """CPU work on the generation model"""
+    return Step(GENERATE, fn, args)
+
+
+def io(fn, *args):
+    """Other blocking I/O, e.g. on the shared store (SQLite or MongoDB)"""
+    return Step(IO, fn, args)
+
+
+def admit():
+    """Fail fast (PoolSaturated) when a generation could not be admitted"""
+    return Step(ADMIT)
+
+
+def _model_method(module, name):
+    model, method = name.split(".")
+    return getattr(getattr(module, model), method)
+
+
+def run(steps):
+    """Run a pipeline in this thread; returns what the pipeline returns"""
+    value, error = None, None
+    while True:
+        try:
+            step = steps.send(value) if error is None else steps.throw(error)
+        except StopIteration as done:
+            return done.value
+        try:
+            if step.kind == DB:
+                value = _model_method(models, step.call)(*step.args, **step.kwargs)
+            elif step.kind == ADMIT:
+                value = None
+            else:
+                value = step.call(*step.args)
+            error = None
+        except Exception as e:
+            value, error = None, e
+
+
+class AsyncRunner:
+    """Runs pipelines on the event loop: MongoDB through an async models module, CPU work on pools"""
+
+    def __init__(self, models_module, embedding_pool, generation_pool):
+        self.models = models_module
+        self.embedding_pool = embedding_pool
+        self.generation_pool = generation_pool
+
+    async def __call__(self, steps):
+        value, error = None, None
+        while True:
+            try:
+                step = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration as done:
+                return done.value
+            try:
+                value, error = await self._perform(step), None
+            except Exception as e:
+                value, error = None, e
+
+    async def _perform(self, step):
+        if step.kind == DB:
+            return await _model_method(self.models, step.call)(*step.args, **step.kwargs)
+        if step.kind == EMBED:
+            return await self.embedding_pool.run(step.call, *step.args)
+        if step.kind == GENERATE:
+            return await self.generation_pool.run(step.call, *step.args)
+        if step.kind == IO:
+            return await asyncio.to_thread(step.call, *step.args)
+        self.generation_pool.check_admission()
@@ -0,0 +1,37 @@
+import pytest
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+import models
+from activity_stats import TOTAL_ID, RollupAggregator
+
+
+@pytest.fixture
+def aggregator():
+    aggregator = RollupAggregator()
+    aggregator._started = True      # no background thread
+    return aggregator
+
+
+def test_failed_flush_keeps_increments(aggregator, monkeypatch):
+    def unreachable(pending):
+        aggregator.record(was_cached=True, refused=False)   # recorded while the flush was failing
+        raise ServerSelectionTimeoutError("down")
+    monkeypatch.setattr(models.ActivityRollup, "increment_many", unreachable)
+    aggregator.record(was_cached=False, refused=True)
+    aggregator.flush()
+
+    written = {}
+    monkeypatch.setattr(models.ActivityRollup, "increment_many", written.update)
+    aggregator.flush()
+    assert written[TOTAL_ID][2] == {"requests": 2, "cached": 1, "refused": 1}
+
+
+def test_partial_bulk_write_keeps_only_failed_upserts(aggregator, monkeypatch):
+    aggregator.record(was_cached=False, refused=False)
+    second = list(aggregator._pending)[1]
+
+    def partial(pending):
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate"}]})
+    monkeypatch.setattr(models.ActivityRollup, "increment_many", partial)
+    aggregator.flush()
+    assert list(aggregator._pending) == [second]
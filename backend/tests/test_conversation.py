@@ -0,0 +1,110 @@
+import pytest
+
+import config
+import pipeline
+from conversation import ConversationWindows, SharedConversationWindows, Turn, is_follow_up, rewrite
+from shared_state import SQLiteStore
+
+HISTORY = [Turn("What is BERT?", "What is BERT?", "BERT")]
+
+FOLLOW_UPS = [
+    ("How is it trained?", "How is BERT trained?"),
+    ("Does it reduce hallucination?", "Does BERT reduce hallucination?"),
+    ("How is it different from GPT?", "How is BERT different from GPT?"),
+    ("Why are they better than RNNs?", "Why are BERT better than RNNs?"),
+    ("What are its components?", "What are BERT's components?"),
+    ("Its limitations?", "BERT's limitations?"),
+    ("Can you explain it?", "Can you explain BERT?"),
+    ("Who introduced them?", "Who introduced BERT?"),
+    ("what about its limitations?", "what about BERT's limitations?"),
+    ("what about regularization?", "what about regularization of BERT?"),
+    ("tell me more", "tell me more about BERT?"),
+    ("tell me more about this", "tell me more about BERT?"),
+    ("and GPT?", "What is GPT?"),
+]
+
+STANDALONE = [
+    "What is a neural network that uses attention?",
+    "Is it true that RNNs are slow?",
+    "Is it possible to fine-tune on small data?",
+    "And What is GPT?",
+    "and what is GPT?",
+    "What about that paper?",
+    "What does this architecture improve over LSTMs?",
+    "Which models are used for translation and how do they compare on long documents in practice?",
+    "How do transformers use self-attention?",
+]
+
+
+@pytest.mark.parametrize("question,expected", FOLLOW_UPS)
+def test_follow_ups_are_rewritten(question, expected):
+    assert is_follow_up(question)
+    assert rewrite(question, HISTORY)[0] == expected
+
+
+@pytest.mark.parametrize("question", STANDALONE)
+def test_standalone_questions_are_left_alone(question):
+    assert not is_follow_up(question)
+    assert rewrite(question, HISTORY)[0] == question
+
+
+def test_name_swap_moves_the_subject():
+    query, subject = rewrite("and GPT?", HISTORY)
+    assert subject == "GPT"
+    assert rewrite("How is it trained?", [Turn("and GPT?", query, subject)])[0] == "How is GPT trained?"
+
+
+def test_no_history_keeps_question():
+    assert rewrite("How is it trained?", []) == ("How is it trained?", "")
+
+
+def test_question_without_subject_keeps_conversation_subject():
+    assert rewrite("Why?", HISTORY) == ("Why?", "BERT")
+
+
+def test_windows_expire_and_evict():
+    now = [0.0]
+    windows = ConversationWindows(max_chats=2, max_turns=2, ttl=10, clock=lambda: now[0])
+    for n in range(3):
+        windows.add_turn("a", f"q{n}", f"q{n}", "BERT")
+    assert [turn.question for turn in windows.history("a")] == ["q2", "q1"]
+    windows.add_turn("b", "q", "q", "GPT")
+    windows.add_turn("c", "q", "q", "GPT")
+    assert windows.history("a") == [] and windows.evictions == 1
+    now[0] = 10
+    assert windows.history("b") == []
+
+
+def test_shared_windows_are_seen_by_every_worker(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    first = SharedConversationWindows(SQLiteStore(path), max_turns=2)
+    second = SharedConversationWindows(SQLiteStore(path), max_turns=2)
+    first.add_turn("chat", "What is BERT?", "What is BERT?", "BERT", vector=[0.0])
+    second.add_turn("chat", "How is it trained?", "How is BERT trained?", "BERT")
+    history = first.history("chat")
+    assert [turn.query for turn in history] == ["How is BERT trained?", "What is BERT?"]
+    assert all(turn.vector is None for turn in history)
+    assert len(first) == 1
+    second.forget("chat")
+    assert first.history("chat") == []
+
+
+def recorded_calls(ask):
+    """Names of the model methods and functions a _record pipeline calls"""
+    calls, steps = [], pipeline._record(ask)
+    try:
+        step = next(steps)
+        while True:
+            calls.append(step.call if isinstance(step.call, str) else step.call.__name__)
+            step = steps.send(None)
+    except StopIteration:
+        return calls
+
+
+@pytest.mark.parametrize("confidence,enabled,added", [("High", True, True), ("Low", True, False),
+                                                      ("High", False, False)])
+def test_only_answered_turns_join_the_window(monkeypatch, confidence, enabled, added):
+    monkeypatch.setattr(config, "CONVERSATION_ENABLED", enabled)
+    ask = pipeline.Ask({"question": "What is BERT?", "chat_id": "chat"})
+    ask.confidence = confidence
+    assert ("add_turn" in recorded_calls(ask)) == added
@@ -0,0 +1,30 @@
+from hot_cache import HotCache, SharedHotCache
+from shared_state import SQLiteStore
+
+
+def test_in_process_cache_clears_when_the_generation_changes():
+    cache = HotCache()
+    assert not cache.sync_generation("a:0")
+    cache.put("what is bert", {"answer": "A language model."})
+    assert not cache.sync_generation("a:0")
+    assert cache.get("what is bert")
+    assert cache.sync_generation("a:1")
+    assert cache.get("what is bert") is None
+
+
+def test_shared_entries_from_another_generation_are_cleared_at_startup(tmp_path):
+    store = SQLiteStore(str(tmp_path / "state.sqlite"))
+    SharedHotCache(store).put("what is bert", {"answer": "A language model."})
+
+    # Entries stored before any generation was recorded are not trusted
+    restarted = SharedHotCache(store)
+    assert restarted.sync_generation("a:0")
+    assert restarted.get("what is bert") is None
+
+    restarted.put("what is bert", {"answer": "A language model."})
+    assert not SharedHotCache(store).sync_generation("a:0")
+    assert restarted.get("what is bert")
+
+    # The cache collection was dropped while no worker ran
+    assert SharedHotCache(store).sync_generation("missing:0")
+    assert restarted.get("what is bert") is None
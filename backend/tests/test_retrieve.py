@@ -0,0 +1,75 @@
+import types
+
+import numpy as np
+import pytest
+
+import config
+from rag.retrieve import _rank, depth, fuse
+
+
+@pytest.fixture(autouse=True)
+def adaptive_bounds(monkeypatch):
+    monkeypatch.setattr(config, "RETRIEVAL_MIN_K", 1)
+    monkeypatch.setattr(config, "RETRIEVAL_MAX_K", 4)
+    monkeypatch.setattr(config, "RETRIEVAL_DISTANCE_MARGIN", 0.2)
+    monkeypatch.setattr(config, "RETRIEVAL_HOPELESS_DISTANCE", 1.5)
+
+
+def rows(*values):
+    return np.asarray(values, dtype="int64")
+
+
+def distances(*values):
+    return np.asarray(values, dtype="float32")
+
+
+def test_fuse_ranks_by_reciprocal_rank():
+    fused, dist = fuse(rows(1, 2, 3), distances(0.5, 0.6, 0.7), rows(3, 1, 4), top_k=3)
+    assert fused.tolist() == [1, 3, 2]
+    assert dist.tolist() == pytest.approx([0.5, 0.7, 0.6])
+
+
+def test_fuse_gives_lexical_only_chunks_the_worst_dense_distance():
+    fused, dist = fuse(rows(1, 2), distances(0.5, 0.9), rows(7, 8), top_k=4)
+    assert sorted(fused.tolist()) == [1, 2, 7, 8]
+    assert dict(zip(fused.tolist(), dist.tolist()))[7] == pytest.approx(0.9)
+
+
+def test_depth_is_top_k_unless_adaptive():
+    assert depth(distances(0.1, 0.9, 1.0), top_k=5, adaptive=False) == 5
+
+
+@pytest.mark.parametrize("dist,expected", [
+    ((0.1, 0.9, 1.0), 1),                   # a dominant chunk goes alone
+    ((0.5, 0.6, 0.65, 1.0), 3),             # a close field widens the context
+    ((0.5, 0.5, 0.5, 0.5, 0.5, 0.5), 4),    # never beyond RETRIEVAL_MAX_K
+    ((), 5),
+])
+def test_adaptive_depth_follows_the_distances(dist, expected):
+    assert depth(distances(*dist), top_k=5, adaptive=True) == expected
+
+
+class NoBM25:
+    def search(self, *args, **kwargs):
+        raise AssertionError("BM25 should not be searched")
+
+
+def state(bm25=None):
+    return types.SimpleNamespace(chunks=[f"chunk {i}" for i in range(10)], bm25=bm25, deleted=rows())
+
+
+def test_rank_refuses_hopeless_questions_before_bm25():
+    chunks, dist, ids = _rank(state(NoBM25()), "q", rows(3, 4), distances(1.6, 1.7), top_k=5, adaptive=True)
+    assert (chunks, ids) == ([], [])
+    assert dist.tolist() == pytest.approx([1.6])
+
+
+def test_rank_drops_missing_rows_and_cuts_to_depth():
+    chunks, dist, ids = _rank(state(), "q", rows(3, -1, 4, 5), distances(0.5, 9, 0.6, 1.2), top_k=5, adaptive=True)
+    assert ids == [3, 4]
+    assert chunks == ["chunk 3", "chunk 4"]
+
+
+def test_rank_without_adaptive_keeps_top_k():
+    _, _, ids = _rank(state(), "q", rows(3, 4, 5), distances(1.6, 1.7, 1.8), top_k=2, adaptive=False)
+    assert ids == [3, 4]
@@ -0,0 +1,53 @@
+import asyncio
+import types
+
+import steps
+from steps import AsyncRunner, db, embed, generate, io, run
+
+
+def pipeline():
+    doc = yield db("Cache.find", "q")
+    try:
+        yield db("Cache.fail")
+    except ValueError as e:
+        doc = dict(doc, error=str(e))
+    vector = yield embed(len, "four")
+    answer = yield generate(str.upper, "answer")
+    turns = yield io(sorted, [2, 1])
+    return doc, vector, answer, turns
+
+
+def cache_model(wrap):
+    def find(question):
+        return {"question": question}
+
+    def fail():
+        raise ValueError("down")
+    return types.SimpleNamespace(Cache=types.SimpleNamespace(find=wrap(find), fail=wrap(fail)))
+
+
+class Pool:
+    async def run(self, fn, *args):
+        return fn(*args)
+
+    def check_admission(self):
+        pass
+
+
+def as_async(fn):
+    async def call(*args, **kwargs):
+        return fn(*args, **kwargs)
+    return call
+
+
+EXPECTED = ({"question": "q", "error": "down"}, 4, "ANSWER", [1, 2])
+
+
+def test_run_performs_steps_inline(monkeypatch):
+    monkeypatch.setattr(steps, "models", cache_model(lambda fn: fn))
+    assert run(pipeline()) == EXPECTED
+
+
+def test_async_runner_gives_the_same_result():
+    runner = AsyncRunner(cache_model(as_async), Pool(), Pool())
+    assert asyncio.run(runner(pipeline())) == EXPECTED
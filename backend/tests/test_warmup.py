@@ -0,0 +1,43 @@
+import types
+
+import numpy as np
+
+import config
+import steps
+import warmup
+
+CACHED = {"What is BERT?": {"question": "What is BERT?", "answer": "A language model."}}
+
+
+def cache_model():
+    def find_many(questions):
+        return {q: dict(CACHED[q]) for q in questions if q in CACHED}
+    return types.SimpleNamespace(Cache=types.SimpleNamespace(find_many=find_many))
+
+
+def test_cached_flags_runs_the_cache_pipeline(monkeypatch):
+    monkeypatch.setattr(steps, "models", cache_model())
+    monkeypatch.setattr(config, "SEMANTIC_CACHE_ENABLED", False)
+    assert warmup.cached_flags(["What is BERT?", "What is GPT?"]) == [True, False]
+
+
+def test_warm_batch_answers_confident_misses(monkeypatch):
+    monkeypatch.setattr(steps, "models", cache_model())
+    monkeypatch.setattr(config, "SEMANTIC_CACHE_ENABLED", False)
+
+    def retrieve_batch(questions, top_k):
+        near, far = np.array([0.5, 0.6]), np.array([9.0, 9.5])
+        return [(["chunk"], far if "weather" in q else near, [7]) for q in questions]
+
+    saved = []
+    monkeypatch.setattr(warmup.retrieval, "retrieve_batch", retrieve_batch)
+    monkeypatch.setattr(warmup, "generate_batch", lambda qs, sources, scores: [f"Answer to {q}" for q in qs])
+    monkeypatch.setattr(warmup, "save_to_cache", lambda q, *args: saved.append(q) or True)
+
+    outcomes = warmup.warm_batch(["What is BERT?", "What is GPT?", "What is the weather?"])
+    assert outcomes == {
+        "What is BERT?": "already_cached",
+        "What is GPT?": "cached",
+        "What is the weather?": "refused",
+    }
+    assert saved == ["What is GPT?"]
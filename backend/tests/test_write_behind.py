@@ -0,0 +1,68 @@
+from pymongo.errors import AutoReconnect, BulkWriteError, DuplicateKeyError
+
+from write_behind import WriteBehindQueue
+
+
+class Collection:
+    """Stores inserted _ids; fails the first `outages` calls with a connection error"""
+
+    name = "messages"
+
+    def __init__(self, outages=0, rejected=()):
+        self.outages = outages
+        self.rejected = set(rejected)
+        self.ids = []
+
+    def _call(self):
+        if self.outages:
+            self.outages -= 1
+            raise AutoReconnect("connection reset")
+
+    def _insert(self, doc):
+        if doc["_id"] in self.ids:
+            raise DuplicateKeyError("dup", details={"keyPattern": {"_id": 1}})
+        if doc["_id"] in self.rejected:
+            raise DuplicateKeyError("dup", details={"keyPattern": {"question": 1}})
+        self.ids.append(doc["_id"])
+
+    def insert_many(self, docs, ordered=True):
+        self._call()
+        for i, doc in enumerate(docs):
+            try:
+                self._insert(doc)
+            except DuplicateKeyError:
+                raise BulkWriteError({"writeErrors": [{"index": i}]})
+
+    def insert_one(self, doc):
+        self._call()
+        self._insert(doc)
+
+
+def inserts(*ids):
+    return [("insert", {"_id": i}) for i in ids]
+
+
+def test_connection_errors_are_retried():
+    writer = WriteBehindQueue(retries=2, retry_backoff=0)
+    collection = Collection(outages=2)
+    writer._apply(collection, inserts(1, 2, 3))
+    assert collection.ids == [1, 2, 3]
+    assert (writer.written, writer.failed) == (3, 0)
+
+
+def test_a_rejected_write_only_drops_itself():
+    writer = WriteBehindQueue(retry_backoff=0)
+    collection = Collection(rejected=[2])
+    writer._apply(collection, inserts(1, 2, 3))
+    assert collection.ids == [1, 3]
+    assert (writer.written, writer.failed) == (2, 1)
+
+
+def test_writes_are_dropped_only_while_mongodb_is_unreachable():
+    writer = WriteBehindQueue(retries=1, retry_backoff=0)
+    collection = Collection(outages=3)
+    writer._apply(collection, inserts(1, 2))
+    assert (writer.written, writer.failed) == (0, 2)
+    writer._apply(collection, inserts(3))
+    assert collection.ids == [3]
+    assert (writer.written, writer.failed) == (1, 2)
@@ -0,0 +1,280 @@
+"""
+Cache warm-up for NLP Assistant API
+Answers the questions users ask most before the server takes traffic, so a new
+deployment or a flushed cache does not make the first asker of every popular
+question wait for a full FLAN-T5 decode.
+
+Candidates are the most frequent questions in activity_log over the last
+WARMUP_LOG_DAYS (grouped by normalized question) and, optionally, questions
+derived from definitional sentences in the chunk store ("X is a ..." ->
+"What is X?"). Questions already answered from cache (exactly or as a
+paraphrase) are skipped; the rest go through retrieve_batch, the confidence
+threshold and generate_batch in batches, and confident answers are stored
+with save_to_cache.
+
+- CPU budget: no new batch is started once the process has used
+  WARMUP_CPU_SECONDS of CPU time (or would, at the average cost of a batch);
+  WARMUP_THREADS caps the torch threads
+- resumable: finished questions are recorded in WARMUP_STATE_PATH after each
+  batch, and a rerun on the same index version skips them (--restart ignores it)
+- coverage: reports the share of logged requests the cache answers before and
+  after the run. activity_log keeps a sample of requests (ACTIVITY_SAMPLE_RATE),
+  so this is an estimate of the share of traffic.
+
+Usage: python warmup.py [--max-questions 500] [--days 30] [--corpus 100] [--cpu-seconds 600] [--restart] [--dry-run]
+"""
+import os
+
+# Each batch must be in MongoDB before it is recorded as done in the state file
+os.environ["WRITE_BEHIND_ENABLED"] = "false"
+
+import argparse
+import json
+import re
+import time
+from datetime import datetime, timedelta
+
+import config
+from models import activity_log_collection
+from cache_manager import find_cached, save_to_cache
+from steps import run as run_steps
+from hot_cache import normalize_question
+from semantic_cache import load_semantic_cache
+from rag import retrieve as retrieval
+from rag.generate import REFUSAL, generate_batch
+
+# Definitional sentences that make a good FAQ question: subject -> question template
+DEFINITION_PATTERNS = [
+    (re.compile(r"^(?:The )?([A-Z][\w\-]*(?: [\w\-]+){0,4}) is (?:a|an|the) "), "What is {}?"),
+    (re.compile(r"^(?:The )?([A-Z][\w\-]*(?: [\w\-]+){0,4}) are (?:a|an|the) "), "What are {}?"),
+    (re.compile(r"^(?:The )?([A-Z][\w\-]*(?: [\w\-]+){0,4}) (?:focuses|focus|refers|refer) (?:on|to) "), "What is {}?"),
+    (re.compile(r"^(?:The )?([A-Z][\w\-]*(?: [\w\-]+){0,4}) is used (?:to|for|in) "), "What is {} used for?"),
+    (re.compile(r"^(?:The )?([A-Z][\w\-]*(?: [\w\-]+){0,4}) are used (?:to|for|in|across) "), "What are {} used for?"),
+]
+NOT_SUBJECTS = {"This", "These", "That", "Those", "It", "They", "Such", "Each", "Some", "Many", "Most"}
+
+
+def logged_questions(days):
+    """
+    [(question, count)] of questions in activity_log since `days` ago, most
+    frequent first. Variants with the same normalized form are counted
+    together under their most frequent spelling.
+    """
+    since = datetime.utcnow() - timedelta(days=days)
+    groups = {}     # normalized -> (total, {spelling: count})
+    for doc in activity_log_collection.aggregate([
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$group": {"_id": "$question", "count": {"$sum": 1}}},
+    ], allowDiskUse=True):
+        if not isinstance(doc["_id"], str):
+            continue
+        total, spellings = groups.get(normalize_question(doc["_id"]), (0, {}))
+        spellings[doc["_id"]] = doc["count"]
+        groups[normalize_question(doc["_id"])] = (total + doc["count"], spellings)
+    ranked = [(max(spellings, key=spellings.get), total) for total, spellings in groups.values()]
+    return sorted(ranked, key=lambda item: -item[1])
+
+
+def subject_text(subject):
+    """Lowercase a sentence-initial capital ("Edge detection") but not names ("Deep Learning", "BERT")"""
+    first, *rest = subject.split()
+    if rest and all(word.islower() for word in rest) and not first.isupper():
+        return " ".join([first.lower()] + rest)
+    return subject
+
+
+def corpus_questions(limit):
+    """Up to `limit` FAQ-style questions from definitional sentences of live chunks"""
+    state = retrieval.current_state()
+    deleted = set(int(row) for row in state.deleted)
+    questions, seen = [], set()
+    for row in range(len(state.chunks)):
+        if row in deleted:
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", state.chunks[row]):
+            for pattern, template in DEFINITION_PATTERNS:
+                match = pattern.match(sentence)
+                if not match or match.group(1).split()[0] in NOT_SUBJECTS:
+                    continue
+                question = template.format(subject_text(match.group(1)))
+                if normalize_question(question) not in seen:
+                    seen.add(normalize_question(question))
+                    questions.append(question)
+                    if len(questions) >= limit:
+                        return questions
+                break
+    return questions
+
+
+def cached_flags(questions):
+    """Whether each question is answered from cache (exactly or as a paraphrase)"""
+    flags = []
+    for start in range(0, len(questions), 1000):
+        found = run_steps(find_cached(questions[start:start + 1000]))
+        flags.extend(cached is not None for cached in found)
+    return flags
+
+
+def coverage(logged):
+    """Share of logged requests (and distinct questions) the cache answers"""
+    flags = cached_flags([question for question, _ in logged])
+    requests = sum(count for _, count in logged)
+    covered = sum(count for (_, count), cached in zip(logged, flags) if cached)
+    return {
+        "requests": requests,
+        "distinct": len(logged),
+        "covered_requests": covered,
+        "covered_distinct": sum(flags),
+        "request_coverage": covered / requests if requests else 0.0,
+    }
+
+
+def load_state(path, index_version, restart):
+    """Questions finished by an earlier run on the same index version"""
+    if not restart and os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+        if state.get("index_version") == index_version:
+            return state
+        print(f"ℹ️ Index changed since the last warm-up (version {state.get('index_version')}); starting over")
+    return {"index_version": index_version, "started_at": datetime.utcnow().isoformat(), "done": {}}
+
+
+def save_state(state, path):
+    """Write the state atomically"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def warm_batch(questions):
+    """Answer a batch of uncached questions; returns {question: outcome}"""
+    outcomes = {}
+    cached = cached_flags(questions)
+    pending = [q for q, hit in zip(questions, cached) if not hit]
+    outcomes.update({q: "already_cached" for q, hit in zip(questions, cached) if hit})
+
+    to_generate = []
+    for question, (sources, scores, source_ids) in zip(pending, retrieval.retrieve_batch(pending, top_k=config.TOP_K)):
+        min_score = min(scores) if len(scores) > 0 else float("inf")
+        if min_score >= config.CONFIDENCE_THRESHOLD:
+            outcomes[question] = "refused"
+        else:
+            to_generate.append((question, sources, scores, source_ids))
+
+    answers = generate_batch(
+        [question for question, _, _, _ in to_generate],
+        [sources for _, sources, _, _ in to_generate],
+        [scores for _, _, scores, _ in to_generate],
+    ) if to_generate else []
+    for (question, _, scores, source_ids), answer in zip(to_generate, answers):
+        if REFUSAL in answer:
+            outcomes[question] = "refused"
+        elif save_to_cache(question, answer, "High", source_ids, scores):
+            outcomes[question] = "cached"
+        else:
+            outcomes[question] = "not_cached"
+    return outcomes
+
+
+def limit_threads(threads):
+    if not threads:
+        return
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def run(max_questions, days, corpus, cpu_seconds, batch_size, state_path, restart=False, dry_run=False):
+    limit_threads(config.WARMUP_THREADS)
+    retrieval.load()
+    if config.SEMANTIC_CACHE_ENABLED:
+        print(f"🧠 Semantic cache ready ({load_semantic_cache()} cached questions)")
+
+    logged = logged_questions(days)
+    candidates = [question for question, _ in logged[:max_questions]]
+    if corpus:
+        known = {normalize_question(q) for q in candidates}
+        candidates += [q for q in corpus_questions(corpus) if normalize_question(q) not in known]
+
+    before = coverage(logged)
+    state = load_state(state_path, retrieval.current_state().version, restart)
+    todo = [q for q in candidates if normalize_question(q) not in state["done"]]
+    print(f"🔥 {len(candidates)} candidate questions ({len(candidates) - len(todo)} done by an earlier run), "
+          f"{before['requests']} logged requests over {days} days")
+    if dry_run:
+        return {"before": before, "candidates": len(candidates), "todo": len(todo)}
+
+    cpu_start, wall_start = time.process_time(), time.time()
+    batches = 0
+    remaining = 0
+    for start in range(0, len(todo), batch_size):
+        used = time.process_time() - cpu_start
+        per_batch = used / batches if batches else 0.0
+        if cpu_seconds and used + per_batch > cpu_seconds:
+            remaining = len(todo) - start
+            print(f"⏱️ CPU budget of {cpu_seconds:.0f}s reached; {remaining} questions left for the next run")
+            break
+        batch = todo[start:start + batch_size]
+        outcomes = warm_batch(batch)
+        state["done"].update({normalize_question(q): outcome for q, outcome in outcomes.items()})
+        save_state(state, state_path)
+        batches += 1
+        print(f"  batch {batches}: {sum(o == 'cached' for o in outcomes.values())}/{len(batch)} cached "
+              f"({time.process_time() - cpu_start:.0f}s CPU)")
+
+    outcomes = [state["done"][normalize_question(q)] for q in candidates if normalize_question(q) in state["done"]]
+    return {
+        "before": before,
+        "after": coverage(logged),
+        "candidates": len(candidates),
+        "outcomes": {name: outcomes.count(name) for name in ("cached", "already_cached", "refused", "not_cached")},
+        "remaining": remaining,
+        "cpu_seconds": time.process_time() - cpu_start,
+        "wall_seconds": time.time() - wall_start,
+    }
+
+
+def print_report(report):
+    before = report["before"]
+    print(f"\n📊 Warm-up report ({before['requests']} logged requests, {before['distinct']} distinct questions)")
+    rows = [("before", before)] + ([("after", report["after"])] if "after" in report else [])
+    for name, cov in rows:
+        print(f"  {name:<7} {cov['request_coverage']:>7.1%} of requests answered from cache "
+              f"({cov['covered_requests']} requests, {cov['covered_distinct']} distinct questions)")
+    if "outcomes" in report:
+        print("  " + ", ".join(f"{name}: {count}" for name, count in report["outcomes"].items())
+              + f", remaining: {report['remaining']}")
+        print(f"  {report['cpu_seconds']:.1f}s CPU, {report['wall_seconds']:.1f}s wall")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the answer cache with the most asked questions")
+    parser.add_argument("--max-questions", type=int, default=config.WARMUP_MAX_QUESTIONS,
+                        help="Most frequent logged questions to warm")
+    parser.add_argument("--days", type=float, default=config.WARMUP_LOG_DAYS, help="activity_log window")
+    parser.add_argument("--corpus", type=int, default=config.WARMUP_CORPUS_QUESTIONS,
+                        help="Also warm up to this many questions derived from the chunk store")
+    parser.add_argument("--cpu-seconds", type=float, default=config.WARMUP_CPU_SECONDS,
+                        help="CPU time budget (0 for none)")
+    parser.add_argument("--batch-size", type=int, default=config.WARMUP_BATCH_SIZE)
+    parser.add_argument("--state", default=config.WARMUP_STATE_PATH, help="Progress file for resuming")
+    parser.add_argument("--restart", action="store_true", help="Ignore the progress of earlier runs")
+    parser.add_argument("--dry-run", action="store_true", help="Report candidates and coverage only")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args.max_questions, args.days, args.corpus, args.cpu_seconds, max(1, args.batch_size),
+                 args.state, restart=args.restart, dry_run=args.dry_run)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
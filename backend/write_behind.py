@@ -0,0 +1,253 @@
+"""
+Write-behind persistence for NLP Assistant API
+Queues MongoDB writes that do not need to finish before a response is sent
+(messages, cache entries, access counts, activity logs) and applies them from
+a background thread in batches with insert_many / bulk_write.
+
+A batch that fails on a connection error is retried with exponential backoff.
+If it still fails, or one of its writes is rejected, the remaining writes are
+applied one at a time, so only the writes MongoDB cannot take are lost (and
+counted in `failed`).
+"""
+import atexit
+import queue
+import threading
+import time
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError
+
+import metrics
+
+
+_STOP = object()
+
+
+def already_inserted(error):
+    """Whether a DuplicateKeyError is on _id, i.e. an earlier attempt had inserted the document"""
+    return isinstance(error, DuplicateKeyError) and (error.details or {}).get("keyPattern") == {"_id": 1}
+
+
+class _Barrier:
+    """Queue marker that is signalled once every write queued before it is flushed"""
+
+    def __init__(self):
+        self.reached = threading.Event()
+
+
+class WriteBehindQueue:
+    def __init__(self, batch_size=100, flush_interval=0.2, max_queue=10000, retries=3, retry_backoff=0.1):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.retries = max(0, retries)
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        # Queued writes not yet applied, including a batch the worker holds while collecting
+        self._unflushed = 0
+        self._unflushed_lock = threading.Lock()
+
+        # Counters for observability
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+
+    @property
+    def depth(self):
+        """Number of writes waiting to be flushed"""
+        return self._queue.qsize()
+
+    @property
+    def unflushed(self):
+        """Writes queued and not yet applied (queued or held in the batch being collected)"""
+        return self._unflushed
+
+    def _count(self, amount):
+        with self._unflushed_lock:
+            self._unflushed += amount
+
+    def insert(self, collection, document):
+        """Queue an insert; document must already carry its _id if the caller needs it"""
+        self._submit(collection, ("insert", document))
+
+    def update(self, collection, filter, update, upsert=False):
+        """Queue an update_one"""
+        self._submit(collection, ("update", UpdateOne(filter, update, upsert=upsert)))
+
+    def _submit(self, collection, op):
+        if self._closed:
+            self._apply(collection, [op])
+            return
+        self._ensure_worker()
+        self._count(1)
+        try:
+            self._queue.put_nowait((collection, op))
+        except queue.Full:
+            # Back-pressure: write through rather than dropping data
+            self._count(-1)
+            self._apply(collection, [op])
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._loop, name="write-behind", daemon=True)
+                self._worker.start()
+
+    def wait_until_flushed(self, timeout=5):
+        """
+        Block until every write queued so far has been applied (read-your-writes).
+        The queue being empty is not enough: the worker takes the first write of
+        a batch off the queue and holds it for up to flush_interval, so the
+        barrier goes behind it unless nothing at all is unflushed.
+        """
+        if self._worker is None or self._closed or self._unflushed == 0:
+            return True
+        barrier = _Barrier()
+        try:
+            self._queue.put(barrier, timeout=timeout)
+        except queue.Full:
+            return False
+        return barrier.reached.wait(timeout)
+
+    def _collect(self):
+        """
+        Wait for the first write, then gather more until the batch is full or the
+        interval ends. Returns (batch, barriers, stopping).
+        """
+        batch, barriers = [], []
+        first = self._queue.get()
+        if first is _STOP:
+            return batch, barriers, True
+        if isinstance(first, _Barrier):
+            return batch, [first], False
+        batch.append(first)
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, barriers, True
+            if isinstance(item, _Barrier):
+                # Flush right away so the waiting caller is not held for the full interval
+                barriers.append(item)
+                break
+            batch.append(item)
+        return batch, barriers, False
+
+    def _loop(self):
+        while True:
+            batch, barriers, stopping = self._collect()
+            self._flush(batch)
+            for barrier in barriers:
+                barrier.reached.set()
+            if stopping:
+                # Drain whatever was queued behind the stop marker
+                rest = []
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, _Barrier):
+                        barriers.append(item)
+                    elif item is not _STOP:
+                        rest.append(item)
+                self._flush(rest)
+                for barrier in barriers:
+                    barrier.reached.set()
+                return
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        # Group by collection, keeping the original order within each collection
+        grouped = {}
+        for collection, op in batch:
+            grouped.setdefault(collection.name, (collection, []))[1].append(op)
+        try:
+            for collection, ops in grouped.values():
+                self._apply(collection, ops)
+        finally:
+            self._count(-len(batch))
+        self.flushes += 1
+
+    def _apply(self, collection, ops):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                with metrics.mongo_write(collection.name, mode="write_behind"):
+                    self._write(collection, ops)
+                self.written += len(ops)
+                return
+            except BulkWriteError as e:
+                # An ordered batch stops at the first rejected write; the ones before it are in
+                errors = e.details.get("writeErrors") or [{"index": 0}]
+                self.written += errors[0]["index"]
+                ops = ops[errors[0]["index"]:]
+                break
+            except ConnectionFailure as e:
+                print(f"Error flushing {len(ops)} writes to {collection.name} (attempt {attempt + 1}): {e}")
+            except Exception as e:
+                print(f"Error flushing {len(ops)} writes to {collection.name}: {e}")
+                break
+        self._write_through(collection, ops)
+
+    def _write_through(self, collection, ops):
+        """Apply writes one by one after a failed batch, stopping if MongoDB is unreachable"""
+        for i, (kind, op) in enumerate(ops):
+            try:
+                with metrics.mongo_write(collection.name, mode="write_through"):
+                    if kind == "insert":
+                        collection.insert_one(op)
+                    else:
+                        collection.bulk_write([op])
+                self.written += 1
+            except ConnectionFailure as e:
+                self.failed += len(ops) - i
+                print(f"Dropped {len(ops) - i} writes to {collection.name}: {e}")
+                return
+            except Exception as e:
+                if already_inserted(e):
+                    self.written += 1
+                else:
+                    self.failed += 1
+                    print(f"Dropped a write to {collection.name}: {e}")
+
+    @staticmethod
+    def _write(collection, ops):
+        if all(kind == "insert" for kind, _ in ops):
+            collection.insert_many([doc for _, doc in ops], ordered=True)
+        else:
+            collection.bulk_write(
+                [InsertOne(op) if kind == "insert" else op for kind, op in ops],
+                ordered=True
+            )
+
+    def shutdown(self, timeout=10):
+        """Stop accepting queued writes and drain the queue"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._worker is None:
+            return
+        self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+
+def create_write_behind(enabled, **kwargs):
+    """Create a write-behind queue that drains at interpreter exit, or None if disabled"""
+    if not enabled:
+        return None
+    writer = WriteBehindQueue(**kwargs)
+    atexit.register(writer.shutdown)
+    return writer
@@ -8,6 +8,8 @@ function App() {
   const [chats, setChats] = useState([]);
   const [activeChat, setActiveChat] = useState(null);
   const [messages, setMessages] = useState([]);
+  const [chatsCursor, setChatsCursor] = useState(null);
+  const [messagesCursor, setMessagesCursor] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
   const [loadingState, setLoadingState] = useState('thinking'); // 'thinking' or 'generating'
 
@@ -25,8 +27,9 @@ function App() {
 
   const loadChats = async () => {
     try {
-      const fetchedChats = await api.getChats();
+      const { chats: fetchedChats, nextCursor } = await api.getChats();
       setChats(fetchedChats);
+      setChatsCursor(nextCursor);
 
       // If no active chat and chats exist, select the first one
       if (!activeChat && fetchedChats.length > 0) {
@@ -37,13 +40,35 @@ function App() {
     }
   };
 
+  const loadMoreChats = async () => {
+    try {
+      const { chats: olderChats, nextCursor } = await api.getChats(chatsCursor);
+      setChats((prev) => [...prev, ...olderChats]);
+      setChatsCursor(nextCursor);
+    } catch (error) {
+      console.error('Failed to load more chats:', error);
+    }
+  };
+
   const loadMessages = async (chatId) => {
     try {
-      const fetchedMessages = await api.getChatMessages(chatId);
+      const { messages: fetchedMessages, nextCursor } = await api.getChatMessages(chatId);
       setMessages(fetchedMessages);
+      setMessagesCursor(nextCursor);
     } catch (error) {
       console.error('Failed to load messages:', error);
       setMessages([]);
+      setMessagesCursor(null);
+    }
+  };
+
+  const loadEarlierMessages = async () => {
+    try {
+      const { messages: earlier, nextCursor } = await api.getChatMessages(activeChat, messagesCursor);
+      setMessages((prev) => [...earlier, ...prev]);
+      setMessagesCursor(nextCursor);
+    } catch (error) {
+      console.error('Failed to load earlier messages:', error);
     }
   };
 
@@ -53,6 +78,7 @@ function App() {
       setChats([newChat, ...chats]);
       setActiveChat(newChat._id);
       setMessages([]);
+      setMessagesCursor(null);
     } catch (error) {
       console.error('Failed to create new chat:', error);
     }
@@ -75,6 +101,7 @@ function App() {
         } else {
           setActiveChat(null);
           setMessages([]);
+          setMessagesCursor(null);
         }
       }
     } catch (error) {
@@ -153,7 +180,7 @@ function App() {
         metadata: {
           cached: response.cached,
           confidence: response.confidence,
-          sources: response.sources,
+          source_ids: response.source_ids,
         },
       };
 
@@ -192,12 +219,16 @@ function App() {
         onNewChat={handleNewChat}
         onDeleteChat={handleDeleteChat}
         onRenameChat={handleRenameChat}
+        hasMoreChats={Boolean(chatsCursor)}
+        onLoadMoreChats={loadMoreChats}
       />
       <ChatArea
         messages={messages}
         onSendMessage={handleSendMessage}
         isLoading={isLoading}
         loadingState={loadingState}
+        hasEarlierMessages={Boolean(messagesCursor)}
+        onLoadEarlierMessages={loadEarlierMessages}
       />
     </div>
   );
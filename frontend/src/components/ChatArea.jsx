@@ -3,7 +3,7 @@ import Message from './Message';
 import MessageInput from './MessageInput';
 import './ChatArea.css';
 
-function ChatArea({ messages, onSendMessage, isLoading, loadingState }) {
+function ChatArea({ messages, onSendMessage, isLoading, loadingState, hasEarlierMessages, onLoadEarlierMessages }) {
     const messagesEndRef = useRef(null);
 
     const scrollToBottom = () => {
@@ -25,6 +25,12 @@ function ChatArea({ messages, onSendMessage, isLoading, loadingState }) {
                     </div>
                 )}
 
+                {hasEarlierMessages && (
+                    <button onClick={onLoadEarlierMessages} className="load-earlier-button">
+                        Load earlier messages
+                    </button>
+                )}
+
                 {messages.map((msg, index) => (
                     <Message key={index} message={msg} />
                 ))}
@@ -1,9 +1,23 @@
+import { useState } from 'react';
+import { api } from '../services/api';
 import './Message.css';
 
 function Message({ message }) {
     const isUser = message.role === 'user';
     const metadata = message.metadata || {};
-    const sources = metadata.sources || [];
+    const sourceIds = metadata.source_ids || [];
+    // Messages saved before chunk ids carry the source texts themselves
+    const [fetchedSources, setFetchedSources] = useState(null);
+    const sources = metadata.source_ids ? fetchedSources || [] : metadata.sources || [];
+    const sourceCount = metadata.source_ids ? sourceIds.length : sources.length;
+
+    // Source texts are only fetched when the list is opened
+    const handleToggle = (event) => {
+        if (!event.currentTarget.open || fetchedSources || sourceIds.length === 0) return;
+        api.getChunks(sourceIds)
+            .then(setFetchedSources)
+            .catch((error) => console.error('Failed to load sources:', error));
+    };
 
     return (
         <div className={`message ${isUser ? 'user-message' : 'assistant-message'}`}>
@@ -28,9 +42,9 @@ function Message({ message }) {
                     </div>
                 )}
 
-                {!isUser && sources.length > 0 && (
-                    <details className="message-sources">
-                        <summary>📚 Sources ({sources.length})</summary>
+                {!isUser && sourceCount > 0 && (
+                    <details className="message-sources" onToggle={handleToggle}>
+                        <summary>📚 Sources ({sourceCount})</summary>
                         <div className="sources-list">
                             {sources.map((source, index) => (
                                 <div key={index} className="source-item">
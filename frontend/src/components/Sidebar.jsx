@@ -1,7 +1,7 @@
 import { useState } from 'react';
 import './Sidebar.css';
 
-function Sidebar({ chats, activeChat, onSelectChat, onNewChat, onDeleteChat, onRenameChat }) {
+function Sidebar({ chats, activeChat, onSelectChat, onNewChat, onDeleteChat, onRenameChat, hasMoreChats, onLoadMoreChats }) {
     const [editingId, setEditingId] = useState(null);
     const [editTitle, setEditTitle] = useState('');
 
@@ -94,6 +94,12 @@ function Sidebar({ chats, activeChat, onSelectChat, onNewChat, onDeleteChat, onR
                         </div>
                     </div>
                 ))}
+
+                {hasMoreChats && (
+                    <button onClick={onLoadMoreChats} className="load-more-button">
+                        Load more chats
+                    </button>
+                )}
             </div>
         </div>
     );
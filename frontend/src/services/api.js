@@ -1,5 +1,10 @@
 const API_BASE_URL = 'http://localhost:5000/api';
 
+// Source texts by chunk id. The text of a chunk id never changes, so each one
+// is fetched at most once per page load (and complete /api/chunks responses are
+// cacheable forever).
+const chunkCache = new Map();
+
 export const api = {
   // Ask a question
   askQuestion: async (chatId, question) => {
@@ -18,15 +23,61 @@ export const api = {
     return response.json();
   },
 
-  // Get all chats
-  getChats: async () => {
-    const response = await fetch(`${API_BASE_URL}/chats`);
+  // Ask a question and receive the answer as a stream of Server-Sent Events.
+  // onEvent is called with (event, data) for "sources", "token", "done" and "error".
+  askQuestionStream: async (chatId, question, onEvent) => {
+    const response = await fetch(`${API_BASE_URL}/ask/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ chat_id: chatId, question }),
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error('Failed to get answer');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const raw = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let event = 'message';
+        let data = '';
+        for (const line of raw.split('\n')) {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+        onEvent(event, data ? JSON.parse(data) : null);
+      }
+    }
+  },
+
+  // Get a page of chats, most recent first. Pass the returned nextCursor
+  // (null on the last page) to fetch the next page.
+  getChats: async (cursor = null) => {
+    const params = new URLSearchParams();
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${API_BASE_URL}/chats?${params}`);
 
     if (!response.ok) {
       throw new Error('Failed to fetch chats');
     }
 
-    return response.json();
+    return {
+      chats: await response.json(),
+      nextCursor: response.headers.get('X-Next-Cursor'),
+    };
   },
 
   // Create a new chat
@@ -46,15 +97,43 @@ export const api = {
     return response.json();
   },
 
-  // Get chat messages
-  getChatMessages: async (chatId) => {
-    const response = await fetch(`${API_BASE_URL}/chats/${chatId}`);
+  // Get the latest messages of a chat (oldest first). Messages carry source
+  // chunk ids; include=sources only adds the texts of messages saved before them.
+  // Pass the returned nextCursor to fetch the messages before them.
+  getChatMessages: async (chatId, cursor = null) => {
+    const params = new URLSearchParams({ include: 'sources' });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${API_BASE_URL}/chats/${chatId}?${params}`);
 
     if (!response.ok) {
       throw new Error('Failed to fetch messages');
     }
 
-    return response.json();
+    return {
+      messages: await response.json(),
+      nextCursor: response.headers.get('X-Next-Cursor'),
+    };
+  },
+
+  // Get source texts for chunk ids, as a list in the order of ids. Only ids not
+  // fetched before are requested, sorted so the same set hits the same URL.
+  getChunks: async (ids) => {
+    const missing = [...new Set(ids)].filter((id) => !chunkCache.has(id)).sort((a, b) => a - b);
+    if (missing.length > 0) {
+      const response = await fetch(`${API_BASE_URL}/chunks?ids=${missing.join(',')}`);
+
+      // 404: none of the ids are in the chunk store (any more)
+      if (!response.ok && response.status !== 404) {
+        throw new Error('Failed to fetch sources');
+      }
+
+      const { chunks } = await response.json();
+      for (const [id, text] of Object.entries(chunks)) {
+        chunkCache.set(Number(id), text);
+      }
+    }
+
+    return ids.filter((id) => chunkCache.has(id)).map((id) => chunkCache.get(id));
   },
 
   // Delete a chat